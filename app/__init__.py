@@ -1,11 +1,14 @@
 from datetime import timedelta
-from flask import Flask
+from flask import Flask, jsonify
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 import os
 
-from app.routes import register_routes_user , register_routes_invoices
+from app.routes import register_routes_user , register_routes_invoices, register_routes_metrics
 from app.auth_routes import register_routes_auth
+from app.cli import register_cli_commands
+from app.controller.utils_perfil import PERFIL_HABILITADO, instalar_perfil
+from app.controller.utils_upload import UPLOAD_MAX_BYTES_REQUISICAO
 
 
 def create_app():
@@ -31,11 +34,27 @@ def create_app():
     app.config["JWT_REFRESH_COOKIE_NAME"] = "refresh_token"
     
     jwt = JWTManager(app)
+
+    # Uploads acima do limite são recusados com 413 antes de o corpo ser lido
+    app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES_REQUISICAO
+
+    @app.errorhandler(413)
+    def requisicao_grande_demais(e):
+        return jsonify({
+            "success": False,
+            "message": f"Requisição maior que o limite de {UPLOAD_MAX_BYTES_REQUISICAO} bytes"
+        }), 413
     
+    # Latência por rota e comandos do Mongo por coleção (antes da primeira conexão)
+    if PERFIL_HABILITADO:
+        instalar_perfil(app)
+
     # Registrar rotas
     register_routes_auth(app)
     register_routes_user(app)
     register_routes_invoices(app)
+    register_routes_metrics(app)
+    register_cli_commands(app)
     
     return app
 
@@ -0,0 +1,91 @@
+import os
+
+import click
+
+from app.controller.utils_datas import migrar_datas
+from app.controller.utils_deduplicacao import preencher_impressoes_digitais
+from app.controller.utils_indices import garantir_indices, indices_transferencias
+from app.controller.utils_resumo import recalcular_resumos
+from app.controller.utils_transferencias import COLLECTION_TRANSFERENCIAS, migrar_transferencias, obter_repositorio
+from _db import get_db_connection
+
+
+# Cria os índices que faltarem quando o processo sobe (além do comando "flask garantir-indices").
+INDICES_NA_INICIALIZACAO = os.getenv("INDICES_NA_INICIALIZACAO", "True").lower() == "true"
+
+
+def inicializar_indices() -> dict:
+    """Roda o bootstrap de índices uma vez; falhas são logadas sem impedir a aplicação de subir."""
+
+    try:
+        relatorio = garantir_indices(get_db_connection())
+    except (Exception, SystemExit) as e:
+        # get_db chama exit() quando não consegue conectar.
+        print(f"Não foi possível verificar os índices do MongoDB: {str(e)}")
+        return {}
+
+    print(
+        f"Índices: {len(relatorio['criados'])} criados, {len(relatorio['existentes'])} já existentes, "
+        f"{len(relatorio['divergentes'])} divergentes, {len(relatorio['erros'])} com erro."
+    )
+    return relatorio
+
+
+def register_cli_commands(app):
+
+    @app.cli.command("garantir-indices")
+    @click.option("--recriar", is_flag=True,
+                  help="Remove e recria os índices com opções diferentes das declaradas (bloqueia a coleção no build).")
+    def garantir_indices_command(recriar):
+        """Cria no MongoDB os índices declarados que ainda não existem."""
+        relatorio = garantir_indices(get_db_connection(), recriar=recriar)
+        for situacao, indices in relatorio.items():
+            for indice in indices:
+                click.echo(f"{situacao}: {indice}")
+        if relatorio["erros"] or relatorio["divergentes"]:
+            raise SystemExit(1)
+
+    @app.cli.command("recalcular-resumos")
+    def recalcular_resumos_command():
+        """Recalcula do zero os resumos de todas as faturas e usuários (backfill)."""
+        db = get_db_connection()
+        faturas_collection = db[os.getenv("COLLECTION_FATURAS")]
+        resultado = recalcular_resumos(
+            db[os.getenv("COLLECTION_USERS")], faturas_collection, obter_repositorio(db, faturas_collection)
+        )
+        click.echo(f"Resumos recalculados: {resultado['faturas']} faturas, {resultado['usuarios']} usuários.")
+
+    @app.cli.command("migrar-transferencias")
+    def migrar_transferencias_command():
+        """Copia as transferências embutidas nas faturas para a coleção de transferências (idempotente)."""
+        db = get_db_connection()
+        relatorio = garantir_indices(db, indices_transferencias())
+        if relatorio["erros"]:
+            raise SystemExit(1)
+        resultado = migrar_transferencias(db[os.getenv("COLLECTION_FATURAS")], db[COLLECTION_TRANSFERENCIAS])
+        click.echo(
+            f"Transferências migradas: {resultado['inseridas']} inseridas de {resultado['transferencias']} "
+            f"em {resultado['faturas']} faturas."
+        )
+
+    @app.cli.command("migrar-datas")
+    def migrar_datas_command():
+        """Converte mes_ano e datas em texto das faturas (e da coleção de transferências) para tipos nativos."""
+        db = get_db_connection()
+        resultado = migrar_datas(db[os.getenv("COLLECTION_FATURAS")], db[COLLECTION_TRANSFERENCIAS])
+        click.echo(
+            f"Datas migradas: {resultado['faturas']} faturas e {resultado['transferencias']} transferências; "
+            f"{len(resultado['conflitos'])} faturas com conflito."
+        )
+        for fatura_id in resultado["conflitos"]:
+            click.echo(f"conflito: {fatura_id}")
+        if resultado["conflitos"]:
+            raise SystemExit(1)
+
+    @app.cli.command("preencher-impressoes-digitais")
+    def preencher_impressoes_digitais_command():
+        """Grava a impressão digital dos extratos enviados antes da deduplicação (idempotente)."""
+        db = get_db_connection()
+        faturas_collection = db[os.getenv("COLLECTION_FATURAS")]
+        resultado = preencher_impressoes_digitais(faturas_collection, obter_repositorio(db, faturas_collection))
+        click.echo(f"Impressões digitais gravadas: {resultado['extratos']} extratos em {resultado['faturas']} faturas.")
@@ -0,0 +1,21 @@
+import inspect
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def mongomock_bulk_write_compativel(monkeypatch):
+    """O pymongo >= 4.11 passa "sort" para o bulk de UpdateOne, argumento que o mongomock 4.3 não conhece."""
+
+    try:
+        from mongomock.collection import BulkOperationBuilder
+    except ImportError:
+        return
+    original = BulkOperationBuilder.add_update
+    if "sort" in inspect.signature(original).parameters:
+        return
+
+    def add_update(self, *args, sort=None, **kwargs):
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", add_update)
@@ -0,0 +1,292 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+import math
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+import uuid
+
+from pymongo.errors import DuplicateKeyError
+
+from _db import get_db_connection
+
+
+# Controle de admissão dos uploads de extratos (cada arquivo custa parser + LLM):
+# - balde de tokens por usuário: ADMISSAO_CAPACIDADE tokens, recarregados a ADMISSAO_RECARGA_POR_MINUTO;
+#   cada arquivo custa 1 token mais 1 a cada ADMISSAO_BYTES_POR_TOKEN;
+# - limite global de arquivos em processamento (ADMISSAO_MAX_EM_ANDAMENTO); um envio com mais arquivos
+#   que o limite ocupa todas as vagas e só entra quando o processamento estiver livre.
+# Acima do limite a rota responde 429 com Retry-After em vez de enfileirar.
+# Backend: "memoria" (padrão, por processo), "mongo" (compartilhado entre workers) ou "desligado".
+ADMISSAO_BACKEND = os.getenv("ADMISSAO_BACKEND", "memoria").lower()
+ADMISSAO_CAPACIDADE = float(os.getenv("ADMISSAO_CAPACIDADE", "20"))
+ADMISSAO_RECARGA_POR_MINUTO = float(os.getenv("ADMISSAO_RECARGA_POR_MINUTO", "10"))
+ADMISSAO_BYTES_POR_TOKEN = int(os.getenv("ADMISSAO_BYTES_POR_TOKEN", str(5 * 1024 * 1024)))
+ADMISSAO_MAX_EM_ANDAMENTO = int(os.getenv("ADMISSAO_MAX_EM_ANDAMENTO", "8"))
+# Retry-After quando o limite global está cheio (não dá para prever quando uma vaga abre).
+ADMISSAO_RETRY_OCUPADO = int(os.getenv("ADMISSAO_RETRY_OCUPADO", "5"))
+# Reservas de vagas de um worker que caiu sem liberá-las expiram depois deste tempo.
+ADMISSAO_RESERVA_TTL = int(os.getenv("ADMISSAO_RESERVA_TTL", "900"))
+COLLECTION_ADMISSAO = os.getenv("COLLECTION_ADMISSAO", "admissao")
+
+MOTIVO_USUARIO = "limite_usuario"
+MOTIVO_OCUPADO = "capacidade_global"
+
+_ID_EM_ANDAMENTO = "em_andamento"
+
+
+class LimiteExcedido(Exception):
+    """Upload recusado agora; pode ser tentado de novo depois de retry_apos segundos (429)."""
+
+    def __init__(self, motivo: str, retry_apos: int):
+        mensagens = {
+            MOTIVO_USUARIO: "Limite de envios de extratos atingido. Tente novamente em alguns instantes",
+            MOTIVO_OCUPADO: "O processamento de extratos está no limite. Tente novamente em alguns instantes",
+        }
+        super().__init__(mensagens[motivo])
+        self.motivo = motivo
+        self.retry_apos = retry_apos
+
+
+class LoteGrandeDemais(Exception):
+    """Upload que nunca caberia no balde: custo acima da capacidade (413)."""
+
+
+def custo_upload(tamanhos: List[int], bytes_por_token: Optional[int] = None) -> int:
+    """Tokens de um upload: 1 por arquivo mais 1 a cada ADMISSAO_BYTES_POR_TOKEN (PDFs grandes têm mais páginas)."""
+
+    bytes_por_token = bytes_por_token or ADMISSAO_BYTES_POR_TOKEN
+    return sum(1 + tamanho // bytes_por_token for tamanho in tamanhos)
+
+
+def _recarregar(tokens: float, desde: float, agora: float, capacidade: float, por_segundo: float) -> float:
+    return min(capacidade, tokens + max(0.0, agora - desde) * por_segundo)
+
+
+class EstatisticasAdmissao:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.admitidos = 0
+        self.recusados_usuario = 0
+        self.recusados_ocupado = 0
+        self.erros = 0
+
+    def incrementar(self, campo: str) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + 1)
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {
+                "admitidos": self.admitidos,
+                "recusados_usuario": self.recusados_usuario,
+                "recusados_ocupado": self.recusados_ocupado,
+                "erros": self.erros,
+            }
+
+
+class ControleAdmissao(ABC):
+    """Interface comum: admitir reserva tokens do usuário e vagas globais; liberar devolve as vagas.
+
+    Os tokens consumidos não voltam (limitam a taxa de envios); as vagas voltam quando o processamento
+    termina. Falhas do backend não derrubam o upload: ele é admitido sem reserva.
+    """
+
+    def __init__(self, capacidade: float = ADMISSAO_CAPACIDADE, recarga_por_minuto: float = ADMISSAO_RECARGA_POR_MINUTO,
+                 max_em_andamento: int = ADMISSAO_MAX_EM_ANDAMENTO, relogio: Callable[[], float] = time.time):
+        self.capacidade = capacidade
+        self.por_segundo = recarga_por_minuto / 60
+        self.max_em_andamento = max_em_andamento
+        self.relogio = relogio
+        self.estatisticas = EstatisticasAdmissao()
+
+    def admitir(self, user_id: str, custo: int, arquivos: int) -> Optional[str]:
+        """Id da reserva (para liberar). Lança LimiteExcedido (429) ou LoteGrandeDemais (413)."""
+
+        if custo > self.capacidade:
+            raise LoteGrandeDemais(
+                f"Envio grande demais: no máximo {int(self.capacidade)} tokens por vez "
+                f"(este custa {custo} tokens em {arquivos} arquivos). Envie em partes")
+        # Lotes maiores que o limite global ocupam todas as vagas em vez de serem recusados.
+        vagas = min(arquivos, self.max_em_andamento)
+        try:
+            espera = self._consumir(user_id, custo)
+            if espera:
+                self.estatisticas.incrementar("recusados_usuario")
+                raise LimiteExcedido(MOTIVO_USUARIO, max(1, math.ceil(espera)))
+            reserva = uuid.uuid4().hex
+            if not self._reservar(reserva, vagas):
+                self._devolver(user_id, custo)
+                self.estatisticas.incrementar("recusados_ocupado")
+                raise LimiteExcedido(MOTIVO_OCUPADO, ADMISSAO_RETRY_OCUPADO)
+        except LimiteExcedido:
+            raise
+        except Exception as e:
+            print(f"Erro no controle de admissão: {str(e)}")
+            self.estatisticas.incrementar("erros")
+            return None
+        self.estatisticas.incrementar("admitidos")
+        return reserva
+
+    def liberar(self, reserva: Optional[str]) -> None:
+        if reserva is None:
+            return
+        try:
+            self._liberar(reserva)
+        except Exception as e:
+            print(f"Erro ao liberar reserva de admissão {reserva}: {str(e)}")
+            self.estatisticas.incrementar("erros")
+
+    @abstractmethod
+    def _consumir(self, user_id: str, custo: int) -> float:
+        """Tira custo tokens do balde; devolve 0 ou os segundos até haver tokens suficientes."""
+
+    @abstractmethod
+    def _devolver(self, user_id: str, custo: int) -> None:
+        """Devolve ao balde os tokens de uma admissão recusada pelo limite global."""
+
+    @abstractmethod
+    def _reservar(self, reserva: str, arquivos: int) -> bool:
+        """Ocupa arquivos vagas globais; False quando não cabem."""
+
+    @abstractmethod
+    def _liberar(self, reserva: str) -> None:
+        """Devolve as vagas da reserva."""
+
+
+class AdmissaoMemoria(ControleAdmissao):
+    """Baldes e vagas no processo (cada worker do gunicorn tem os seus)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._baldes = {}
+        self._reservas = {}
+
+    def _consumir(self, user_id, custo):
+        with self._lock:
+            agora = self.relogio()
+            tokens, desde = self._baldes.get(user_id, (self.capacidade, agora))
+            tokens = _recarregar(tokens, desde, agora, self.capacidade, self.por_segundo)
+            if tokens < custo:
+                self._baldes[user_id] = (tokens, agora)
+                return (custo - tokens) / self.por_segundo
+            self._baldes[user_id] = (tokens - custo, agora)
+            return 0
+
+    def _devolver(self, user_id, custo):
+        with self._lock:
+            tokens, desde = self._baldes[user_id]
+            self._baldes[user_id] = (min(self.capacidade, tokens + custo), desde)
+
+    def _reservar(self, reserva, arquivos):
+        with self._lock:
+            if sum(self._reservas.values()) + arquivos > self.max_em_andamento:
+                return False
+            self._reservas[reserva] = arquivos
+            return True
+
+    def _liberar(self, reserva):
+        with self._lock:
+            self._reservas.pop(reserva, None)
+
+
+class AdmissaoMongo(ControleAdmissao):
+    """Baldes e vagas numa coleção do MongoDB, valendo para todos os workers.
+
+    Cada balde é um documento {_id: "balde:<user_id>", tokens, atualizado_em}, regravado só se
+    atualizado_em não mudou desde a leitura (senão lê de novo); o índice TTL em expira_em remove os
+    baldes que já estariam cheios. As vagas ficam num único documento com o total e a lista de reservas:
+    a reserva é um find_one_and_update condicionado ao total, e reservas vencidas
+    (ADMISSAO_RESERVA_TTL) são devolvidas antes de cada tentativa.
+    """
+
+    TENTATIVAS = 5
+
+    def __init__(self, collection, reserva_ttl: int = ADMISSAO_RESERVA_TTL, **kwargs):
+        super().__init__(**kwargs)
+        self._collection = collection
+        self._reserva_ttl = reserva_ttl
+
+    def _consumir(self, user_id, custo):
+        chave = f"balde:{user_id}"
+        for _ in range(self.TENTATIVAS):
+            documento = self._collection.find_one({"_id": chave})
+            agora = self.relogio()
+            tokens = self.capacidade if documento is None else _recarregar(
+                documento["tokens"], documento["atualizado_em"], agora, self.capacidade, self.por_segundo)
+            if tokens < custo:
+                return (custo - tokens) / self.por_segundo
+            novo = {
+                "tokens": tokens - custo,
+                "atualizado_em": agora,
+                "expira_em": datetime.now(timezone.utc) + timedelta(seconds=self.capacidade / self.por_segundo),
+            }
+            if documento is None:
+                try:
+                    self._collection.insert_one({"_id": chave, **novo})
+                    return 0
+                except DuplicateKeyError:
+                    continue
+            filtro = {"_id": chave, "atualizado_em": documento["atualizado_em"]}
+            if self._collection.update_one(filtro, {"$set": novo}).modified_count:
+                return 0
+        # Disputa contínua pelo mesmo balde: o próprio usuário está enviando em paralelo.
+        return 1
+
+    def _devolver(self, user_id, custo):
+        self._collection.update_one({"_id": f"balde:{user_id}"}, {"$inc": {"tokens": custo}})
+
+    def _reservar(self, reserva, arquivos):
+        self._collection.update_one({"_id": _ID_EM_ANDAMENTO}, {"$setOnInsert": {"total": 0, "reservas": []}}, upsert=True)
+        self._expirar_reservas()
+        expira_em = datetime.now(timezone.utc) + timedelta(seconds=self._reserva_ttl)
+        return self._collection.find_one_and_update(
+            {"_id": _ID_EM_ANDAMENTO, "total": {"$lte": self.max_em_andamento - arquivos}},
+            {"$inc": {"total": arquivos}, "$push": {"reservas": {"id": reserva, "arquivos": arquivos, "expira_em": expira_em}}},
+        ) is not None
+
+    def _liberar(self, reserva):
+        documento = self._collection.find_one({"_id": _ID_EM_ANDAMENTO, "reservas.id": reserva}, {"reservas": 1})
+        for item in (documento or {}).get("reservas", []):
+            if item["id"] == reserva:
+                self._remover_reserva(item)
+
+    def _expirar_reservas(self):
+        agora = datetime.now(timezone.utc)
+        documento = self._collection.find_one({"_id": _ID_EM_ANDAMENTO}, {"reservas": 1})
+        for item in documento.get("reservas", []):
+            expira_em = item["expira_em"]
+            if expira_em.tzinfo is None:
+                expira_em = expira_em.replace(tzinfo=timezone.utc)
+            if expira_em < agora:
+                self._remover_reserva(item)
+
+    def _remover_reserva(self, item):
+        # O filtro pela reserva garante que o total só é descontado uma vez, mesmo com dois workers limpando.
+        self._collection.update_one(
+            {"_id": _ID_EM_ANDAMENTO, "reservas.id": item["id"]},
+            {"$pull": {"reservas": {"id": item["id"]}}, "$inc": {"total": -item["arquivos"]}},
+        )
+
+
+_controle = None
+_controle_lock = threading.Lock()
+
+
+def obter_controle_admissao() -> Optional[ControleAdmissao]:
+    """Instância do processo conforme ADMISSAO_BACKEND (None quando desligado)."""
+
+    global _controle
+    if ADMISSAO_BACKEND == "desligado":
+        return None
+    if _controle is None:
+        with _controle_lock:
+            if _controle is None:
+                if ADMISSAO_BACKEND == "mongo":
+                    _controle = AdmissaoMongo(get_db_connection()[COLLECTION_ADMISSAO])
+                else:
+                    _controle = AdmissaoMemoria()
+    return _controle
@@ -0,0 +1,193 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+import threading
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller.utils_admissao import (
+    MOTIVO_OCUPADO,
+    MOTIVO_USUARIO,
+    AdmissaoMemoria,
+    AdmissaoMongo,
+    LimiteExcedido,
+    LoteGrandeDemais,
+    custo_upload,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def __call__(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio():
+    return Relogio()
+
+
+@pytest.fixture
+def colecao():
+    return mongomock.MongoClient().db.admissao
+
+
+@pytest.fixture(params=["memoria", "mongo"])
+def criar(request, relogio, colecao):
+    """Fábrica de controles; no Mongo, todos compartilham a coleção (como workers diferentes)."""
+    def criar(**kwargs):
+        kwargs = {"capacidade": 4, "recarga_por_minuto": 60, "max_em_andamento": 3, "relogio": relogio, **kwargs}
+        if request.param == "mongo":
+            return AdmissaoMongo(colecao, **kwargs)
+        return AdmissaoMemoria(**kwargs)
+    return criar
+
+
+def test_custo_considera_o_tamanho():
+    assert custo_upload([100, 200], bytes_por_token=1000) == 2
+    assert custo_upload([100, 2500], bytes_por_token=1000) == 4
+
+
+class TestControleAdmissao:
+
+    def test_balde_esvazia_e_recarrega(self, criar, relogio):
+        controle = criar()
+        for _ in range(2):
+            controle.liberar(controle.admitir("u1", 2, 1))
+
+        with pytest.raises(LimiteExcedido) as erro:
+            controle.admitir("u1", 3, 1)
+        assert erro.value.motivo == MOTIVO_USUARIO
+        assert erro.value.retry_apos == 3  # 1 token por segundo
+
+        relogio.agora += 3
+        assert controle.admitir("u1", 3, 1) is not None
+
+    def test_baldes_sao_por_usuario(self, criar):
+        controle = criar()
+        controle.liberar(controle.admitir("u1", 4, 1))
+        with pytest.raises(LimiteExcedido):
+            controle.admitir("u1", 1, 1)
+        assert controle.admitir("u2", 1, 1) is not None
+
+    def test_limite_global_e_devolucao_dos_tokens(self, criar, relogio):
+        controle = criar(capacidade=10)
+        reserva = controle.admitir("u1", 2, 2)
+
+        with pytest.raises(LimiteExcedido) as erro:
+            controle.admitir("u2", 2, 2)
+        assert erro.value.motivo == MOTIVO_OCUPADO
+
+        # Os tokens da tentativa recusada voltaram: u2 ainda tem o balde cheio.
+        controle.liberar(reserva)
+        assert controle.admitir("u2", 10, 3) is not None
+
+    def test_lote_que_nunca_cabe(self, criar):
+        controle = criar()
+        with pytest.raises(LoteGrandeDemais):
+            controle.admitir("u1", 5, 1)
+
+    def test_lote_acima_do_limite_global_ocupa_todas_as_vagas(self, criar):
+        controle = criar(capacidade=10)
+        ocupado = controle.admitir("u1", 1, 1)
+
+        # Com o processamento ocupado, o lote grande espera (429) em vez de ser recusado de vez (413).
+        with pytest.raises(LimiteExcedido) as erro:
+            controle.admitir("u2", 9, 9)
+        assert erro.value.motivo == MOTIVO_OCUPADO
+
+        controle.liberar(ocupado)
+        reserva = controle.admitir("u2", 9, 9)
+        assert reserva is not None
+        with pytest.raises(LimiteExcedido):
+            controle.admitir("u3", 1, 1)
+
+        controle.liberar(reserva)
+        assert controle.admitir("u3", 1, 1) is not None
+
+    def test_admissoes_simultaneas_respeitam_o_balde(self, criar):
+        controle = criar(capacidade=10, max_em_andamento=100)
+        barreira = threading.Barrier(20)
+
+        def tentar(_):
+            barreira.wait()
+            try:
+                return controle.admitir("u1", 1, 1) is not None
+            except LimiteExcedido:
+                return False
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            admitidos = sum(executor.map(tentar, range(20)))
+
+        # Nunca além do balde; no Mongo, quem perde a disputa pelo documento várias vezes também recebe 429.
+        assert admitidos == 10 if isinstance(controle, AdmissaoMemoria) else 0 < admitidos <= 10
+
+
+def test_limite_global_vale_entre_workers(colecao, relogio):
+    workers = [AdmissaoMongo(colecao, capacidade=10, max_em_andamento=3, relogio=relogio) for _ in range(2)]
+    workers[0].admitir("u1", 2, 2)
+
+    with pytest.raises(LimiteExcedido):
+        workers[1].admitir("u2", 2, 2)
+    assert workers[1].admitir("u2", 1, 1) is not None
+
+
+def test_reserva_de_worker_que_caiu_expira(colecao, relogio):
+    controle = AdmissaoMongo(colecao, capacidade=10, max_em_andamento=3, relogio=relogio)
+    controle.admitir("u1", 3, 3)
+    colecao.update_one({"_id": "em_andamento"},
+                       {"$set": {"reservas.0.expira_em": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+    assert controle.admitir("u2", 3, 3) is not None
+    assert colecao.find_one({"_id": "em_andamento"})["total"] == 3
+
+
+def test_falha_do_backend_nao_derruba_o_upload(colecao):
+    controle = AdmissaoMongo(colecao)
+    with patch.object(colecao, "find_one", side_effect=Exception("sem conexão")):
+        assert controle.admitir("u1", 1, 1) is None
+    assert controle.estatisticas.resumo()["erros"] == 1
+
+
+def test_rota_responde_429_com_retry_after(relogio):
+    db = mongomock.MongoClient().db
+    user_id = str(db.usuarios.insert_one({"faturas": []}).inserted_id)
+    controle = AdmissaoMemoria(capacidade=2, recarga_por_minuto=6, max_em_andamento=4, relogio=relogio)
+    processados = []
+
+    async def formatar(arquivos):
+        processados.append(len(arquivos))
+        return []
+
+    app = create_app()
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+
+    def enviar(cliente, n):
+        return cliente.post(f"/faturas/usuario/{user_id}", headers=headers, content_type="multipart/form-data",
+                            data={"file": [(BytesIO(b"%PDF"), f"{i}.pdf") for i in range(n)]})
+
+    with patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios, "faturas": db.faturas}), \
+         patch("app.routes.COLLECTION_USERS", "usuarios"), patch("app.routes.COLLECTION_FATURAS", "faturas"), \
+         patch("app.routes.formatar_extratos", formatar), \
+         patch("app.routes.obter_controle_admissao", return_value=controle):
+        cliente = app.test_client()
+        primeiro = enviar(cliente, 2)
+        recusado = enviar(cliente, 1)
+        grande = enviar(cliente, 5)
+
+    assert primeiro.status_code == 201
+    assert recusado.status_code == 429
+    assert recusado.headers["Retry-After"] == "10"
+    assert recusado.get_json()["motivo"] == MOTIVO_USUARIO
+    assert grande.status_code == 413
+    assert processados == [2]
+    # A vaga do primeiro upload voltou quando o processamento terminou.
+    assert controle._reservas == {}
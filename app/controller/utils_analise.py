@@ -0,0 +1,247 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from app.controller.utils_datas import DATA_MINIMA
+from app.controller.utils_listagem_faturas import filtro_mes_ano
+from app.models import Banco, CategoriaGasto, OrigemTransacao
+
+
+# Cache por processo dos resultados de análise. A validade vem do contador "versao_analise" do
+# usuário, incrementado a cada upload: um resultado calculado numa versão anterior nunca é servido,
+# inclusive entre workers diferentes.
+ANALISE_CACHE_MAX_ENTRADAS = int(os.getenv("ANALISE_CACHE_MAX_ENTRADAS", "1000"))
+
+# agrupar_por -> (campo no layout embutido, campo na coleção de transferências, enum para traduzir valor -> nome)
+AGRUPAMENTOS = {
+    "categoria": ("$extratos.transferencias.categoria", "$categoria", CategoriaGasto),
+    "origem": ("$extratos.transferencias.origem", "$origem", OrigemTransacao),
+    "banco": ("$extratos.banco", "$banco", Banco),
+    "nenhum": (None, None, None),
+}
+
+_DATA = "$extratos.transferencias.data"
+# Chave "YYYYMMDD" da transferência: datetime no formato atual ou "DD/MM/YYYY" em faturas legadas.
+# ($substr opera em bytes, o que é seguro aqui porque a data legada só tem dígitos e "/".)
+_DATA_ORDENAVEL = {"$cond": [
+    {"$gte": [_DATA, DATA_MINIMA]},
+    {"$dateToString": {"format": "%Y%m%d", "date": _DATA}},
+    {"$concat": [{"$substr": [_DATA, 6, 4]}, {"$substr": [_DATA, 3, 2]}, {"$substr": [_DATA, 0, 2]}]},
+]}
+_ANO = {"$substr": ["$data_ordenavel", 0, 4]}
+PERIODOS = {
+    "mes": {"$concat": [_ANO, "-", {"$substr": ["$data_ordenavel", 4, 2]}]},
+    "ano": _ANO,
+    "total": None,
+}
+# Na coleção de transferências a data já é datetime.
+PERIODOS_COLECAO = {
+    "mes": {"$dateToString": {"format": "%Y-%m", "date": "$data"}},
+    "ano": {"$dateToString": {"format": "%Y", "date": "$data"}},
+    "total": None,
+}
+
+
+def _valores_enum(enum_cls, texto: Optional[str]) -> Optional[List[str]]:
+    # Aceita nomes (ALIMENTACAO) ou valores ("Alimentação"), separados por vírgula.
+    if not texto:
+        return None
+    valores = []
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if parte in enum_cls.__members__:
+            valores.append(enum_cls[parte].value)
+        elif parte in {membro.value for membro in enum_cls}:
+            valores.append(parte)
+        else:
+            raise ValueError(f"Valor inválido para {enum_cls.__name__}: '{parte}'")
+    return valores
+
+
+def _data(texto: Optional[str]) -> Optional[date]:
+    if not texto:
+        return None
+    try:
+        return datetime.strptime(texto, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError(f"Data inválida: '{texto}'. Use o formato YYYY-MM-DD")
+
+
+def parametros_analise(args) -> dict:
+    """Valida e normaliza os parâmetros da query string (lança ValueError se algum for inválido)."""
+
+    agrupar_por = args.get("agrupar_por", "categoria")
+    if agrupar_por not in AGRUPAMENTOS:
+        raise ValueError(f"agrupar_por deve ser um de: {', '.join(AGRUPAMENTOS)}")
+    periodo = args.get("periodo", "mes")
+    if periodo not in PERIODOS:
+        raise ValueError(f"periodo deve ser um de: {', '.join(PERIODOS)}")
+
+    de, ate = _data(args.get("from")), _data(args.get("to"))
+    if de and ate and de > ate:
+        raise ValueError("'from' deve ser anterior ou igual a 'to'")
+
+    return {
+        "agrupar_por": agrupar_por,
+        "periodo": periodo,
+        "de": de.isoformat() if de else None,
+        "ate": ate.isoformat() if ate else None,
+        "categorias": _valores_enum(CategoriaGasto, args.get("categoria")),
+        "origens": _valores_enum(OrigemTransacao, args.get("origem")),
+        "bancos": _valores_enum(Banco, args.get("banco")),
+    }
+
+
+def _estagios_grupo(valor: str, periodo, grupo) -> List[dict]:
+    return [
+        {"$group": {
+            "_id": {"periodo": periodo, "grupo": grupo},
+            "total": {"$sum": valor},
+            "entradas": {"$sum": {"$cond": [{"$gte": [valor, 0]}, valor, 0]}},
+            "saidas": {"$sum": {"$cond": [{"$lt": [valor, 0]}, valor, 0]}},
+            "quantidade": {"$sum": 1},
+        }},
+        {"$sort": {"_id.periodo": 1, "_id.grupo": 1}},
+    ]
+
+
+def pipeline_analise(user_id: str, parametros: dict) -> List[dict]:
+    """Pipeline que filtra, agrupa e soma as transferências do usuário no próprio MongoDB (layout embutido)."""
+
+    de = date.fromisoformat(parametros["de"]) if parametros["de"] else None
+    ate = date.fromisoformat(parametros["ate"]) if parametros["ate"] else None
+
+    filtro_faturas = {"user_id": user_id}
+    if de or ate:
+        # Corta as faturas fora do intervalo antes do $unwind, usando o índice (user_id, mes_ano).
+        filtro_faturas.update(filtro_mes_ano(
+            f"{de.month:02d}/{de.year}" if de else None,
+            f"{ate.month:02d}/{ate.year}" if ate else None,
+        ))
+    pipeline = [{"$match": filtro_faturas}, {"$unwind": "$extratos"}]
+    if parametros["bancos"]:
+        pipeline.append({"$match": {"extratos.banco": {"$in": parametros["bancos"]}}})
+    pipeline.append({"$unwind": "$extratos.transferencias"})
+    if de or ate or PERIODOS[parametros["periodo"]] is not None:
+        pipeline.append({"$addFields": {"data_ordenavel": _DATA_ORDENAVEL}})
+
+    filtro_transferencias = {}
+    if parametros["categorias"]:
+        filtro_transferencias["extratos.transferencias.categoria"] = {"$in": parametros["categorias"]}
+    if parametros["origens"]:
+        filtro_transferencias["extratos.transferencias.origem"] = {"$in": parametros["origens"]}
+    if de or ate:
+        intervalo = {}
+        if de:
+            intervalo["$gte"] = de.strftime("%Y%m%d")
+        if ate:
+            intervalo["$lte"] = ate.strftime("%Y%m%d")
+        filtro_transferencias["data_ordenavel"] = intervalo
+    if filtro_transferencias:
+        pipeline.append({"$match": filtro_transferencias})
+
+    campo_grupo, _, _ = AGRUPAMENTOS[parametros["agrupar_por"]]
+    return pipeline + _estagios_grupo("$extratos.transferencias.valor", PERIODOS[parametros["periodo"]], campo_grupo)
+
+
+def pipeline_analise_colecao(user_id: str, parametros: dict) -> List[dict]:
+    """O mesmo para a coleção de transferências: um único $match, atendido pelos índices (user_id, [categoria,] data)."""
+
+    filtro = {"user_id": user_id}
+    if parametros["de"] or parametros["ate"]:
+        filtro["data"] = {}
+        if parametros["de"]:
+            filtro["data"]["$gte"] = datetime.fromisoformat(parametros["de"])
+        if parametros["ate"]:
+            filtro["data"]["$lt"] = datetime.fromisoformat(parametros["ate"]) + timedelta(days=1)
+    for campo, valores in (("categoria", "categorias"), ("origem", "origens"), ("banco", "bancos")):
+        if parametros[valores]:
+            filtro[campo] = {"$in": parametros[valores]}
+
+    _, campo_grupo, _ = AGRUPAMENTOS[parametros["agrupar_por"]]
+    return [{"$match": filtro}] + _estagios_grupo("$valor", PERIODOS_COLECAO[parametros["periodo"]], campo_grupo)
+
+
+def _nome_grupo(enum_cls, valor):
+    if enum_cls is None or valor is None:
+        return valor
+    try:
+        return enum_cls(valor).name
+    except ValueError:
+        return valor
+
+
+def executar_analise(repositorio, user_id: str, parametros: dict) -> List[dict]:
+    _, _, enum_cls = AGRUPAMENTOS[parametros["agrupar_por"]]
+    if repositorio.modo == "colecao":
+        linhas = repositorio.transferencias.aggregate(pipeline_analise_colecao(user_id, parametros))
+    else:
+        linhas = repositorio.faturas.aggregate(pipeline_analise(user_id, parametros))
+    resultado = []
+    for linha in linhas:
+        resultado.append({
+            "periodo": linha["_id"].get("periodo"),
+            "grupo": _nome_grupo(enum_cls, linha["_id"].get("grupo")),
+            "total": round(linha["total"], 2),
+            "entradas": round(linha["entradas"], 2),
+            "saidas": round(linha["saidas"], 2),
+            "quantidade": linha["quantidade"],
+        })
+    return resultado
+
+
+class CacheAnalise:
+    """LRU em memória: (user_id, parâmetros) -> (versão do usuário, resultado)."""
+
+    def __init__(self, max_entradas: int = ANALISE_CACHE_MAX_ENTRADAS):
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._max_entradas = max_entradas
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _chave(user_id: str, parametros: dict) -> Tuple:
+        return (user_id,) + tuple((campo, str(parametros[campo])) for campo in sorted(parametros))
+
+    def obter(self, user_id: str, parametros: dict, versao: int) -> Optional[List[dict]]:
+        chave = self._chave(user_id, parametros)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None or entrada[0] != versao:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.hits += 1
+            return entrada[1]
+
+    def salvar(self, user_id: str, parametros: dict, versao: int, resultado: List[dict]) -> None:
+        chave = self._chave(user_id, parametros)
+        with self._lock:
+            self._entradas[chave] = (versao, resultado)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self._max_entradas:
+                self._entradas.popitem(last=False)
+
+
+cache_analise = CacheAnalise()
+
+
+def analisar(users_collection, repositorio, user_obj_id, parametros: dict) -> Optional[Tuple[List[dict], bool]]:
+    """(resultado, veio_do_cache) ou None se o usuário não existir."""
+
+    user = users_collection.find_one({"_id": user_obj_id}, {"versao_analise": 1})
+    if user is None:
+        return None
+    user_id = str(user_obj_id)
+    versao = user.get("versao_analise", 0)
+
+    resultado = cache_analise.obter(user_id, parametros, versao)
+    if resultado is not None:
+        return resultado, True
+
+    resultado = executar_analise(repositorio, user_id, parametros)
+    cache_analise.salvar(user_id, parametros, versao, resultado)
+    return resultado, False
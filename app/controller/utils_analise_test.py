@@ -0,0 +1,187 @@
+from collections import defaultdict
+from datetime import datetime
+import json
+import random
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller import utils_analise
+from app.controller.utils_analise import CacheAnalise, analisar, executar_analise, parametros_analise
+from app.controller.utils_datas import data_datetime
+from app.controller.utils_listagem_faturas import listar_faturas
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.controller.utils_transferencias import RepositorioColecao, RepositorioEmbutido
+from app.models import CategoriaGasto, OrigemTransacao
+
+mongomock = pytest.importorskip("mongomock")
+
+
+N_MESES = 24
+N_POR_MES = 500  # 12k transferências
+
+
+def _extratos_do_mes(mes, ano, n, aleatorio):
+    transferencias = [{
+        "valor": round(aleatorio.uniform(-300, 200), 2),
+        "data": datetime(ano, mes, aleatorio.randint(1, 28)),
+        "origem": aleatorio.choice(list(OrigemTransacao)).value,
+        "categoria": aleatorio.choice(list(CategoriaGasto)).value,
+    } for _ in range(n)]
+    meio = n // 2
+    # O extrato do NUBANK fica com as datas em texto, como era gravado antes das datas nativas.
+    legadas = [{**t, "data": t["data"].strftime("%d/%m/%Y")} for t in transferencias[:meio]]
+    return [
+        {"banco": "NUBANK", "data": f"{mes:02d}/{ano}", "_id": str(ObjectId()), "transferencias": legadas},
+        {"banco": "ITAU", "data": datetime(ano, mes, 1), "_id": str(ObjectId()), "transferencias": transferencias[meio:]},
+    ]
+
+
+def _popular(db, user_id, n_meses, n_por_mes, repositorio=None, seed=7):
+    aleatorio = random.Random(seed)
+    for i in range(n_meses):
+        mes, ano = i % 12 + 1, 2024 + i // 12
+        salvar_extratos(db.usuarios, db.faturas, user_id, _extratos_do_mes(mes, ano, n_por_mes, aleatorio), repositorio)
+
+
+def _faturas_completas(db, repositorio):
+    return [{"extratos": repositorio.extratos_da_fatura(fatura)} for fatura in db.faturas.find()]
+
+
+def _soma_no_cliente(faturas, agrupar, filtro=lambda extrato, t: True):
+    totais = defaultdict(float)
+    for fatura in faturas:
+        for extrato in fatura["extratos"]:
+            for t in extrato["transferencias"]:
+                if filtro(extrato, t):
+                    totais[(data_datetime(t["data"]).strftime("%Y-%m"), agrupar(extrato, t))] += t["valor"]
+    return {chave: round(valor, 2) for chave, valor in totais.items()}
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.usuarios.insert_one({"name": "Teste", "faturas": []}).inserted_id
+
+
+@pytest.fixture(params=["embutido", "colecao"])
+def repositorio(request, db):
+    if request.param == "colecao":
+        return RepositorioColecao(db.faturas, db.transferencias)
+    return RepositorioEmbutido(db.faturas)
+
+
+@pytest.fixture(autouse=True)
+def cache_limpo(monkeypatch):
+    monkeypatch.setattr(utils_analise, "cache_analise", CacheAnalise())
+
+
+class TestPipelineAnalise:
+
+    def test_igual_a_soma_no_cliente(self, db, user_id, repositorio):
+        _popular(db, user_id, 3, 60, repositorio)
+        parametros = parametros_analise({"agrupar_por": "categoria", "periodo": "mes"})
+
+        resultado = executar_analise(repositorio, str(user_id), parametros)
+
+        esperado = _soma_no_cliente(_faturas_completas(db, repositorio), lambda e, t: CategoriaGasto(t["categoria"]).name)
+        assert {(linha["periodo"], linha["grupo"]): linha["total"] for linha in resultado} == pytest.approx(esperado)
+        assert [linha["periodo"] for linha in resultado] == sorted(linha["periodo"] for linha in resultado)
+
+    def test_filtros_de_categoria_banco_e_data(self, db, user_id, repositorio):
+        _popular(db, user_id, 3, 60, repositorio)
+        parametros = parametros_analise({
+            "agrupar_por": "banco", "periodo": "total", "categoria": "ALIMENTACAO,Saúde",
+            "banco": "NUBANK", "from": "2024-01-15", "to": "2024-02-10",
+        })
+
+        resultado = executar_analise(repositorio, str(user_id), parametros)
+
+        def filtro(extrato, t):
+            return (extrato["banco"] == "NUBANK" and t["categoria"] in ("Alimentação", "Saúde")
+                    and datetime(2024, 1, 15) <= data_datetime(t["data"]) <= datetime(2024, 2, 10))
+        esperado = round(sum(_soma_no_cliente(_faturas_completas(db, repositorio), lambda e, t: None, filtro).values()), 2)
+        assert len(resultado) == 1
+        assert resultado[0]["grupo"] == "NUBANK"
+        assert resultado[0]["total"] == pytest.approx(esperado)
+
+    @pytest.mark.parametrize("args", [{"agrupar_por": "dia"}, {"periodo": "semana"}, {"categoria": "PADARIA"},
+                                      {"from": "01/10/2025"}, {"from": "2025-10-02", "to": "2025-10-01"}])
+    def test_parametros_invalidos(self, args):
+        with pytest.raises(ValueError):
+            parametros_analise(args)
+
+
+class TestCacheAnalise:
+
+    def test_cache_invalidado_por_novo_extrato(self, db, user_id, repositorio):
+        _popular(db, user_id, 1, 20, repositorio)
+        parametros = parametros_analise({"periodo": "total", "agrupar_por": "nenhum"})
+
+        primeiro, em_cache_1 = analisar(db.usuarios, repositorio, user_id, parametros)
+        _, em_cache_2 = analisar(db.usuarios, repositorio, user_id, parametros)
+        salvar_extratos(db.usuarios, db.faturas, user_id, [{"banco": "ITAU", "data": "01/2024", "_id": "x", "transferencias": [
+            {"valor": -1000.0, "data": "02/01/2024", "origem": "PIX", "categoria": "Outros"}]}], repositorio)
+        depois, em_cache_3 = analisar(db.usuarios, repositorio, user_id, parametros)
+
+        assert (em_cache_1, em_cache_2, em_cache_3) == (False, True, False)
+        assert depois[0]["total"] == pytest.approx(primeiro[0]["total"] - 1000.0)
+        assert depois[0]["quantidade"] == primeiro[0]["quantidade"] + 1
+
+    def test_usuario_inexistente(self, db):
+        assert analisar(db.usuarios, RepositorioEmbutido(db.faturas), ObjectId(), parametros_analise({})) is None
+
+
+def test_agregacao_vs_soma_no_cliente(db, user_id):
+    """12k transferências: o pipeline devolve os mesmos totais que a soma paginando GET /faturas, trafegando bem menos."""
+    _popular(db, user_id, N_MESES, N_POR_MES)
+    parametros = parametros_analise({"agrupar_por": "categoria", "periodo": "mes"})
+
+    bytes_cliente = 0
+    cursor, faturas = None, []
+    while True:
+        args = {"limit": "20", "incluir_extratos": "true", **({"cursor": cursor} if cursor else {})}
+        pagina, cursor = listar_faturas(db.faturas, str(user_id), args)
+        bytes_cliente += len(json.dumps(pagina))
+        faturas += pagina
+        if cursor is None:
+            break
+    no_cliente = _soma_no_cliente(faturas, lambda e, t: CategoriaGasto(t["categoria"]).name)
+
+    repositorio = RepositorioEmbutido(db.faturas)
+    resultado, _ = analisar(db.usuarios, repositorio, user_id, parametros)
+
+    # A segunda chamada sai do cache, sem voltar ao banco.
+    with patch.object(repositorio, "faturas", None):
+        novamente, em_cache = analisar(db.usuarios, repositorio, user_id, parametros)
+
+    assert {(linha["periodo"], linha["grupo"]): linha["total"] for linha in resultado} == pytest.approx(no_cliente)
+    assert len(json.dumps(resultado)) * 20 < bytes_cliente
+    assert em_cache and novamente == resultado
+
+
+class TestRotaAnalise:
+
+    def test_rota(self, db, user_id):
+        _popular(db, user_id, 2, 10)
+        app = create_app()
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+        with patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios, "faturas": db.faturas}), \
+             patch("app.routes.COLLECTION_USERS", "usuarios"), patch("app.routes.COLLECTION_FATURAS", "faturas"):
+            ok = app.test_client().get(f"/faturas/usuario/{user_id}/analise?agrupar_por=origem&periodo=ano", headers=headers)
+            invalido = app.test_client().get(f"/faturas/usuario/{user_id}/analise?periodo=semana", headers=headers)
+            outro = app.test_client().get(f"/faturas/usuario/{ObjectId()}/analise", headers=headers)
+
+        assert ok.status_code == 200
+        assert {linha["periodo"] for linha in ok.get_json()["resultado"]} == {"2024"}
+        assert invalido.status_code == 400
+        assert outro.status_code == 403
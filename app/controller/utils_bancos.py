@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from app.controller.utils_classificador import normalizar
+from app.models import Banco, BancoCandidato
+
+
+# Identificação do banco pelo texto do parser, antes de baixar imagens e chamar o modelo de visão.
+# Só o início e o fim do texto são examinados: é onde ficam cabeçalho, rodapé, CNPJ e SAC; no meio,
+# nomes de outros bancos aparecem nas próprias transações ("PIX para Fulano - Nubank").
+BANCOS_JANELA_CHARS = int(os.getenv("BANCOS_JANELA_CHARS", "2000"))
+
+# Score atribuído ao candidato encontrado pelo texto. CNPJ/ISPB identificam a instituição sem
+# ambiguidade; nome ou código COMPE sozinhos são um pouco mais fracos, mas ainda acima do 0.8.
+SCORE_MARCADOR_FORTE = 0.99
+SCORE_MARCADOR_FRACO = 0.9
+
+# banco: (CNPJ da instituição, código COMPE, nomes e produtos). O ISPB é a raiz (8 dígitos) do CNPJ.
+MARCADORES_BANCO: Dict[Banco, tuple] = {
+    Banco.BANCO_DO_BRASIL:         ("00000000000191", "001", ["banco do brasil", "ourocard"]),
+    Banco.CAIXA_ECONOMICA_FEDERAL: ("00360305000104", "104", ["caixa economica federal", "caixa economica", "caixa tem"]),
+    Banco.ITAU:                    ("60701190000104", "341", ["itau unibanco", "banco itau", "itau personnalite", "itaucard"]),
+    Banco.BRADESCO:                ("60746948000112", "237", ["bradesco", "bradescard"]),
+    Banco.SANTANDER:               ("90400888000142", "033", ["santander"]),
+    Banco.NUBANK:                  ("18236120000158", "260", ["nubank", "nu pagamentos", "nu financeira"]),
+    Banco.INTER:                   ("00416968000101", "077", ["banco inter", "bancointer", "inter&co"]),
+    Banco.BTG_PACTUAL:             ("30306294000145", "208", ["btg pactual"]),
+    Banco.SAFRA:                   ("58160789000128", "422", ["banco safra", "safra"]),
+    Banco.SICREDI:                 ("01181521000155", "748", ["sicredi"]),
+    Banco.SICOOB:                  ("02038232000164", "756", ["sicoob", "bancoob"]),
+    Banco.ORIGINAL:                ("92894922000108", "212", ["banco original"]),
+    Banco.C6_BANK:                 ("31872495000172", "336", ["c6 bank", "banco c6", "c6bank"]),
+    Banco.PAGBANK:                 ("08561701000101", "290", ["pagbank", "pagseguro"]),
+    Banco.BANRISUL:                ("92702067000196", "041", ["banrisul", "banco do estado do rio grande do sul"]),
+    Banco.MERCANTIL_DO_BRASIL:     ("17184037000110", "389", ["mercantil do brasil"]),
+    Banco.PAN:                     ("59285411000113", "623", ["banco pan"]),
+    Banco.BMG:                     ("61186680000174", "318", ["banco bmg"]),
+}
+
+_ISPB = re.compile(r"ispb\W{0,3}(\d{8})(?!\d)")
+_COMPE = re.compile(r"(?:banco|bco|codigo|cod|compe)\W{0,3}(\d{3})(?!\d)")
+
+
+def _indice_nomes(marcadores: Dict[Banco, tuple]):
+    # Uma única regex com todas as alternativas (as mais longas primeiro) e um dicionário nome -> banco.
+    # Sem \b no início: a regex fica bem mais rápida e a fronteira à esquerda é conferida em _inicio_de_palavra.
+    por_nome = {}
+    for banco, (_, _, nomes) in marcadores.items():
+        for nome in nomes:
+            por_nome[nome] = banco
+    alternativas = sorted(por_nome, key=len, reverse=True)
+    regex = re.compile(r"(" + "|".join(re.escape(nome) for nome in alternativas) + r")\b")
+    return regex, por_nome
+
+
+def _formatar_cnpj(cnpj: str) -> str:
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+_NOMES, _BANCO_POR_NOME = _indice_nomes(MARCADORES_BANCO)
+# Só os CNPJs conhecidos interessam, então basta procurá-los literalmente (com e sem pontuação).
+_CNPJS = [(banco, (cnpj, _formatar_cnpj(cnpj))) for banco, (cnpj, _, _) in MARCADORES_BANCO.items()]
+_BANCO_POR_ISPB = {cnpj[:8]: banco for banco, (cnpj, _, _) in MARCADORES_BANCO.items()}
+_BANCO_POR_COMPE = {compe: banco for banco, (_, compe, _) in MARCADORES_BANCO.items()}
+
+
+def _inicio_de_palavra(texto: str, posicao: int) -> bool:
+    return posicao == 0 or not texto[posicao - 1].isalnum()
+
+
+class EstatisticasBancos:
+    """Quantas vezes o banco saiu do texto e quantas foi preciso recorrer às imagens."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.resolvidos_texto = 0
+        self.fallback_imagens = 0
+
+    def registrar(self, resolvido_por_texto: bool) -> None:
+        with self._lock:
+            if resolvido_por_texto:
+                self.resolvidos_texto += 1
+            else:
+                self.fallback_imagens += 1
+
+    def resumo(self) -> dict:
+        with self._lock:
+            total = self.resolvidos_texto + self.fallback_imagens
+            return {
+                "resolvidos_texto": self.resolvidos_texto,
+                "fallback_imagens": self.fallback_imagens,
+                "taxa_fallback_evitado": self.resolvidos_texto / total if total else 0.0,
+            }
+
+
+estatisticas_bancos = EstatisticasBancos()
+
+
+def _janela(texto: str) -> str:
+    if len(texto) <= 2 * BANCOS_JANELA_CHARS:
+        return texto
+    return texto[:BANCOS_JANELA_CHARS] + "\n" + texto[-BANCOS_JANELA_CHARS:]
+
+
+def _votos(texto: str) -> Dict[Banco, List[int]]:
+    # banco -> [marcadores fortes, marcadores fracos]
+    votos: Dict[Banco, List[int]] = {}
+
+    def votar(banco: Optional[Banco], forte: bool):
+        if banco is not None:
+            votos.setdefault(banco, [0, 0])[0 if forte else 1] += 1
+
+    for banco, formas in _CNPJS:
+        if any(forma in texto for forma in formas):
+            votar(banco, forte=True)
+
+    normalizado = normalizar(texto)
+    if "ispb" in normalizado:
+        for encontrado in _ISPB.finditer(normalizado):
+            if _inicio_de_palavra(normalizado, encontrado.start()):
+                votar(_BANCO_POR_ISPB.get(encontrado.group(1)), forte=True)
+    for encontrado in _COMPE.finditer(normalizado):
+        if _inicio_de_palavra(normalizado, encontrado.start()):
+            votar(_BANCO_POR_COMPE.get(encontrado.group(1)), forte=False)
+    for encontrado in _NOMES.finditer(normalizado):
+        if _inicio_de_palavra(normalizado, encontrado.start()):
+            votar(_BANCO_POR_NOME[encontrado.group(1)], forte=False)
+
+    return votos
+
+
+def identificar_banco_por_texto(texto: str) -> Optional[BancoCandidato]:
+    """Banco do extrato pelos marcadores do texto; None se nada casar ou se houver empate.
+
+    Marcadores fortes (CNPJ, ISPB) decidem antes dos fracos (nome, produto, código COMPE).
+    """
+
+    votos = _votos(_janela(texto))
+    if not votos:
+        return None
+
+    ranking = sorted(votos.items(), key=lambda item: (item[1][0], item[1][1]), reverse=True)
+    banco, (fortes, fracos) = ranking[0]
+    if len(ranking) > 1 and ranking[1][1] == [fortes, fracos]:
+        return None
+
+    return BancoCandidato(banco=banco, score=SCORE_MARCADOR_FORTE if fortes else SCORE_MARCADOR_FRACO)
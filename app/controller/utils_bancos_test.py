@@ -0,0 +1,107 @@
+import asyncio
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+
+from app.controller import utils_bancos, utils_formatar_extrato
+from app.controller.utils_bancos import EstatisticasBancos, identificar_banco_por_texto
+from app.models import Banco, BancoCandidato, Extrato
+
+
+_CABECALHOS = {
+    Banco.ITAU: "Itaú Unibanco S.A. - Extrato Conta Corrente\nAgência 1234 Conta 56789-0",
+    Banco.NUBANK: "Nu Pagamentos S.A. - Instituição de Pagamento\nCNPJ 18.236.120/0001-58",
+    Banco.BANCO_DO_BRASIL: "BANCO DO BRASIL S.A.\nExtrato de conta corrente - Cliente: FULANO",
+    Banco.C6_BANK: "Banco C6 S.A. | Extrato",
+    Banco.CAIXA_ECONOMICA_FEDERAL: "CAIXA ECONÔMICA FEDERAL\nExtrato por período",
+    Banco.SANTANDER: "Extrato Consolidado Inteligente\nBanco 033 - Agência 0001",
+    Banco.INTER: "Instituição: ISPB 00416968\nExtrato da conta",
+}
+
+
+def _extrato_sem_banco():
+    return Extrato(banco=BancoCandidato(banco=Banco.NAO_IDENTIFICADO, score=0.3), extrato=[], data=date(2025, 10, 1))
+
+
+class TestIdentificarBancoPorTexto:
+
+    @pytest.mark.parametrize("banco,texto", list(_CABECALHOS.items()))
+    def test_identifica_pelo_cabecalho(self, banco, texto):
+        candidato = identificar_banco_por_texto(texto + "\n01/10/2025 PIX RECEBIDO -10,00")
+
+        assert candidato.banco == banco
+        assert candidato.score > 0.8
+
+    def test_cnpj_prevalece_sobre_nome_nas_transacoes(self):
+        texto = "CNPJ 60.701.190/0001-04\n01/10/2025 PIX para Fulano - Nubank -10,00\n02/10/2025 TED Nubank -5,00"
+
+        candidato = identificar_banco_por_texto(texto)
+
+        assert candidato.banco == Banco.ITAU
+        assert candidato.score == utils_bancos.SCORE_MARCADOR_FORTE
+
+    def test_meio_do_texto_ignorado(self, monkeypatch):
+        monkeypatch.setattr(utils_bancos, "BANCOS_JANELA_CHARS", 100)
+        transacoes = "\n".join(f"{d:02d}/10/2025 PIX RECEBIDO -10,00" for d in range(1, 28))
+        texto = "EXTRATO\n" + transacoes[:400] + "\nPIX Bradesco\n" + transacoes[400:]
+
+        assert identificar_banco_por_texto(texto) is None
+
+    def test_sem_marcadores_ou_empate(self):
+        assert identificar_banco_por_texto("EXTRATO\n01/10/2025 PIX -10,00") is None
+        assert identificar_banco_por_texto("Santander ... Bradesco") is None
+
+    def test_estatisticas(self):
+        estatisticas = EstatisticasBancos()
+        for resolvido in (True, True, True, False):
+            estatisticas.registrar(resolvido)
+
+        assert estatisticas.resumo() == {"resolvidos_texto": 3, "fallback_imagens": 1, "taxa_fallback_evitado": 0.75}
+
+    def test_extrato_longo_identificado_pelo_cabecalho(self):
+        texto = _CABECALHOS[Banco.ITAU] + "\n" + "\n".join(f"{d % 28 + 1:02d}/10/2025 COMPRA LOJA -{d},00" for d in range(300))
+
+        assert identificar_banco_por_texto(texto).banco == Banco.ITAU
+
+
+class TestFallbackImagens:
+
+    @pytest.fixture
+    def pipeline(self, monkeypatch):
+        estatisticas = EstatisticasBancos()
+        chamadas_imagens = []
+
+        async def fake_imagens(id, extrato):
+            chamadas_imagens.append(id)
+            extrato.banco = BancoCandidato(banco=Banco.OUTRO, score=0.9)
+            return extrato
+
+        monkeypatch.setattr(utils_formatar_extrato, "estatisticas_bancos", estatisticas)
+        monkeypatch.setattr(utils_formatar_extrato, "_identificar_banco_por_imagens", fake_imagens)
+        with patch.object(utils_formatar_extrato.utils_extrato_functions, "get_extrato_estruturado",
+                          lambda texto: _extrato_sem_banco()):
+            yield estatisticas, chamadas_imagens
+
+    def _estruturar(self, texto):
+        async def rodar():
+            return await utils_formatar_extrato._estruturar("job", texto, asyncio.Semaphore(1))
+        return asyncio.run(rodar())
+
+    def test_texto_evita_fallback(self, pipeline):
+        estatisticas, chamadas_imagens = pipeline
+
+        extrato = self._estruturar(_CABECALHOS[Banco.NUBANK])
+
+        assert extrato.banco.banco == Banco.NUBANK
+        assert chamadas_imagens == []
+        assert estatisticas.resumo()["resolvidos_texto"] == 1
+
+    def test_sem_marcador_usa_imagens(self, pipeline):
+        estatisticas, chamadas_imagens = pipeline
+
+        extrato = self._estruturar("EXTRATO\n01/10/2025 PIX -10,00")
+
+        assert extrato.banco.banco == Banco.OUTRO
+        assert chamadas_imagens == ["job"]
+        assert estatisticas.resumo()["fallback_imagens"] == 1
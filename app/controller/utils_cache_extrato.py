@@ -0,0 +1,191 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import threading
+from typing import BinaryIO, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+
+import app.controller.utils_extrato_functions as utils_extrato_functions
+from app.models import Extrato
+from _db import get_db_connection
+
+
+# Backend do cache: "mongo" (padrão, compartilhado entre workers), "memoria" (por processo) ou "desligado".
+CACHE_EXTRATOS = os.getenv("CACHE_EXTRATOS", "mongo").lower()
+CACHE_EXTRATOS_TTL = int(os.getenv("CACHE_EXTRATOS_TTL", str(30 * 24 * 3600)))
+CACHE_EXTRATOS_MAX_ENTRADAS = int(os.getenv("CACHE_EXTRATOS_MAX_ENTRADAS", "5000"))
+COLLECTION_CACHE_EXTRATOS = os.getenv("COLLECTION_CACHE_EXTRATOS", "cache_extratos")
+
+_TAMANHO_BLOCO = 1024 * 1024
+
+
+def calcular_chave(arquivo: BinaryIO) -> str:
+    """SHA-256 do conteúdo do arquivo + modelo/versão do prompt. Devolve o arquivo na posição inicial."""
+
+    sha = hashlib.sha256()
+    arquivo.seek(0)
+    for bloco in iter(lambda: arquivo.read(_TAMANHO_BLOCO), b""):
+        sha.update(bloco)
+    arquivo.seek(0)
+    versao = f"{utils_extrato_functions.MODELO_EXTRATO}:v{utils_extrato_functions.VERSAO_PROMPT_EXTRATO}"
+    return f"{sha.hexdigest()}:{versao}"
+
+
+class EstatisticasCache:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.escritas = 0
+        self.remocoes = 0
+        self.erros = 0
+
+    def incrementar(self, campo: str, quantidade: int = 1) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + quantidade)
+
+    def resumo(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "taxa_hit": self.hits / total if total else 0.0,
+                "escritas": self.escritas,
+                "remocoes": self.remocoes,
+                "erros": self.erros,
+            }
+
+
+class CacheExtratos(ABC):
+    """Interface comum: obter devolve (texto, extrato) ou None; salvar grava o resultado do pipeline."""
+
+    def __init__(self):
+        self.estatisticas = EstatisticasCache()
+
+    def obter(self, chave: str) -> Optional[Tuple[str, Extrato]]:
+        try:
+            resultado = self._obter(chave)
+        except Exception as e:
+            # Falha no cache nunca deve derrubar o upload: conta como miss.
+            print(f"Erro ao consultar cache de extratos: {str(e)}")
+            self.estatisticas.incrementar("erros")
+            resultado = None
+        self.estatisticas.incrementar("hits" if resultado is not None else "misses")
+        return resultado
+
+    def salvar(self, chave: str, texto: str, extrato: Extrato) -> None:
+        try:
+            self._salvar(chave, texto, extrato)
+            self.estatisticas.incrementar("escritas")
+        except Exception as e:
+            print(f"Erro ao gravar cache de extratos: {str(e)}")
+            self.estatisticas.incrementar("erros")
+
+    @abstractmethod
+    def _obter(self, chave: str) -> Optional[Tuple[str, Extrato]]:
+        """(texto, extrato) da chave ou None; exceções contam como miss."""
+
+    @abstractmethod
+    def _salvar(self, chave: str, texto: str, extrato: Extrato) -> None:
+        """Grava o resultado do pipeline na chave."""
+
+
+class CacheMemoria(CacheExtratos):
+    """Cache LRU com TTL em memória, local ao processo."""
+
+    def __init__(self, ttl: int = CACHE_EXTRATOS_TTL, max_entradas: int = CACHE_EXTRATOS_MAX_ENTRADAS):
+        super().__init__()
+        self._ttl = ttl
+        self._max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            texto, extrato_json, expira_em = entrada
+            if expira_em < datetime.now(timezone.utc):
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+        return texto, Extrato.model_validate_json(extrato_json)
+
+    def _salvar(self, chave, texto, extrato):
+        expira_em = datetime.now(timezone.utc) + timedelta(seconds=self._ttl)
+        with self._lock:
+            self._entradas[chave] = (texto, extrato.model_dump_json(), expira_em)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self._max_entradas:
+                self._entradas.popitem(last=False)
+                self.estatisticas.incrementar("remocoes")
+
+
+class CacheMongo(CacheExtratos):
+    """Cache compartilhado entre workers numa coleção do MongoDB.
+
+    A expiração fica a cargo do índice TTL em `expira_em`; o LRU usa `ultimo_acesso`, atualizado a cada hit.
+    """
+
+    def __init__(self, collection, ttl: int = CACHE_EXTRATOS_TTL, max_entradas: int = CACHE_EXTRATOS_MAX_ENTRADAS):
+        super().__init__()
+        self._collection = collection
+        self._ttl = ttl
+        self._max_entradas = max_entradas
+
+    def _obter(self, chave):
+        agora = datetime.now(timezone.utc)
+        # O monitor TTL do Mongo roda a cada ~60s, então a expiração também é checada na consulta.
+        documento = self._collection.find_one_and_update(
+            {"_id": chave, "expira_em": {"$gt": agora}},
+            {"$set": {"ultimo_acesso": agora}},
+            return_document=ReturnDocument.AFTER
+        )
+        if documento is None:
+            return None
+        return documento["texto"], Extrato.model_validate_json(documento["extrato"])
+
+    def _salvar(self, chave, texto, extrato):
+        agora = datetime.now(timezone.utc)
+        self._collection.update_one(
+            {"_id": chave},
+            {"$set": {
+                "texto": texto,
+                "extrato": extrato.model_dump_json(),
+                "ultimo_acesso": agora,
+                "expira_em": agora + timedelta(seconds=self._ttl),
+            }},
+            upsert=True
+        )
+        excedente = self._collection.estimated_document_count() - self._max_entradas
+        if excedente > 0:
+            antigos = self._collection.find({}, {"_id": 1}).sort("ultimo_acesso", ASCENDING).limit(excedente)
+            ids = [documento["_id"] for documento in antigos]
+            resultado = self._collection.delete_many({"_id": {"$in": ids}})
+            self.estatisticas.incrementar("remocoes", resultado.deleted_count)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def obter_cache_extratos() -> Optional[CacheExtratos]:
+    """Instância do cache do processo conforme CACHE_EXTRATOS (None quando desligado)."""
+
+    global _cache
+    if CACHE_EXTRATOS == "desligado":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if CACHE_EXTRATOS == "memoria":
+                    _cache = CacheMemoria()
+                else:
+                    _cache = CacheMongo(get_db_connection()[COLLECTION_CACHE_EXTRATOS])
+    return _cache
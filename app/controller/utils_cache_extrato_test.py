@@ -0,0 +1,168 @@
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from io import BytesIO
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.controller import utils_cache_extrato
+from app.controller.utils_cache_extrato import CacheMemoria, CacheMongo, calcular_chave
+from app.controller.utils_formatar_extrato import formatar_extratos
+from app.models import Banco, BancoCandidato, Extrato, Transferencia, OrigemTransacao, CategoriaGasto
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def _extrato(banco=Banco.ITAU):
+    return Extrato(
+        banco=BancoCandidato(banco=banco, score=0.95),
+        extrato=[
+            Transferencia(
+                valor=-42.5,
+                data=date(2025, 10, 3),
+                origem=OrigemTransacao.PIX,
+                categoria=CategoriaGasto.ALIMENTACAO,
+            )
+        ],
+        data=date(2025, 10, 1),
+    )
+
+
+class TestChave:
+
+    def test_mesmo_conteudo_mesma_chave(self):
+        assert calcular_chave(BytesIO(b"%PDF abc")) == calcular_chave(BytesIO(b"%PDF abc"))
+        assert calcular_chave(BytesIO(b"%PDF abc")) != calcular_chave(BytesIO(b"%PDF abd"))
+
+    def test_chave_muda_com_versao_do_prompt(self):
+        chave = calcular_chave(BytesIO(b"%PDF abc"))
+        with patch("app.controller.utils_extrato_functions.VERSAO_PROMPT_EXTRATO", 999):
+            assert calcular_chave(BytesIO(b"%PDF abc")) != chave
+
+    def test_arquivo_volta_ao_inicio(self):
+        arquivo = BytesIO(b"%PDF abc")
+        calcular_chave(arquivo)
+        assert arquivo.read() == b"%PDF abc"
+
+
+class TestCacheMemoria:
+
+    def test_hit_e_miss(self):
+        cache = CacheMemoria()
+        assert cache.obter("a") is None
+        cache.salvar("a", "texto", _extrato())
+
+        texto, extrato = cache.obter("a")
+
+        assert texto == "texto"
+        assert extrato == _extrato()
+        assert cache.estatisticas.resumo()["hits"] == 1
+        assert cache.estatisticas.resumo()["misses"] == 1
+
+    def test_lru_remove_menos_usado(self):
+        cache = CacheMemoria(max_entradas=2)
+        cache.salvar("a", "a", _extrato())
+        cache.salvar("b", "b", _extrato())
+        cache.obter("a")
+        cache.salvar("c", "c", _extrato())
+
+        assert cache.obter("b") is None
+        assert cache.obter("a") is not None
+        assert cache.estatisticas.remocoes == 1
+
+    def test_ttl(self):
+        cache = CacheMemoria(ttl=0)
+        cache.salvar("a", "a", _extrato())
+        time.sleep(0.01)
+
+        assert cache.obter("a") is None
+
+
+class TestCacheMongo:
+
+    @pytest.fixture
+    def collection(self):
+        return mongomock.MongoClient().db.cache_extratos
+
+    def test_hit_atualiza_ultimo_acesso(self, collection):
+        cache = CacheMongo(collection)
+        cache.salvar("a", "texto", _extrato(Banco.NUBANK))
+        antes = collection.find_one({"_id": "a"})["ultimo_acesso"]
+        time.sleep(0.01)
+
+        texto, extrato = cache.obter("a")
+
+        assert texto == "texto"
+        assert extrato.banco.banco == Banco.NUBANK
+        assert collection.find_one({"_id": "a"})["ultimo_acesso"] > antes
+
+    def test_entrada_expirada_e_miss(self, collection):
+        cache = CacheMongo(collection)
+        cache.salvar("a", "texto", _extrato())
+        collection.update_one({"_id": "a"}, {"$set": {"expira_em": datetime.now(timezone.utc) - timedelta(seconds=1)}})
+
+        assert cache.obter("a") is None
+
+    def test_lru_remove_menos_usados(self, collection):
+        cache = CacheMongo(collection, max_entradas=2)
+        cache.salvar("a", "a", _extrato())
+        time.sleep(0.01)
+        cache.salvar("b", "b", _extrato())
+        time.sleep(0.01)
+        cache.obter("a")
+        time.sleep(0.01)
+        cache.salvar("c", "c", _extrato())
+
+        assert sorted(documento["_id"] for documento in collection.find()) == ["a", "c"]
+
+    def test_erro_no_mongo_vira_miss(self):
+        class ColecaoQuebrada:
+            def find_one_and_update(self, *args, **kwargs):
+                raise RuntimeError("mongo fora do ar")
+
+        cache = CacheMongo(ColecaoQuebrada())
+
+        assert cache.obter("a") is None
+        assert cache.estatisticas.erros == 1
+
+
+class TestFormatarExtratosComCache:
+
+    def test_reenvio_do_mesmo_pdf_nao_chama_parser_nem_llm(self):
+        cache = CacheMemoria()
+        chamadas = []
+
+        class Resposta:
+            status_code = 200
+
+            def __init__(self, payload):
+                self._payload = payload
+
+            def json(self):
+                return self._payload
+
+        def post_extrato_parser(file, file_name="file_name"):
+            chamadas.append("upload")
+            return Resposta({"id": "job"})
+
+        def get_extrato_estruturado(texto):
+            chamadas.append("llm")
+            return _extrato()
+
+        alvo = "app.controller.utils_formatar_extrato.utils_extrato_functions"
+        with patch("app.controller.utils_formatar_extrato.obter_cache_extratos", lambda: cache), \
+             patch(f"{alvo}.post_extrato_parser", post_extrato_parser), \
+             patch(f"{alvo}.get_status_job_parser", lambda id: Resposta({"status": "SUCCESS"})), \
+             patch(f"{alvo}.get_extrato_parser", lambda id: Resposta({"text": "texto"})), \
+             patch(f"{alvo}.get_extrato_estruturado", get_extrato_estruturado):
+            primeiro = asyncio.run(formatar_extratos([BytesIO(b"%PDF mesmo")]))
+            segundo = asyncio.run(formatar_extratos([BytesIO(b"%PDF mesmo")]))
+
+        assert chamadas == ["upload", "llm"]
+        assert primeiro == segundo
+        assert cache.estatisticas.resumo()["hits"] == 1
+
+    def test_cache_desligado(self):
+        with patch.object(utils_cache_extrato, "CACHE_EXTRATOS", "desligado"):
+            assert utils_cache_extrato.obter_cache_extratos() is None
@@ -0,0 +1,71 @@
+import os
+import threading
+from typing import Callable, Dict, Optional
+
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_openai import ChatOpenAI
+
+from app.controller.utils_metricas import registrar_tokens
+
+
+# Parâmetros dos modelos, lidos uma vez. Valores vazios mantêm o padrão do ChatOpenAI.
+OPENAI_MODELO_EXTRATO = os.getenv("OPENAI_MODELO_EXTRATO", "gpt-4o")
+OPENAI_MODELO_BANCO = os.getenv("OPENAI_MODELO_BANCO", "gpt-4o")
+OPENAI_TEMPERATURA = os.getenv("OPENAI_TEMPERATURA")
+OPENAI_TIMEOUT = os.getenv("OPENAI_TIMEOUT")
+OPENAI_MAX_RETRIES = os.getenv("OPENAI_MAX_RETRIES")
+
+_cadeias: Dict[str, Runnable] = {}
+_cadeias_lock = threading.Lock()
+
+
+def criar_modelo(modelo: str) -> ChatOpenAI:
+    """ChatOpenAI com os parâmetros configurados por variável de ambiente."""
+
+    parametros = {"model": modelo}
+    if OPENAI_TEMPERATURA:
+        parametros["temperature"] = float(OPENAI_TEMPERATURA)
+    if OPENAI_TIMEOUT:
+        parametros["timeout"] = float(OPENAI_TIMEOUT)
+    if OPENAI_MAX_RETRIES:
+        parametros["max_retries"] = int(OPENAI_MAX_RETRIES)
+    return ChatOpenAI(**parametros)
+
+
+def saida_estruturada(modelo: ChatOpenAI, schema, nome: str) -> Runnable:
+    """with_structured_output com include_raw: registra os tokens da resposta e devolve só o objeto do schema."""
+
+    def extrair(resposta: dict):
+        registrar_tokens(nome, getattr(resposta["raw"], "usage_metadata", None))
+        if resposta.get("parsing_error") is not None:
+            raise resposta["parsing_error"]
+        return resposta["parsed"]
+
+    return modelo.with_structured_output(schema, include_raw=True) | RunnableLambda(extrair)
+
+
+def obter_cadeia(nome: str, fabrica: Callable[[], Runnable]) -> Runnable:
+    """Devolve a cadeia registrada com esse nome, construindo-a na primeira chamada.
+
+    As cadeias do LangChain não guardam estado entre invocações e o cliente HTTP do ChatOpenAI é
+    thread-safe, então a mesma instância é compartilhada por todas as requisições do processo.
+    """
+
+    cadeia = _cadeias.get(nome)
+    if cadeia is None:
+        with _cadeias_lock:
+            cadeia = _cadeias.get(nome)
+            if cadeia is None:
+                cadeia = fabrica()
+                _cadeias[nome] = cadeia
+    return cadeia
+
+
+def limpar_cadeias(nome: Optional[str] = None) -> None:
+    """Descarta as cadeias construídas (todas ou só a indicada); a próxima chamada reconstrói."""
+
+    with _cadeias_lock:
+        if nome is None:
+            _cadeias.clear()
+        else:
+            _cadeias.pop(nome, None)
@@ -0,0 +1,89 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from unittest.mock import patch
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.controller import utils_cadeias_llm, utils_extrato_functions
+from app.controller.utils_cadeias_llm import limpar_cadeias, obter_cadeia
+from app.models import Banco, BancoCandidato, Extrato
+
+
+
+@pytest.fixture(autouse=True)
+def registro_limpo(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    limpar_cadeias()
+    yield
+    limpar_cadeias()
+
+
+class TestRegistroCadeias:
+
+    def test_cadeia_construida_uma_vez(self):
+        construcoes = []
+
+        def fabrica():
+            construcoes.append(1)
+            return RunnableLambda(lambda x: x)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            cadeias = list(executor.map(lambda _: obter_cadeia("teste", fabrica), range(32)))
+
+        assert len(construcoes) == 1
+        assert all(cadeia is cadeias[0] for cadeia in cadeias)
+
+    def test_limpar_cadeia_reconstroi(self):
+        primeira = obter_cadeia("teste", lambda: RunnableLambda(lambda x: x))
+        limpar_cadeias("teste")
+        segunda = obter_cadeia("teste", lambda: RunnableLambda(lambda x: x))
+
+        assert primeira is not segunda
+
+    def test_parametros_do_modelo_configuraveis(self, monkeypatch):
+        monkeypatch.setattr(utils_cadeias_llm, "OPENAI_TEMPERATURA", "0")
+        monkeypatch.setattr(utils_cadeias_llm, "OPENAI_MAX_RETRIES", "5")
+
+        modelo = utils_cadeias_llm.criar_modelo("gpt-4o-mini")
+
+        assert modelo.model_name == "gpt-4o-mini"
+        assert modelo.temperature == 0
+        assert modelo.max_retries == 5
+
+    def test_get_extrato_estruturado_reusa_cadeia(self):
+        extrato = Extrato(banco=BancoCandidato(banco=Banco.INTER, score=0.9), extrato=[], data=date(2025, 10, 1))
+        construcoes = []
+
+        def fabrica():
+            construcoes.append(1)
+            return RunnableLambda(lambda entrada: extrato)
+
+        with patch.object(utils_extrato_functions, "_criar_cadeia_extrato", fabrica):
+            for _ in range(3):
+                assert utils_extrato_functions.get_extrato_estruturado("texto") == extrato
+
+        assert len(construcoes) == 1
+
+    def test_get_banco_candidato_envia_imagem(self):
+        recebido = []
+
+        def fake_modelo(mensagens):
+            recebido.append(mensagens)
+            return BancoCandidato(banco=Banco.C6_BANK, score=0.95)
+
+        with patch.object(utils_extrato_functions, "_criar_cadeia_banco", lambda: RunnableLambda(fake_modelo)):
+            banco = utils_extrato_functions.get_banco_candidato(b"\x89PNG", file_format="png")
+
+        assert banco.banco == Banco.C6_BANK
+        sistema, humano = recebido[0]
+        assert sistema.content == utils_extrato_functions.PROMPT_BANCO
+        assert humano.content[0]["mime_type"] == "image/png"
+
+    def test_prompt_do_extrato_vai_como_mensagem_de_sistema(self):
+        prompt = utils_extrato_functions._criar_cadeia_extrato().steps[1]
+
+        sistema, humano = prompt.format_messages(extrato="01/10/2025 PIX -1,00")
+
+        assert (sistema.type, sistema.content) == ("system", utils_extrato_functions.PROMPT_EXTRATO)
+        assert (humano.type, humano.content) == ("human", "01/10/2025 PIX -1,00")
@@ -0,0 +1,193 @@
+from collections import Counter
+from datetime import date
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+from app.models import CategoriaGasto, OrigemTransacao, Transferencia
+
+
+# Pré-classificador local: aplica as mesmas regras de palavra-chave do prompt às linhas de transação
+# sem ambiguidade e só manda para a LLM o que sobrar (cabeçalho e linhas ambíguas).
+EXTRATO_PRECLASSIFICADOR = os.getenv("EXTRATO_PRECLASSIFICADOR", "True").lower() == "true"
+
+_DATA = re.compile(r"(?<!\d)(\d{2})/(\d{2})(?:/(\d{4}|\d{2}))?(?![\d/])")
+_VALOR = re.compile(r"(?<![\d.,])(-\s?)?(?:R\$\s?)?(-\s?)?(\d{1,3}(?:\.\d{3})+|\d+),(\d{2})(?![\d,])(?:\s?([CD])\b)?")
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+PALAVRAS_ORIGEM: Dict[str, OrigemTransacao] = {
+    "pix": OrigemTransacao.PIX,
+    "estorno": OrigemTransacao.ESTORNO,
+    "ted": OrigemTransacao.TRANSFERENCIA,
+    "transferencia": OrigemTransacao.TRANSFERENCIA,
+    "saque": OrigemTransacao.SAQUE,
+    "deposito": OrigemTransacao.DEPOSITO,
+    "boleto": OrigemTransacao.PAGAMENTO_BOLETO,
+    "compra cartao": OrigemTransacao.COMPRA_CARTAO,
+    "compra com cartao": OrigemTransacao.COMPRA_CARTAO,
+    "compra no debito": OrigemTransacao.COMPRA_CARTAO,
+}
+
+PALAVRAS_CATEGORIA: Dict[str, CategoriaGasto] = {
+    "aluguel": CategoriaGasto.MORADIA,
+    "condominio": CategoriaGasto.MORADIA,
+    "imobiliaria": CategoriaGasto.MORADIA,
+    "supermercado": CategoriaGasto.ALIMENTACAO,
+    "mercado": CategoriaGasto.ALIMENTACAO,
+    "restaurante": CategoriaGasto.ALIMENTACAO,
+    "ifood": CategoriaGasto.ALIMENTACAO,
+    "acai": CategoriaGasto.ALIMENTACAO,
+    "uber": CategoriaGasto.TRANSPORTE,
+    "99app": CategoriaGasto.TRANSPORTE,
+    "99 pop": CategoriaGasto.TRANSPORTE,
+    "gasolina": CategoriaGasto.TRANSPORTE,
+    "posto": CategoriaGasto.TRANSPORTE,
+    "onibus": CategoriaGasto.TRANSPORTE,
+    "metro": CategoriaGasto.TRANSPORTE,
+    "farmacia": CategoriaGasto.SAUDE,
+    "drogaria": CategoriaGasto.SAUDE,
+    "hospital": CategoriaGasto.SAUDE,
+    "clinica": CategoriaGasto.SAUDE,
+    "laboratorio": CategoriaGasto.SAUDE,
+    "escola": CategoriaGasto.EDUCACAO,
+    "faculdade": CategoriaGasto.EDUCACAO,
+    "curso": CategoriaGasto.EDUCACAO,
+    "colegial": CategoriaGasto.EDUCACAO,
+    "cinema": CategoriaGasto.LAZER,
+    "streaming": CategoriaGasto.LAZER,
+    "show": CategoriaGasto.LAZER,
+    "bar": CategoriaGasto.LAZER,
+    "netflix": CategoriaGasto.LAZER,
+    "spotify": CategoriaGasto.LAZER,
+    "imposto": CategoriaGasto.IMPOSTOS,
+    "darf": CategoriaGasto.IMPOSTOS,
+    "irpf": CategoriaGasto.IMPOSTOS,
+    "taxa": CategoriaGasto.IMPOSTOS,
+}
+
+_FIM = "__valor__"
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas e sem acentos, para comparar com as palavras-chave."""
+    return unicodedata.normalize("NFKD", texto.lower()).encode("ascii", "ignore").decode("ascii")
+
+
+class TriePalavras:
+    """Trie por palavra: encontra palavras-chave (inclusive compostas, ex. "compra com cartao") numa lista de tokens."""
+
+    def __init__(self, palavras: Dict[str, object]):
+        self._raiz = {}
+        for chave, valor in palavras.items():
+            no = self._raiz
+            for token in _TOKEN.findall(normalizar(chave)):
+                no = no.setdefault(token, {})
+            no[_FIM] = valor
+
+    def encontrar(self, tokens: List[str]) -> set:
+        encontrados = set()
+        for inicio in range(len(tokens)):
+            no = self._raiz
+            for token in tokens[inicio:]:
+                no = no.get(token)
+                if no is None:
+                    break
+                if _FIM in no:
+                    encontrados.add(no[_FIM])
+        return encontrados
+
+
+_TRIE_ORIGEM = TriePalavras(PALAVRAS_ORIGEM)
+_TRIE_CATEGORIA = TriePalavras(PALAVRAS_CATEGORIA)
+
+
+class PreClassificacao(BaseModel):
+
+    transferencias: List[Transferencia]
+    texto_residual: str
+    linhas_resolvidas: int
+    linhas_total: int
+
+
+def _ano_predominante(texto: str) -> Optional[int]:
+    anos = Counter(int(ano) for _, _, ano in _DATA.findall(texto) if len(ano) == 4)
+    return anos.most_common(1)[0][0] if anos else None
+
+
+def classificar_linha(linha: str, ano_padrao: Optional[int] = None) -> Optional[Transferencia]:
+    """Transferência da linha se todas as regras forem inequívocas; None se a linha precisar da LLM.
+
+    Exige exatamente uma data, exatamente um valor (linhas com saldo ao lado ficam para a LLM),
+    uma única origem e uma única categoria pelas palavras-chave.
+    """
+
+    datas = _DATA.findall(linha)
+    valores = list(_VALOR.finditer(linha))
+    if len(datas) != 1 or len(valores) != 1:
+        return None
+
+    descricao = _VALOR.sub(" ", _DATA.sub(" ", linha))
+    tokens = _TOKEN.findall(normalizar(descricao))
+    origens = _TRIE_ORIGEM.encontrar(tokens)
+    categorias = _TRIE_CATEGORIA.encontrar(tokens)
+    if len(origens) != 1 or len(categorias) != 1:
+        return None
+
+    dia, mes, ano = datas[0]
+    if not ano:
+        if ano_padrao is None:
+            return None
+        ano = ano_padrao
+    elif len(ano) == 2:
+        ano = 2000 + int(ano)
+    try:
+        data = date(int(ano), int(mes), int(dia))
+    except ValueError:
+        return None
+
+    valor = valores[0]
+    sinal_antes, sinal_depois, inteiro, centavos, credito_debito = valor.groups()
+    numero = float(f"{inteiro.replace('.', '')}.{centavos}")
+    if sinal_antes or sinal_depois or credito_debito == "D":
+        numero = -numero
+
+    return Transferencia(valor=numero, data=data, origem=origens.pop(), categoria=categorias.pop())
+
+
+def preclassificar(texto: str) -> PreClassificacao:
+    """Separa as linhas resolvidas pelas regras das que precisam ir para a LLM."""
+
+    ano_padrao = _ano_predominante(texto)
+    transferencias = []
+    residuais = []
+    linhas_total = 0
+    for linha in texto.split("\n"):
+        if not linha.strip():
+            residuais.append(linha)
+            continue
+        linhas_total += 1
+        transferencia = classificar_linha(linha, ano_padrao)
+        if transferencia is None:
+            residuais.append(linha)
+        else:
+            transferencias.append(transferencia)
+
+    return PreClassificacao(
+        transferencias=transferencias,
+        texto_residual="\n".join(residuais),
+        linhas_resolvidas=len(transferencias),
+        linhas_total=linhas_total,
+    )
+
+
+def mes_predominante(transferencias: List[Transferencia]) -> Optional[date]:
+    """Primeiro dia do mês mais frequente entre as transferências."""
+
+    meses = Counter((t.data.year, t.data.month) for t in transferencias)
+    if not meses:
+        return None
+    ano, mes = meses.most_common(1)[0][0]
+    return date(ano, mes, 1)
@@ -0,0 +1,147 @@
+from datetime import date
+import random
+from unittest.mock import patch
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.controller import utils_classificador, utils_extrato_functions
+from app.controller.utils_cadeias_llm import limpar_cadeias
+from app.controller.utils_classificador import TriePalavras, classificar_linha, mes_predominante, preclassificar
+from app.models import Banco, BancoCandidato, CategoriaGasto, Extrato, OrigemTransacao
+
+
+N_LINHAS = 5000
+
+_INEQUIVOCAS = [
+    "PIX ENVIADO UBER DO BRASIL",
+    "COMPRA CARTAO DROGARIA SAO PAULO",
+    "COMPRA CARTAO SUPERMERCADO EXTRA",
+    "BOLETO ALUGUEL IMOBILIARIA",
+    "PIX NETFLIX",
+    "BOLETO DARF IRPF",
+]
+_AMBIGUAS = [
+    "PIX RECEBIDO MARIA SILVA",
+    "COMPRA LOJA 123",
+    "TED UBER FARMACIA",
+    "SALDO DO DIA",
+]
+
+
+def _extrato_sintetico(n_linhas, seed=42):
+    aleatorio = random.Random(seed)
+    linhas = ["BANCO ITAU S.A. - EXTRATO DE CONTA CORRENTE", "AGÊNCIA 0001 CONTA 12345-6"]
+    for _ in range(n_linhas):
+        descricao = aleatorio.choice(_INEQUIVOCAS * 3 + _AMBIGUAS)
+        dia = aleatorio.randint(1, 28)
+        reais = f"{aleatorio.randint(1, 5000):,d}".replace(",", ".")
+        linhas.append(f"{dia:02d}/10/2025 {descricao} -{reais},{aleatorio.randint(0, 99):02d}")
+    return "\n".join(linhas)
+
+
+class TestClassificarLinha:
+
+    def test_linha_inequivoca(self):
+        transferencia = classificar_linha("05/10/2025 PIX ENVIADO UBER DO BRASIL -23,90")
+
+        assert transferencia.data == date(2025, 10, 5)
+        assert transferencia.valor == -23.90
+        assert transferencia.origem == OrigemTransacao.PIX
+        assert transferencia.categoria == CategoriaGasto.TRANSPORTE
+
+    def test_acentos_e_valor_com_milhar(self):
+        transferencia = classificar_linha("10/10/2025 Compra com cartão Farmácia Popular R$ 1.234,56 D")
+
+        assert transferencia.valor == -1234.56
+        assert transferencia.origem == OrigemTransacao.COMPRA_CARTAO
+        assert transferencia.categoria == CategoriaGasto.SAUDE
+
+    def test_credito_positivo_e_ano_padrao(self):
+        transferencia = classificar_linha("03/10 ESTORNO IFOOD 45,00", ano_padrao=2025)
+
+        assert transferencia.data == date(2025, 10, 3)
+        assert transferencia.valor == 45.0
+        assert transferencia.origem == OrigemTransacao.ESTORNO
+
+    @pytest.mark.parametrize("linha", [
+        "05/10/2025 PIX RECEBIDO MARIA -10,00",        # sem categoria
+        "05/10/2025 UBER -10,00",                      # sem origem
+        "05/10/2025 TED UBER FARMACIA -10,00",         # duas categorias
+        "05/10/2025 PIX UBER -10,00 1.500,00",         # valor e saldo
+        "05/10/2025 06/10/2025 PIX UBER -10,00",       # duas datas
+        "31/02/2025 PIX UBER -10,00",                  # data inválida
+        "05/10 PIX UBER -10,00",                       # sem ano
+    ])
+    def test_linhas_ambiguas_ficam_para_llm(self, linha):
+        assert classificar_linha(linha) is None
+
+    def test_trie_palavras_compostas(self):
+        trie = TriePalavras({"compra com cartao": 1, "compra": 2})
+
+        assert trie.encontrar(["compra", "com", "cartao", "x"]) == {1, 2}
+        assert trie.encontrar(["com", "cartao"]) == set()
+
+
+class TestPreclassificar:
+
+    def test_separa_resolvidas_do_residual(self):
+        texto = "BANCO ITAU\n01/10/2025 PIX UBER -10,00\n02/10/2025 PIX MARIA -5,00\n\n03/10 BOLETO ALUGUEL -1.500,00"
+
+        pre = preclassificar(texto)
+
+        assert pre.linhas_resolvidas == 2
+        assert pre.linhas_total == 4
+        assert "UBER" not in pre.texto_residual and "ALUGUEL" not in pre.texto_residual
+        assert "BANCO ITAU" in pre.texto_residual and "PIX MARIA" in pre.texto_residual
+        assert pre.transferencias[1].data == date(2025, 10, 3)
+
+    def test_mes_predominante(self):
+        pre = preclassificar("30/09/2025 PIX UBER -1,00\n01/10/2025 PIX UBER -1,00\n02/10/2025 PIX UBER -1,00")
+
+        assert mes_predominante(pre.transferencias) == date(2025, 10, 1)
+        assert mes_predominante([]) is None
+
+
+class TestIntegracaoLLM:
+
+    @pytest.fixture
+    def llm_eco(self):
+        recebido = []
+
+        def extrato(entrada):
+            recebido.append(entrada["extrato"])
+            return Extrato(banco=BancoCandidato(banco=Banco.ITAU, score=0.9), extrato=[], data=date(2025, 9, 1))
+
+        limpar_cadeias()
+        with patch.object(utils_extrato_functions, "_criar_cadeia_extrato", lambda: RunnableLambda(extrato)):
+            yield recebido
+        limpar_cadeias()
+
+    def test_llm_recebe_apenas_residual(self, llm_eco):
+        texto = "BANCO ITAU\n01/10/2025 PIX UBER -10,00\n02/10/2025 PIX MARIA -5,00"
+
+        extrato = utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert llm_eco == ["BANCO ITAU\n02/10/2025 PIX MARIA -5,00"]
+        assert [t.valor for t in extrato.extrato] == [-10.0]
+        assert extrato.data == date(2025, 10, 1)
+
+    def test_desligado_envia_texto_inteiro(self, llm_eco):
+        texto = "BANCO ITAU\n01/10/2025 PIX UBER -10,00"
+
+        with patch.object(utils_classificador, "EXTRATO_PRECLASSIFICADOR", False):
+            utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert llm_eco == [texto]
+
+
+def test_extrato_sintetico():
+    """Milhares de linhas: a maioria é classificada localmente e o texto enviado à LLM encolhe."""
+    texto = _extrato_sintetico(N_LINHAS)
+
+    pre = preclassificar(texto)
+
+    assert pre.linhas_total >= N_LINHAS
+    assert pre.linhas_resolvidas > N_LINHAS * 0.6
+    assert len(pre.texto_residual) < len(texto) * 0.5
@@ -0,0 +1,149 @@
+from datetime import date, datetime
+import os
+from typing import Optional, Union
+
+from pymongo.errors import DuplicateKeyError
+
+
+# Datas são gravadas como tipos nativos: fatura.mes_ano é o inteiro YYYYMM e as datas de extratos e
+# transferências são datetime. Os textos "MM/YYYY" e "DD/MM/YYYY" só existem na borda da API.
+# Faturas gravadas antes da mudança ainda têm os textos; enquanto LER_DATAS_LEGADAS estiver ligado, os
+# filtros por mês também casam o formato antigo. Desligue depois de rodar "flask migrar-datas".
+LER_DATAS_LEGADAS = os.getenv("LER_DATAS_LEGADAS", "True").lower() == "true"
+
+# Em comparações do MongoDB, qualquer texto é menor que qualquer data (ordem dos tipos BSON): um campo
+# >= DATA_MINIMA é datetime, senão é o texto legado. Usado nos pipelines, onde não há $type no mongomock.
+DATA_MINIMA = datetime(1, 1, 1)
+
+DataArmazenada = Union[datetime, date, str, None]
+
+
+def mes_ano_int(valor: Union[int, str, date]) -> int:
+    """YYYYMM a partir do inteiro, do texto legado "MM/YYYY" ou de uma data."""
+
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, date):
+        return valor.year * 100 + valor.month
+    try:
+        mes, ano = valor.split("/")
+        mes, ano = int(mes), int(ano)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Mês inválido: '{valor}'. Use o formato MM/YYYY")
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mês inválido: '{valor}'. Use o formato MM/YYYY")
+    return ano * 100 + mes
+
+
+def mes_ano_texto(valor: Union[int, str, date, None]) -> Optional[str]:
+    """ "MM/YYYY" (formato da API) a partir de qualquer representação aceita por mes_ano_int."""
+
+    if valor is None:
+        return None
+    numero = mes_ano_int(valor)
+    return f"{numero % 100:02d}/{numero // 100}"
+
+
+def data_datetime(valor: DataArmazenada) -> Optional[datetime]:
+    """datetime a partir do valor gravado: datetime, date, "DD/MM/YYYY" ou "MM/YYYY" (dia 1).
+
+    Parse manual: strptime é bem mais lento e isto roda uma vez por transferência lida.
+    """
+
+    if isinstance(valor, datetime):
+        return valor
+    if isinstance(valor, date):
+        return datetime(valor.year, valor.month, valor.day)
+    try:
+        partes = valor.split("/")
+        if len(partes) == 2:
+            return datetime(int(partes[1]), int(partes[0]), 1)
+        dia, mes, ano = partes
+        return datetime(int(ano), int(mes), int(dia))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def data_texto(valor: DataArmazenada) -> Optional[str]:
+    """ "DD/MM/YYYY" (formato da API); textos já formatados passam direto."""
+
+    if isinstance(valor, date):
+        return valor.strftime("%d/%m/%Y")
+    return valor
+
+
+def transferencia_para_api(transferencia: dict) -> dict:
+    return {**transferencia, "data": data_texto(transferencia.get("data"))}
+
+
+def extrato_para_api(extrato: dict) -> dict:
+    """Extrato no formato de sempre da API: data "MM/YYYY" e transferências com "DD/MM/YYYY"."""
+
+    formatado = dict(extrato)
+    if isinstance(extrato.get("data"), date):
+        formatado["data"] = mes_ano_texto(extrato["data"])
+    if "transferencias" in extrato:
+        formatado["transferencias"] = [transferencia_para_api(t) for t in extrato["transferencias"]]
+    return formatado
+
+
+def fatura_para_api(fatura: dict) -> dict:
+    formatada = dict(fatura)
+    if fatura.get("mes_ano") is not None:
+        formatada["mes_ano"] = mes_ano_texto(fatura["mes_ano"])
+    if "extratos" in fatura:
+        formatada["extratos"] = [extrato_para_api(extrato) for extrato in fatura["extratos"]]
+    return formatada
+
+
+def migrar_fatura(fatura: dict) -> dict:
+    """$set que converte uma fatura do formato legado (mes_ano e datas em texto) para o nativo."""
+
+    def converter(valor):
+        # Texto que não é data fica como está, em vez de virar None.
+        return data_datetime(valor) or valor
+
+    extratos = []
+    for extrato in fatura.get("extratos", []):
+        convertido = {**extrato, "data": converter(extrato.get("data"))}
+        if "transferencias" in extrato:
+            convertido["transferencias"] = [{**t, "data": converter(t.get("data"))} for t in extrato["transferencias"]]
+        extratos.append(convertido)
+    return {"mes_ano": mes_ano_int(fatura["mes_ano"]), "extratos": extratos}
+
+
+def migrar_datas(faturas_collection, transferencias_collection=None, tentativas: int = 3) -> dict:
+    """Converte as faturas com mes_ano em texto (e suas datas) para o formato nativo.
+
+    Cada fatura é regravada só se o número de extratos não mudou desde a leitura; se um upload entrou
+    no meio, ela é lida de novo. As que não puderem ser convertidas (já existe a fatura do mesmo usuário
+    e mês no formato novo, ou as tentativas acabaram) ficam em "conflitos". Idempotente: pode ser
+    interrompida e rodada de novo.
+    """
+
+    relatorio = {"faturas": 0, "conflitos": [], "transferencias": 0}
+    for fatura_id in faturas_collection.distinct("_id", {"mes_ano": {"$type": "string"}}):
+        convertida = False
+        for _ in range(tentativas):
+            fatura = faturas_collection.find_one({"_id": fatura_id, "mes_ano": {"$type": "string"}})
+            if fatura is None:
+                # Convertida (ou removida) por outro processo.
+                convertida = True
+                break
+            filtro = {"_id": fatura_id, "mes_ano": fatura["mes_ano"], "extratos": {"$size": len(fatura.get("extratos", []))}}
+            try:
+                if faturas_collection.update_one(filtro, {"$set": migrar_fatura(fatura)}).matched_count:
+                    relatorio["faturas"] += 1
+                    convertida = True
+                    break
+            except DuplicateKeyError:
+                break
+        if not convertida:
+            relatorio["conflitos"].append(str(fatura_id))
+
+    if transferencias_collection is not None:
+        # A coleção de transferências já grava datetime; só mes_ano pode estar em texto.
+        for mes_ano in transferencias_collection.distinct("mes_ano", {"mes_ano": {"$type": "string"}}):
+            resultado = transferencias_collection.update_many({"mes_ano": mes_ano}, {"$set": {"mes_ano": mes_ano_int(mes_ano)}})
+            relatorio["transferencias"] += resultado.modified_count
+    return relatorio
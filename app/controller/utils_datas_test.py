@@ -0,0 +1,174 @@
+from datetime import date, datetime
+import os
+
+import pytest
+from bson import ObjectId
+
+from app.controller import utils_listagem_faturas
+from app.controller.utils_datas import (
+    data_datetime,
+    extrato_para_api,
+    fatura_para_api,
+    mes_ano_int,
+    mes_ano_texto,
+    migrar_datas,
+)
+from app.controller.utils_indices import Indice, garantir_indices, indices_transferencias
+from app.controller.utils_listagem_faturas import listar_faturas
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.models import BancoCandidato, Banco, CategoriaGasto, Extrato, OrigemTransacao, Transferencia
+
+mongomock = pytest.importorskip("mongomock")
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+# Teste de explain: precisa de um mongod de verdade (o mongomock não tem planos de execução).
+MONGO_URI_TESTES = os.getenv("MONGO_URI_TESTES")
+
+
+def _fatura_legada(mes, ano, user_id=USER_ID):
+    return {
+        "user_id": user_id,
+        "mes_ano": f"{mes:02d}/{ano}",
+        "extratos": [{"banco": "NUBANK", "data": f"{mes:02d}/{ano}", "_id": str(ObjectId()), "transferencias": [
+            {"valor": -10.0, "data": f"05/{mes:02d}/{ano}", "origem": "PIX", "categoria": "Outros"},
+        ]}],
+    }
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+class TestConversoes:
+
+    def test_mes_ano(self):
+        assert mes_ano_int("03/2025") == mes_ano_int(date(2025, 3, 9)) == mes_ano_int(202503) == 202503
+        assert mes_ano_texto(202503) == mes_ano_texto("03/2025") == "03/2025"
+        with pytest.raises(ValueError):
+            mes_ano_int("13/2025")
+
+    def test_data_compativel(self):
+        assert data_datetime("05/03/2025") == data_datetime(date(2025, 3, 5)) == datetime(2025, 3, 5)
+        assert data_datetime("03/2025") == datetime(2025, 3, 1)
+        assert data_datetime("ontem") is None
+
+    def test_to_dict_grava_datas_nativas_e_api_mantem_formato(self):
+        extrato = Extrato(
+            banco=BancoCandidato(banco=Banco.NUBANK, score=0.9),
+            extrato=[Transferencia(valor=-5.0, data=date(2025, 3, 7), origem=OrigemTransacao.PIX,
+                                   categoria=CategoriaGasto.LAZER)],
+            data=date(2025, 3, 1),
+        ).to_dict()
+
+        assert extrato["data"] == datetime(2025, 3, 1)
+        assert extrato["transferencias"][0]["data"] == datetime(2025, 3, 7)
+        api = extrato_para_api(extrato)
+        assert api["data"] == "03/2025"
+        assert api["transferencias"][0]["data"] == "07/03/2025"
+
+    def test_fatura_para_api(self):
+        fatura = {"mes_ano": 202503, "extratos": [{"data": datetime(2025, 3, 1), "transferencias": []}]}
+        assert fatura_para_api(fatura) == {"mes_ano": "03/2025", "extratos": [{"data": "03/2025", "transferencias": []}]}
+
+
+class TestMigracaoDatas:
+
+    def test_migra_e_api_continua_igual(self, db):
+        garantir_indices(db, [Indice("faturas", [("user_id", 1), ("mes_ano", 1)], unique=True)])
+        for mes in (11, 12):
+            db.faturas.insert_one(_fatura_legada(mes, 2024))
+        antes, _ = listar_faturas(db.faturas, USER_ID, {"incluir_extratos": "true"})
+
+        primeira = migrar_datas(db.faturas)
+        segunda = migrar_datas(db.faturas)
+
+        assert (primeira["faturas"], segunda["faturas"]) == (2, 0)
+        fatura = db.faturas.find_one({"mes_ano": 202412})
+        assert fatura["extratos"][0]["data"] == datetime(2024, 12, 1)
+        assert fatura["extratos"][0]["transferencias"][0]["data"] == datetime(2024, 12, 5)
+        depois, _ = listar_faturas(db.faturas, USER_ID, {"incluir_extratos": "true"})
+        assert depois == antes
+
+    def test_conflito_com_fatura_no_formato_novo(self, db):
+        garantir_indices(db, [Indice("faturas", [("user_id", 1), ("mes_ano", 1)], unique=True)])
+        legada = db.faturas.insert_one(_fatura_legada(10, 2025)).inserted_id
+        db.faturas.insert_one({"user_id": USER_ID, "mes_ano": 202510, "extratos": []})
+
+        relatorio = migrar_datas(db.faturas)
+
+        assert relatorio["conflitos"] == [str(legada)]
+        assert db.faturas.find_one({"_id": legada})["mes_ano"] == "10/2025"
+
+    def test_migra_mes_ano_da_colecao_de_transferencias(self, db):
+        db.transferencias.insert_many([{"mes_ano": "10/2025"}, {"mes_ano": "10/2025"}, {"mes_ano": 202511}])
+
+        relatorio = migrar_datas(db.faturas, db.transferencias)
+
+        assert relatorio["transferencias"] == 2
+        assert sorted(d["mes_ano"] for d in db.transferencias.find()) == [202510, 202510, 202511]
+
+
+class TestFiltroPorMes:
+
+    def test_faixa_casa_faturas_novas_e_legadas(self, db):
+        user_obj_id = db.usuarios.insert_one({"faturas": []}).inserted_id
+        db.faturas.insert_one(_fatura_legada(1, 2025, str(user_obj_id)))
+        for mes in (2, 3, 4):
+            salvar_extratos(db.usuarios, db.faturas, user_obj_id, [{"banco": "ITAU", "data": datetime(2025, mes, 1), "transferencias": []}])
+
+        faturas, _ = listar_faturas(db.faturas, str(user_obj_id), {"from": "01/2025", "to": "03/2025"})
+
+        assert sorted(f["mes_ano"] for f in faturas) == ["01/2025", "02/2025", "03/2025"]
+
+    def test_sem_leitura_legada_usa_so_a_faixa(self, db, monkeypatch):
+        monkeypatch.setattr(utils_listagem_faturas, "LER_DATAS_LEGADAS", False)
+        db.faturas.insert_many([_fatura_legada(1, 2025), {"user_id": USER_ID, "mes_ano": 202502, "extratos": []}])
+
+        assert utils_listagem_faturas.filtro_mes_ano("01/2025", "03/2025") == {"mes_ano": {"$gte": 202501, "$lte": 202503}}
+        faturas, _ = listar_faturas(db.faturas, USER_ID, {"from": "01/2025", "to": "03/2025"})
+        assert [f["mes_ano"] for f in faturas] == ["02/2025"]
+
+
+def _estagios(plano: dict):
+    yield plano
+    for chave in ("inputStage", "queryPlan"):
+        if chave in plano:
+            yield from _estagios(plano[chave])
+    for filho in plano.get("inputStages", []):
+        yield from _estagios(filho)
+
+
+def _indice_usado(explain: dict):
+    plano = explain["queryPlanner"]["winningPlan"]
+    return next((estagio.get("indexName") for estagio in _estagios(plano) if estagio.get("stage") == "IXSCAN"), None)
+
+
+@pytest.mark.skipif(not MONGO_URI_TESTES, reason="defina MONGO_URI_TESTES para rodar contra um mongod")
+def test_consultas_por_faixa_usam_indice():
+    from pymongo import MongoClient
+
+    cliente = MongoClient(MONGO_URI_TESTES, serverSelectionTimeoutMS=2000)
+    db = cliente[f"teste_datas_{ObjectId()}"]
+    try:
+        garantir_indices(db, [Indice("faturas", [("user_id", 1), ("mes_ano", 1)], unique=True)] + [
+            Indice("transferencias", indice.chaves, **indice.opcoes) for indice in indices_transferencias()])
+        db.faturas.insert_many([{"user_id": USER_ID, "mes_ano": 202400 + mes, "extratos": []} for mes in range(1, 13)])
+        db.transferencias.insert_many([
+            {"user_id": USER_ID, "fatura_id": ObjectId(), "extrato_id": "e", "indice": i,
+             "data": datetime(2024, i % 12 + 1, 1), "categoria": "Outros", "valor": -1.0}
+            for i in range(100)
+        ])
+
+        faturas = db.faturas.find({"user_id": USER_ID, "mes_ano": {"$gte": 202403, "$lte": 202406}}).explain()
+        transferencias = db.transferencias.find(
+            {"user_id": USER_ID, "data": {"$gte": datetime(2024, 3, 1), "$lt": datetime(2024, 7, 1)}}).explain()
+        por_categoria = db.transferencias.find(
+            {"user_id": USER_ID, "categoria": "Outros", "data": {"$gte": datetime(2024, 3, 1)}}).explain()
+
+        assert _indice_usado(faturas) == "user_id_1_mes_ano_1"
+        assert _indice_usado(transferencias) == "user_id_1_data_1"
+        assert _indice_usado(por_categoria) == "user_id_1_categoria_1_data_1"
+    finally:
+        cliente.drop_database(db.name)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.controller.utils_datas import data_datetime, mes_ano_int
+from app.controller.utils_resumo import calcular_resumo, para_incremento
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.controller.utils_transferencias import RepositorioEmbutido
+
+
+# O que fazer com um extrato já enviado antes (mesma impressão digital): "pular" (padrão) não grava de
+# novo, "substituir" grava o novo e remove o antigo, "desligado" grava sempre. Também pode ser pedido por
+# requisição com ?duplicados=pular|substituir|desligado.
+DEDUPLICACAO_EXTRATOS = os.getenv("DEDUPLICACAO_EXTRATOS", "pular").lower()
+MODOS_DEDUPLICACAO = ("pular", "substituir", "desligado")
+
+ACAO_IGNORADO = "ignorado"
+ACAO_SUBSTITUIDO = "substituido"
+
+
+def modo_deduplicacao(modo: Optional[str] = None) -> str:
+    """Modo pedido (ou o padrão DEDUPLICACAO_EXTRATOS). Lança ValueError se não for um dos conhecidos."""
+
+    modo = (modo or DEDUPLICACAO_EXTRATOS).lower()
+    if modo not in MODOS_DEDUPLICACAO:
+        raise ValueError(f"duplicados deve ser um de: {', '.join(MODOS_DEDUPLICACAO)}")
+    return modo
+
+
+def _chave_transferencia(transferencia: dict) -> str:
+    # Valor em centavos e data normalizada: o mesmo lançamento gera a mesma chave em qualquer formato gravado.
+    data = data_datetime(transferencia.get("data"))
+    return "|".join((
+        f"{float(transferencia.get('valor') or 0):.2f}",
+        data.strftime("%Y-%m-%d") if data else str(transferencia.get("data")),
+        str(transferencia.get("origem")),
+        str(transferencia.get("categoria")),
+    ))
+
+
+def impressao_digital(extrato: dict) -> str:
+    """SHA-256 de banco, mês e das transferências ordenadas: não depende da ordem dos lançamentos nem do _id."""
+
+    sha = hashlib.sha256(f"{extrato.get('banco')}|{mes_ano_int(extrato['data'])}".encode())
+    for chave in sorted(_chave_transferencia(t) for t in extrato.get("transferencias", [])):
+        sha.update(b"\n" + chave.encode())
+    return sha.hexdigest()
+
+
+def encontrar_duplicados(faturas_collection, user_id: str, impressoes: List[str]) -> Dict[str, Tuple[ObjectId, Optional[str]]]:
+    """impressão digital -> (fatura_id, extrato_id) dos extratos já gravados, numa consulta só.
+
+    O índice (user_id, extratos.impressao_digital) encontra as faturas; a projeção traz só _id e impressão
+    digital de cada extrato, nunca as transferências.
+    """
+
+    procuradas = set(impressoes)
+    encontrados = {}
+    cursor = faturas_collection.find(
+        {"user_id": user_id, "extratos.impressao_digital": {"$in": list(procuradas)}},
+        {"extratos._id": 1, "extratos.impressao_digital": 1},
+    )
+    for fatura in cursor:
+        for extrato in fatura.get("extratos", []):
+            if extrato.get("impressao_digital") in procuradas:
+                encontrados[extrato["impressao_digital"]] = (fatura["_id"], extrato.get("_id"))
+    return encontrados
+
+
+def remover_extratos(users_collection, faturas_collection, user_id_obj: ObjectId,
+                     removidos: List[Tuple[ObjectId, str, dict]], repositorio=None) -> None:
+    """Tira extratos (fatura_id, extrato_id, conteúdo) das faturas, descontando-os dos resumos."""
+
+    repositorio = repositorio or RepositorioEmbutido(faturas_collection)
+    operacoes = []
+    for fatura_id, extrato_id, extrato in removidos:
+        desconto = {caminho: -valor for caminho, valor in para_incremento(calcular_resumo([extrato])).items()}
+        operacoes.append(UpdateOne({"_id": fatura_id}, {"$pull": {"extratos": {"_id": extrato_id}}, "$inc": desconto}))
+        repositorio.remover(fatura_id, extrato_id)
+    faturas_collection.bulk_write(operacoes, ordered=False)
+
+    desconto_usuario = {caminho: -valor for caminho, valor in
+                        para_incremento(calcular_resumo([extrato for _, _, extrato in removidos])).items()}
+    users_collection.update_one({"_id": user_id_obj}, {"$inc": {**desconto_usuario, "versao_analise": 1}})
+
+
+def salvar_sem_duplicados(users_collection, faturas_collection, user_id_obj: ObjectId, extratos: List[dict],
+                          arquivos: List[str], repositorio=None, modo: Optional[str] = None) -> List[dict]:
+    """Grava os extratos com impressão digital, pulando ou substituindo os já enviados.
+
+    `arquivos` são os nomes dos arquivos, na ordem dos extratos. Devolve um item por arquivo deduplicado:
+    {"indice", "arquivo", "impressao_digital", "acao": "ignorado"|"substituido", "fatura_id"}, onde indice é
+    a posição do arquivo no upload. Arquivos repetidos no mesmo upload são sempre ignorados depois do primeiro.
+    """
+
+    modo = modo_deduplicacao(modo)
+
+    for extrato in extratos:
+        extrato["impressao_digital"] = impressao_digital(extrato)
+    if modo == "desligado":
+        salvar_extratos(users_collection, faturas_collection, user_id_obj, extratos, repositorio)
+        return []
+
+    existentes = encontrar_duplicados(faturas_collection, str(user_id_obj), [e["impressao_digital"] for e in extratos])
+    novos, substituidos, duplicados, vistos = [], [], [], set()
+    for indice, (extrato, arquivo) in enumerate(zip(extratos, arquivos)):
+        impressao = extrato["impressao_digital"]
+        fatura_id, extrato_id = existentes.get(impressao, (None, None))
+        if impressao in vistos or fatura_id is not None and (modo == "pular" or extrato_id is None):
+            # Extrato antigo sem _id não tem como ser retirado da fatura: fica o antigo.
+            duplicados.append({"indice": indice, "arquivo": arquivo, "impressao_digital": impressao,
+                               "acao": ACAO_IGNORADO, "fatura_id": str(fatura_id) if fatura_id else None})
+            continue
+        vistos.add(impressao)
+        if fatura_id is not None:
+            substituidos.append((fatura_id, extrato_id, extrato))
+            duplicados.append({"indice": indice, "arquivo": arquivo, "impressao_digital": impressao,
+                               "acao": ACAO_SUBSTITUIDO, "fatura_id": str(fatura_id)})
+        novos.append(extrato)
+
+    if novos:
+        salvar_extratos(users_collection, faturas_collection, user_id_obj, novos, repositorio)
+    if substituidos:
+        # Depois de gravar os novos: se algo falhar no meio, sobra um duplicado, nunca falta o extrato.
+        remover_extratos(users_collection, faturas_collection, user_id_obj, substituidos, repositorio)
+    return duplicados
+
+
+def preencher_impressoes_digitais(faturas_collection, repositorio=None) -> dict:
+    """Backfill: grava a impressão digital nos extratos que ainda não têm (enviados antes da deduplicação)."""
+
+    repositorio = repositorio or RepositorioEmbutido(faturas_collection)
+    relatorio = {"faturas": 0, "extratos": 0}
+    for fatura in faturas_collection.find({"extratos": {"$elemMatch": {"impressao_digital": {"$exists": False}}}}):
+        extratos = repositorio.extratos_da_fatura(fatura)
+        atualizacao = {
+            f"extratos.{indice}.impressao_digital": impressao_digital(extrato)
+            for indice, extrato in enumerate(extratos) if "impressao_digital" not in extrato
+        }
+        # Só grava se nenhum extrato entrou ou saiu desde a leitura (as posições continuam valendo).
+        resultado = faturas_collection.update_one(
+            {"_id": fatura["_id"], "extratos": {"$size": len(extratos)}}, {"$set": atualizacao})
+        if resultado.modified_count:
+            relatorio["faturas"] += 1
+            relatorio["extratos"] += len(atualizacao)
+    return relatorio
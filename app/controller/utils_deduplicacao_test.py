@@ -0,0 +1,238 @@
+from datetime import datetime
+from io import BytesIO
+import os
+from unittest.mock import patch
+
+import bson
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller.utils_deduplicacao import (
+    encontrar_duplicados,
+    impressao_digital,
+    preencher_impressoes_digitais,
+    salvar_sem_duplicados,
+)
+from app.controller.utils_indices import Indice, garantir_indices, indices_necessarios
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.controller.utils_transferencias import RepositorioColecao
+
+mongomock = pytest.importorskip("mongomock")
+
+# Teste de explain: precisa de um mongod de verdade (o mongomock não tem planos de execução).
+MONGO_URI_TESTES = os.getenv("MONGO_URI_TESTES")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("COLLECTION_USERS", "usuarios")
+    monkeypatch.setenv("COLLECTION_FATURAS", "faturas")
+    db = mongomock.MongoClient().db
+    garantir_indices(db, indices_necessarios())
+    return db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.usuarios.insert_one({"name": "Teste", "email": "t@t.com", "cpf": "1", "faturas": []}).inserted_id
+
+
+def _extrato(mes=10, ano=2025, valores=(-10.0, -20.0), banco="NUBANK"):
+    # Como Extrato.to_dict devolve: _id novo a cada processamento do arquivo.
+    return {"_id": str(ObjectId()), "banco": banco, "data": datetime(ano, mes, 1), "transferencias": [
+        {"valor": valor, "data": datetime(ano, mes, 5), "origem": "PIX", "categoria": "Outros"} for valor in valores
+    ]}
+
+
+class ColecaoEspiada:
+    """Conta as chamadas de cada método e soma o tamanho em BSON do que find devolve."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.chamadas = {}
+        self.bytes_lidos = 0
+
+    def __getattr__(self, nome):
+        self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+        return getattr(self._collection, nome)
+
+    def find(self, *args, **kwargs):
+        self.chamadas["find"] = self.chamadas.get("find", 0) + 1
+        documentos = list(self._collection.find(*args, **kwargs))
+        self.bytes_lidos += sum(len(bson.encode(documento)) for documento in documentos)
+        return iter(documentos)
+
+
+class TestImpressaoDigital:
+
+    def test_nao_depende_da_ordem_nem_do_id(self):
+        extrato = _extrato(valores=(-10.0, -20.0))
+        assert impressao_digital(extrato) == impressao_digital(_extrato(valores=(-20.0, -10.0)))
+
+    def test_formato_legado_gera_a_mesma(self):
+        legado = {"banco": "NUBANK", "data": "10/2025", "transferencias": [
+            {"valor": -10, "data": "05/10/2025", "origem": "PIX", "categoria": "Outros"},
+            {"valor": -20.001, "data": "05/10/2025", "origem": "PIX", "categoria": "Outros"},
+        ]}
+        assert impressao_digital(legado) == impressao_digital(_extrato())
+
+    def test_conteudo_diferente_muda(self):
+        base = impressao_digital(_extrato())
+        assert base != impressao_digital(_extrato(valores=(-10.0, -20.01)))
+        assert base != impressao_digital(_extrato(mes=11))
+        assert base != impressao_digital(_extrato(banco="ITAU"))
+
+
+class TestSalvarSemDuplicados:
+
+    def test_reenvio_e_ignorado(self, db, user_id):
+        salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["out.pdf"])
+
+        duplicados = salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato(), _extrato(mes=11)],
+                                           ["out-de-novo.pdf", "nov.pdf"])
+
+        fatura_outubro = db.faturas.find_one({"mes_ano": 202510})
+        assert duplicados == [{"indice": 0, "arquivo": "out-de-novo.pdf", "impressao_digital": impressao_digital(_extrato()),
+                               "acao": "ignorado", "fatura_id": str(fatura_outubro["_id"])}]
+        assert len(fatura_outubro["extratos"]) == 1
+        assert db.faturas.count_documents({}) == 2
+        assert db.usuarios.find_one({"_id": user_id})["resumo"]["saldo"] == -60.0
+
+    def test_repetido_no_mesmo_upload(self, db, user_id):
+        duplicados = salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato(), _extrato()], ["a.pdf", "b.pdf"])
+
+        assert [(d["indice"], d["acao"], d["fatura_id"]) for d in duplicados] == [(1, "ignorado", None)]
+        assert len(db.faturas.find_one()["extratos"]) == 1
+
+    def test_substituir_troca_o_extrato_e_mantem_o_resumo(self, db, user_id):
+        salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato(), _extrato(valores=(-5.0,))], ["a.pdf", "b.pdf"])
+        antigo = db.faturas.find_one()["extratos"][0]["_id"]
+
+        novo = _extrato()
+        duplicados = salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [novo], ["a.pdf"], modo="substituir")
+
+        fatura = db.faturas.find_one()
+        assert duplicados[0]["acao"] == "substituido"
+        assert [e["_id"] for e in fatura["extratos"]] == [fatura["extratos"][0]["_id"], novo["_id"]]
+        assert antigo not in [e["_id"] for e in fatura["extratos"]]
+        assert fatura["resumo"]["saldo"] == -35.0
+        assert fatura["resumo"]["quantidade_extratos"] == 2
+        assert db.usuarios.find_one({"_id": user_id})["resumo"]["saldo"] == -35.0
+
+    def test_substituir_na_colecao_de_transferencias(self, db, user_id):
+        repositorio = RepositorioColecao(db.faturas, db.transferencias)
+        salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["a.pdf"], repositorio)
+
+        novo = _extrato()
+        salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [novo], ["a.pdf"], repositorio, "substituir")
+
+        assert {t["extrato_id"] for t in db.transferencias.find()} == {novo["_id"]}
+        assert db.transferencias.count_documents({}) == 2
+
+    def test_desligado_grava_sempre(self, db, user_id):
+        salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["a.pdf"])
+        assert salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["a.pdf"], modo="desligado") == []
+        assert len(db.faturas.find_one()["extratos"]) == 2
+
+    def test_modo_invalido(self, db, user_id):
+        with pytest.raises(ValueError):
+            salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["a.pdf"], modo="talvez")
+
+    def test_preencher_impressoes_digitais_antigas(self, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato()])
+        assert preencher_impressoes_digitais(db.faturas) == {"faturas": 1, "extratos": 1}
+        assert preencher_impressoes_digitais(db.faturas) == {"faturas": 0, "extratos": 0}
+
+        duplicados = salvar_sem_duplicados(db.usuarios, db.faturas, user_id, [_extrato()], ["a.pdf"])
+        assert duplicados[0]["acao"] == "ignorado"
+
+
+def _historico(db, user_id, n_faturas):
+    """n_faturas meses já enviados, cada um com um extrato de 50 transferências."""
+    documentos = []
+    for i in range(n_faturas):
+        extrato = _extrato(mes=i % 12 + 1, ano=1900 + i // 12, valores=[-float(v) for v in range(50)])
+        extrato["impressao_digital"] = impressao_digital(extrato)
+        documentos.append({"user_id": str(user_id), "mes_ano": (1900 + i // 12) * 100 + i % 12 + 1, "extratos": [extrato]})
+    db.faturas.insert_many(documentos)
+
+
+def test_verificacao_nao_cresce_com_o_historico(db, user_id):
+    """A verificação de reenvio faz uma consulta e lê os mesmos bytes com 10 ou 1000 faturas."""
+    medidas = {}
+    for n_faturas in (10, 1000):
+        db.faturas.delete_many({})
+        _historico(db, user_id, n_faturas)
+        reenvio = db.faturas.find_one({"mes_ano": 190001})["extratos"][0]
+        faturas = ColecaoEspiada(db.faturas)
+
+        encontrados = encontrar_duplicados(faturas, str(user_id), [reenvio["impressao_digital"]])
+        medidas[n_faturas] = (faturas.chamadas, faturas.bytes_lidos)
+        assert list(encontrados) == [reenvio["impressao_digital"]]
+
+    # Um round trip e só a fatura casada volta do banco, sem as transferências (o uso do índice é
+    # verificado no teste de explain).
+    assert medidas[10][0] == medidas[1000][0] == {"find": 1}
+    assert medidas[10][1] == medidas[1000][1] < 200
+
+
+@pytest.mark.skipif(not MONGO_URI_TESTES, reason="defina MONGO_URI_TESTES para rodar contra um mongod")
+def test_verificacao_usa_indice():
+    from pymongo import MongoClient
+
+    cliente = MongoClient(MONGO_URI_TESTES, serverSelectionTimeoutMS=2000)
+    db = cliente[f"teste_deduplicacao_{ObjectId()}"]
+    try:
+        garantir_indices(db, [Indice("faturas", [("user_id", 1), ("extratos.impressao_digital", 1)])])
+        user_id = ObjectId()
+        _historico(db, user_id, 200)
+        impressao = db.faturas.find_one({"mes_ano": 190001})["extratos"][0]["impressao_digital"]
+
+        explain = db.command("explain", {"find": "faturas", "filter": {
+            "user_id": str(user_id), "extratos.impressao_digital": {"$in": [impressao]}}}, verbosity="executionStats")
+
+        assert "IXSCAN" in str(explain["queryPlanner"]["winningPlan"])
+        assert explain["executionStats"]["totalDocsExamined"] == explain["executionStats"]["nReturned"] == 1
+    finally:
+        cliente.drop_database(db.name)
+        cliente.close()
+
+
+def test_rota_informa_os_duplicados(db, user_id):
+    app = create_app()
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+    class ExtratoFalso:
+        def __init__(self, extrato):
+            self.extrato = extrato
+
+        def to_dict(self):
+            return {**self.extrato, "_id": str(ObjectId())}
+
+    async def formatar(arquivos, *args, **kwargs):
+        return [ExtratoFalso(_extrato()) for _ in arquivos]
+
+    def enviar(cliente, consulta=""):
+        return cliente.post(f"/faturas/usuario/{user_id}{consulta}", headers=headers, content_type="multipart/form-data",
+                            data={"file": (BytesIO(b"%PDF"), "out.pdf")})
+
+    with patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios, "faturas": db.faturas}), \
+         patch("app.routes.COLLECTION_USERS", "usuarios"), patch("app.routes.COLLECTION_FATURAS", "faturas"), \
+         patch("app.routes.formatar_extratos", formatar):
+        cliente = app.test_client()
+        primeiro = enviar(cliente)
+        reenvio = enviar(cliente)
+        substituido = enviar(cliente, "?duplicados=substituir")
+        invalido = enviar(cliente, "?duplicados=talvez")
+
+    assert primeiro.status_code == 201 and primeiro.get_json()["duplicados"] == []
+    assert reenvio.status_code == 200
+    assert reenvio.get_json()["extrato"] == []
+    assert reenvio.get_json()["duplicados"][0]["arquivo"] == "out.pdf"
+    assert substituido.status_code == 201
+    assert substituido.get_json()["duplicados"][0]["acao"] == "substituido"
+    assert invalido.status_code == 400
+    assert len(db.faturas.find_one()["extratos"]) == 1
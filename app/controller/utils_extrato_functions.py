@@ -1,30 +1,51 @@
 import base64
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from io import BytesIO
 import os
 from operator import itemgetter
-import requests
+import re
 from requests.models import Request
 from typing import List, Union
 
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts.chat import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import Runnable
 
-from app.models import BancoCandidato, Extrato
+import app.controller.utils_classificador as utils_classificador
+from app.controller.utils_cadeias_llm import (
+    OPENAI_MODELO_BANCO,
+    OPENAI_MODELO_EXTRATO,
+    criar_modelo,
+    obter_cadeia,
+    saida_estruturada,
+)
+from app.controller.utils_llama_cloud import obter_cliente_llama
+from app.controller.utils_upload import CorpoMultipart
+from app.models import BancoCandidato, Extrato, ListaTransferencias, Transferencia
 
 
 load_dotenv(override=True)
 
+MODELO_EXTRATO = OPENAI_MODELO_EXTRATO
+# Incremente ao alterar o prompt, o schema do Extrato ou as regras do pré-classificador:
+# a versão faz parte da chave do cache de extratos.
+VERSAO_PROMPT_EXTRATO = 3
+
+# Extratos longos são divididos em trechos estruturados em paralelo (map-reduce) em vez de um único prompt.
+EXTRATO_MAP_REDUCE = os.getenv("EXTRATO_MAP_REDUCE", "True").lower() == "true"
+EXTRATO_CHUNK_CHARS = int(os.getenv("EXTRATO_CHUNK_CHARS", "12000"))
+EXTRATO_CHUNK_PARALELISMO = int(os.getenv("EXTRATO_CHUNK_PARALELISMO", "4"))
+
+# Separador de páginas padrão do texto da LlamaParse.
+SEPARADOR_PAGINA = "\n---\n"
+_INICIO_TRANSACAO = re.compile(r"^\s*\|?\s*\d{2}/\d{2}")
 
-def post_extrato_parser(file: BytesIO, file_name: str = "file_name") -> Request:
 
-    API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
-    if not API_KEY:
-        raise ValueError("A variável de ambiente LLAMA_CLOUD_API_KEY não está definida.")
+def post_extrato_parser(file: BytesIO, file_name: str = "file_name") -> Request:
 
-    url = "https://api.cloud.llamaindex.ai/api/v1/parsing/upload"
-    headers = {"Authorization": f"Bearer {API_KEY}"}
+    cliente = obter_cliente_llama()
 
     # Aqui, usaremos o modo invoice no futuro (ou não, muito caro), já que ele é otimizado para recibos e faturas.
     # Decidimos não usar o invoice-v-1 por enquanto.
@@ -36,38 +57,36 @@ def post_extrato_parser(file: BytesIO, file_name: str = "file_name") -> Request:
         "fast_mode": True,
     }
 
-    files = {"file": (file_name, file, "application/pdf")}
-    response = requests.post(url, headers=headers, files=files, data=data)
+    # Com um webhook configurado, a LlamaCloud avisa quando o job termina e o polling acorda antes.
+    webhook_url = os.getenv("LLAMA_WEBHOOK_URL")
+    if webhook_url:
+        data["webhook_url"] = webhook_url
+
+    # Corpo multipart lido do arquivo em blocos durante o envio, em vez de montado inteiro em memória.
+    corpo = CorpoMultipart(data, "file", file_name, file)
+    response = cliente.post("/parsing/upload", data=corpo, headers={"Content-Type": corpo.content_type})
     
     return response
 
 
-def get_extrato_parser(id: str, type_result="text") -> Request:
+def get_status_job_parser(id: str) -> Request:
+    # Consulta apenas o status do job (PENDING, SUCCESS, ERROR, ...), sem baixar o resultado.
 
-    API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
-    if not API_KEY:
-        raise ValueError("A variável de ambiente LLAMA_CLOUD_API_KEY não está definida.")
+    response = obter_cliente_llama().get(f"/parsing/job/{id}")
+
+    return response
 
-    url = f"https://api.cloud.llamaindex.ai/api/v1/parsing/job/{id}/result/{type_result}"
 
-    headers = {"Authorization": f"Bearer {API_KEY}"}
+def get_extrato_parser(id: str, type_result="text") -> Request:
 
-    response = requests.get(url, headers=headers)
+    response = obter_cliente_llama().get(f"/parsing/job/{id}/result/{type_result}")
     
     return response
 
 
 def get_extrato_images_names(id: str) -> Union[List[str], None]:
 
-    API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
-    if not API_KEY:
-        raise ValueError("A variável de ambiente LLAMA_CLOUD_API_KEY não está definida.")
-
-    url = f"https://api.cloud.llamaindex.ai/api/v1/parsing/job/{id}/result/json"
-
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-
-    response = requests.get(url, headers=headers)
+    response = obter_cliente_llama().get(f"/parsing/job/{id}/result/json")
     
     images_names = []
     if response.status_code == 200:
@@ -85,30 +104,12 @@ def get_extrato_images_names(id: str) -> Union[List[str], None]:
 def get_extrato_images(id: str, image_name: str) -> Request:
     # Para conseguir o binário, dê um .content na Response
 
-    API_KEY = os.getenv("LLAMA_CLOUD_API_KEY")
-    if not API_KEY:
-        raise ValueError("A variável de ambiente LLAMA_CLOUD_API_KEY não está definida.")
-
-    url = f"https://api.cloud.llamaindex.ai/api/v1/parsing/job/{id}/result/image/{image_name}"
-
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-
-    response = requests.get(url, headers=headers)
+    response = obter_cliente_llama().get(f"/parsing/job/{id}/result/image/{image_name}")
     
     return response
 
 
-def get_extrato_estruturado(extrato_string: str) -> Extrato:
-
-    model = ChatOpenAI(model="gpt-4o")
-    structured_model = model.with_structured_output(Extrato)
-
-    message = """
-    Você é um parser de extrato bancário genérico: recebe um bloco de texto (várias linhas) de qualquer banco e deve devolver o objeto Extrato.
-
-    **Como fazer:**
-
-    1. **Detectar linhas de transação**  
+_REGRAS_TRANSACOES = """    1. **Detectar linhas de transação**  
     - Cada linha relevante referente à transação costuma ter: data (DD/MM/AAAA), descrição (nome do estabelecimento ou pessoa) e valor (formato brasileiro, ex. 1.234,56 ou -123,45).  
     - Cada transação pode ter mais de uma linha correspondente.
 
@@ -130,16 +131,44 @@ def get_extrato_estruturado(extrato_string: str) -> Extrato:
     - PESSOA_FISICA: transferência para CPF ou nome próprio de pessoa  
     - OUTROS: caso não se enquadre em nenhum acima
 
-    5. **Mapear `banco: BancoCandidato`** da transferência. 
+"""
+
+PROMPT_EXTRATO = """
+    Você é um parser de extrato bancário genérico: recebe um bloco de texto (várias linhas) de qualquer banco e deve devolver o objeto Extrato.
+
+    **Como fazer:**
+
+""" + _REGRAS_TRANSACOES + """    5. **Mapear `banco: BancoCandidato`** da transferência. 
     Caso não exista informações para dizer qual o banco, identifique como "NAO_IDENTIFICADO" e retorne um baixo score de certeza.
     Caso não seja nenhuma das opções de banco, mas exista informação para concluir que é um banco dos que não está nas opções, coloque "OUTRO".
     
     6. **Mapear `data: date`** do extrato. Você colocar a data do primeiro dia do mês que o extrato se refere. Temos várias datas diferentes, porém todas com o mesmo mês. Identique o mês.
     """
 
+PROMPT_TRANSFERENCIAS = """
+    Você é um parser de extrato bancário genérico: recebe um TRECHO de texto de um extrato de qualquer banco e deve devolver apenas as transferências desse trecho.
+    O banco e o mês do extrato são identificados em outra etapa; ignore cabeçalhos e rodapés.
+
+    **Como fazer:**
+
+""" + _REGRAS_TRANSACOES
+
+
+PROMPT_BANCO = """
+    Você é um classificador de banco. Você recebe a imagem de um banco em base64 e deve retornar um objeto do tipo BancoCandidato.
+
+    Caso a imagem não seja de uma logo de banco, identifique como "NAO_IDENTIFICADO" e retorne um baixo score de certeza.
+    Caso não seja nenhuma das opções de banco, mas exista informação para concluir que é um banco dos que não está nas opções, coloque "OUTRO".
+    """
+
+
+def _criar_cadeia_extrato() -> Runnable:
+
+    model = criar_modelo(MODELO_EXTRATO)
+    structured_model = saida_estruturada(model, Extrato, "extrato")
 
     prompt = ChatPromptTemplate.from_messages(
-        [('system'), (message),
+        [('system', PROMPT_EXTRATO),
         ('user', "{extrato}")]
     )
 
@@ -149,44 +178,141 @@ def get_extrato_estruturado(extrato_string: str) -> Extrato:
         | structured_model
     )
 
+    return chain
+
+
+def _criar_cadeia_banco() -> Runnable:
+
+    model = criar_modelo(OPENAI_MODELO_BANCO)
+    return saida_estruturada(model, BancoCandidato, "banco")
+
+
+def _criar_cadeia_transferencias() -> Runnable:
+
+    model = criar_modelo(MODELO_EXTRATO)
+    structured_model = saida_estruturada(model, ListaTransferencias, "transferencias")
+
+    prompt = ChatPromptTemplate.from_messages(
+        [('system', PROMPT_TRANSFERENCIAS),
+        ('user', "{extrato}")]
+    )
+
+    return prompt | structured_model
+
+
+def dividir_texto(texto: str, max_chars: int) -> List[str]:
+    """Divide o texto em trechos de até max_chars, cortando em fim de página ou no início de uma transação.
+
+    Uma linha maior que max_chars vira um trecho sozinha (nunca é cortada no meio).
+    """
+
+    blocos = []
+    for pagina in texto.split(SEPARADOR_PAGINA):
+        if len(pagina) <= max_chars:
+            blocos.append(pagina)
+            continue
+        # Página grande: agrupa as linhas por transação (cada uma começa com uma data).
+        atual = []
+        for linha in pagina.split("\n"):
+            if _INICIO_TRANSACAO.match(linha) and atual:
+                blocos.append("\n".join(atual))
+                atual = []
+            atual.append(linha)
+        if atual:
+            blocos.append("\n".join(atual))
+
+    trechos = []
+    atual = ""
+    for bloco in blocos:
+        if atual and len(atual) + len(SEPARADOR_PAGINA) + len(bloco) > max_chars:
+            trechos.append(atual)
+            atual = bloco
+        else:
+            atual = f"{atual}\n{bloco}" if atual else bloco
+    if atual:
+        trechos.append(atual)
+    return trechos
+
+
+def mesclar_transferencias(listas: List[List[Transferencia]]) -> List[Transferencia]:
+    """Concatena as transferências dos trechos na ordem.
+
+    dividir_texto não repete texto entre trechos: uma transação igual nas duas pontas de um corte
+    (ex.: duas tarifas iguais no mesmo dia, separadas por uma quebra de página) é real e é mantida.
+    """
+
+    return [transferencia for lista in listas for transferencia in lista]
+
+
+def _estruturar_em_trechos(trechos: List[str]) -> Extrato:
+    # O primeiro trecho (com o cabeçalho) passa pela cadeia completa, que identifica banco e mês uma única vez;
+    # os demais só extraem transferências, em paralelo.
+
+    cadeia_extrato = obter_cadeia("extrato", _criar_cadeia_extrato)
+    cadeia_transferencias = obter_cadeia("transferencias", _criar_cadeia_transferencias)
+
+    # Cada trecho roda numa cópia do contexto atual: os tokens entram no rastro da requisição.
+    with ThreadPoolExecutor(max_workers=EXTRATO_CHUNK_PARALELISMO) as executor:
+        futuro_extrato = executor.submit(contextvars.copy_context().run, cadeia_extrato.invoke, {"extrato": trechos[0]})
+        futuros = [executor.submit(contextvars.copy_context().run, cadeia_transferencias.invoke, {"extrato": trecho})
+                   for trecho in trechos[1:]]
+        extrato = futuro_extrato.result()
+        listas = [extrato.extrato] + [futuro.result().extrato for futuro in futuros]
+
+    extrato.extrato = mesclar_transferencias(listas)
+    return extrato
+
+
+def _estruturar_com_llm(extrato_string: str) -> Extrato:
+
+    if EXTRATO_MAP_REDUCE and len(extrato_string) > EXTRATO_CHUNK_CHARS:
+        trechos = dividir_texto(extrato_string, EXTRATO_CHUNK_CHARS)
+        if len(trechos) > 1:
+            return _estruturar_em_trechos(trechos)
+
+    chain = obter_cadeia("extrato", _criar_cadeia_extrato)
+
     response = chain.invoke({"extrato": extrato_string})
 
     return response
 
 
-def get_banco_candidato(image_in_binary: bytes, file_format="pdf") -> BancoCandidato:
+def get_extrato_estruturado(extrato_string: str) -> Extrato:
 
-    image_b64 = base64.b64encode(image_in_binary).decode("utf-8")
+    if not utils_classificador.EXTRATO_PRECLASSIFICADOR:
+        return _estruturar_com_llm(extrato_string)
 
-    model = ChatOpenAI(model="gpt-4o")
-    structured_model = model.with_structured_output(BancoCandidato)
+    # As linhas resolvidas pelas regras locais não vão para a LLM; ela recebe só o cabeçalho
+    # (para banco e mês) e as linhas ambíguas.
+    pre = utils_classificador.preclassificar(extrato_string)
+    extrato = _estruturar_com_llm(pre.texto_residual)
+    if pre.transferencias:
+        extrato.extrato = sorted(pre.transferencias + extrato.extrato, key=lambda transferencia: transferencia.data)
+        extrato.data = utils_classificador.mes_predominante(extrato.extrato)
 
-    system_message = """
-    Você é um classificador de banco. Você recebe a imagem de um banco em base64 e deve retornar um objeto do tipo BancoCandidato.
+    return extrato
 
-    Caso a imagem não seja de uma logo de banco, identifique como "NAO_IDENTIFICADO" e retorne um baixo score de certeza.
-    Caso não seja nenhuma das opções de banco, mas exista informação para concluir que é um banco dos que não está nas opções, coloque "OUTRO".
-    """
 
-    human_message = {
+def get_banco_candidato(image_in_binary: bytes, file_format="pdf") -> BancoCandidato:
+
+    image_b64 = base64.b64encode(image_in_binary).decode("utf-8")
+
+    structured_model = obter_cadeia("banco", _criar_cadeia_banco)
+
+    human_message = [
+        {
             "type": "image",
             "source_type": "base64",
             "data": image_b64,
             "mime_type": f"image/{file_format}",
-        },
+        }
+    ]
 
-    prompt = ChatPromptTemplate.from_messages(
+    response = structured_model.invoke(
         [
-            SystemMessage(content=system_message),
+            SystemMessage(content=PROMPT_BANCO),
             HumanMessage(content=human_message)
         ]
     )
 
-    chain = (
-        prompt
-        | structured_model
-    )
-
-    response = chain.invoke({})
-
-    return response
\ No newline at end of file
+    return response
@@ -0,0 +1,194 @@
+from datetime import date, datetime
+import re
+import threading
+from unittest.mock import patch
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from app.controller import utils_classificador, utils_extrato_functions
+from app.controller.utils_cadeias_llm import limpar_cadeias
+from app.controller.utils_extrato_functions import dividir_texto, mesclar_transferencias
+from app.models import (
+    Banco,
+    BancoCandidato,
+    CategoriaGasto,
+    Extrato,
+    ListaTransferencias,
+    OrigemTransacao,
+    Transferencia,
+)
+
+
+_LINHA = re.compile(r"^(\d{2}/\d{2}/\d{4}) (.+) (-?\d+,\d{2})$")
+
+
+def _transferencias(texto):
+    transferencias = []
+    for linha in texto.split("\n"):
+        encontrado = _LINHA.match(linha.strip())
+        if encontrado:
+            data, descricao, valor = encontrado.groups()
+            transferencias.append(Transferencia(
+                valor=float(valor.replace(",", ".")),
+                data=datetime.strptime(data, "%d/%m/%Y").date(),
+                origem=OrigemTransacao.PIX if "pix" in descricao.lower() else OrigemTransacao.COMPRA_CARTAO,
+                categoria=CategoriaGasto.OUTROS,
+            ))
+    return transferencias
+
+
+class FakeLLM:
+    """LLM determinístico: extrai linhas 'DD/MM/AAAA descrição valor' e o banco do cabeçalho.
+
+    Com uma barreira, cada chamada espera as demais chegarem: só passa se estiverem em paralelo.
+    """
+
+    def __init__(self):
+        self.barreira = None
+        self.chamadas_extrato = 0
+        self.chamadas_transferencias = 0
+        self.em_andamento = 0
+        self.pico = 0
+        self._lock = threading.Lock()
+
+    def _chamar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+            self.em_andamento += 1
+            self.pico = max(self.pico, self.em_andamento)
+        if self.barreira is not None:
+            self.barreira.wait()
+        with self._lock:
+            self.em_andamento -= 1
+
+    def extrato(self, entrada):
+        self._chamar("chamadas_extrato")
+        texto = entrada["extrato"]
+        banco = Banco.ITAU if "ITAU" in texto else Banco.NAO_IDENTIFICADO
+        return Extrato(
+            banco=BancoCandidato(banco=banco, score=0.9),
+            extrato=_transferencias(texto),
+            data=date(2025, 10, 1),
+        )
+
+    def transferencias(self, entrada):
+        self._chamar("chamadas_transferencias")
+        return ListaTransferencias(extrato=_transferencias(entrada["extrato"]))
+
+
+def _texto_extrato(paginas=5, por_pagina=40):
+    linhas_paginas = []
+    for p in range(paginas):
+        linhas = ["BANCO ITAU - EXTRATO" if p == 0 else f"Página {p + 1}"]
+        for i in range(por_pagina):
+            dia = (i % 28) + 1
+            descricao = "PIX JOAO" if i % 3 == 0 else f"COMPRA LOJA {p}-{i}"
+            linhas.append(f"{dia:02d}/10/2025 {descricao} -{p * 100 + i},50")
+        linhas_paginas.append("\n".join(linhas))
+    return utils_extrato_functions.SEPARADOR_PAGINA.join(linhas_paginas)
+
+
+@pytest.fixture
+def fake_llm():
+    llm = FakeLLM()
+    limpar_cadeias()
+    with patch.object(utils_extrato_functions, "_criar_cadeia_extrato", lambda: RunnableLambda(llm.extrato)), \
+         patch.object(utils_extrato_functions, "_criar_cadeia_transferencias", lambda: RunnableLambda(llm.transferencias)):
+        yield llm
+    limpar_cadeias()
+
+
+class TestDividirTexto:
+
+    def test_respeita_limite_e_nao_perde_linhas(self):
+        texto = _texto_extrato()
+
+        trechos = dividir_texto(texto, 1500)
+
+        assert len(trechos) > 1
+        assert all(len(trecho) <= 1500 for trecho in trechos)
+        linhas = [l for l in texto.replace(utils_extrato_functions.SEPARADOR_PAGINA, "\n").split("\n") if l]
+        assert [l for trecho in trechos for l in trecho.split("\n") if l] == linhas
+
+    def test_corta_no_inicio_de_transacao(self):
+        texto = "cabeçalho\n01/10/2025 COMPRA\ncontinuação da compra\n02/10/2025 PIX\nmais detalhes"
+
+        trechos = dividir_texto(texto, 45)
+
+        assert all(trecho.startswith(("01/10/2025", "02/10/2025")) for trecho in trechos[1:])
+        assert any("01/10/2025 COMPRA\ncontinuação da compra" in trecho for trecho in trechos)
+
+    def test_texto_curto_fica_inteiro(self):
+        assert dividir_texto("01/10/2025 PIX -1,00", 1000) == ["01/10/2025 PIX -1,00"]
+
+
+class TestMesclarTransferencias:
+
+    def test_concatena_na_ordem(self):
+        a, b, c = _transferencias("01/10/2025 A -1,00\n02/10/2025 B -2,00\n03/10/2025 C -3,00")
+
+        assert mesclar_transferencias([[a, b], [c]]) == [a, b, c]
+
+    def test_mantem_transacoes_iguais_nas_duas_pontas_do_corte(self):
+        # Duas tarifas iguais no mesmo dia, uma em cada página.
+        tarifa = "01/10/2025 TARIFA -5,00"
+        trechos = dividir_texto(tarifa + utils_extrato_functions.SEPARADOR_PAGINA + tarifa, 25)
+        assert len(trechos) == 2
+
+        listas = [_transferencias(trecho) for trecho in trechos]
+        assert listas[0] == listas[1]
+        assert len(mesclar_transferencias(listas)) == 2
+
+    def test_mantem_repeticao_dentro_do_trecho(self):
+        a, b = _transferencias("01/10/2025 A -1,00\n02/10/2025 B -2,00")
+
+        assert mesclar_transferencias([[a, a], [b]]) == [a, a, b]
+
+
+class TestMapReduce:
+
+    def test_resultado_igual_ao_single_shot(self, fake_llm):
+        texto = _texto_extrato()
+
+        with patch.object(utils_extrato_functions, "EXTRATO_CHUNK_CHARS", len(texto) + 1):
+            single_shot = utils_extrato_functions.get_extrato_estruturado(texto)
+        with patch.object(utils_extrato_functions, "EXTRATO_CHUNK_CHARS", 1500):
+            map_reduce = utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert map_reduce == single_shot
+        assert map_reduce.banco.banco == Banco.ITAU
+        assert len(map_reduce.extrato) == 200
+
+    def test_banco_e_mes_identificados_uma_vez(self, fake_llm):
+        texto = _texto_extrato()
+
+        with patch.object(utils_extrato_functions, "EXTRATO_CHUNK_CHARS", 1500):
+            utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert fake_llm.chamadas_extrato == 1
+        assert fake_llm.chamadas_transferencias == len(dividir_texto(texto, 1500)) - 1
+
+    def test_trechos_em_paralelo(self, fake_llm):
+        texto = _texto_extrato()
+        n_trechos = len(dividir_texto(texto, 3000))
+        # Todos os trechos (o primeiro pela cadeia completa) só passam da barreira juntos.
+        fake_llm.barreira = threading.Barrier(n_trechos, timeout=5)
+
+        with patch.object(utils_classificador, "EXTRATO_PRECLASSIFICADOR", False), \
+             patch.object(utils_extrato_functions, "EXTRATO_CHUNK_CHARS", 3000), \
+             patch.object(utils_extrato_functions, "EXTRATO_CHUNK_PARALELISMO", 8):
+            utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert n_trechos >= 3
+        assert fake_llm.pico == n_trechos
+
+    def test_desligado_usa_single_shot(self, fake_llm):
+        texto = _texto_extrato()
+
+        with patch.object(utils_extrato_functions, "EXTRATO_MAP_REDUCE", False), \
+             patch.object(utils_extrato_functions, "EXTRATO_CHUNK_CHARS", 1500):
+            utils_extrato_functions.get_extrato_estruturado(texto)
+
+        assert fake_llm.chamadas_extrato == 1
+        assert fake_llm.chamadas_transferencias == 0
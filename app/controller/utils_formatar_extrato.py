@@ -1,64 +1,219 @@
 import asyncio
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
 from io import BytesIO
-from typing import List
+import os
+from typing import Callable, List, Optional
 
 import app.controller.utils_extrato_functions as utils_extrato_functions
-from app.models import Extrato, Banco
-
-
-async def formatar_extratos(files: List[BytesIO]) -> List[Extrato]:
-    
-    lista_extratos = []
-    
-    for i, arquivo in enumerate(files):
-
-        response_post_llama = utils_extrato_functions.post_extrato_parser(arquivo, f"arquivo_{i}")
-        if response_post_llama.status_code == 200:
-            id = response_post_llama.json()["id"]
-        else:
-            raise Exception("Falha ao enviar extrato para o parser.")
-        
-        response_get_extrato_parser = utils_extrato_functions.get_extrato_parser(id)
-        while response_get_extrato_parser.status_code == 404:
-                await asyncio.sleep(10)
-                response_get_extrato_parser = utils_extrato_functions.get_extrato_parser(id)
+from app.controller.utils_bancos import estatisticas_bancos, identificar_banco_por_texto
+from app.controller.utils_cache_extrato import calcular_chave, obter_cache_extratos
+from app.controller.utils_metricas import registrar_polls, registrar_tamanho, span
+from app.controller.utils_polling import aguardar_job_parser
+from app.controller.utils_upload import tamanho_arquivo
+from app.models import Banco, BancoCandidato, Extrato
+
+
+# Número máximo de estruturações via LLM rodando ao mesmo tempo.
+# Uploads e polling não são limitados: são chamadas leves à LlamaCloud.
+MAX_CONCORRENCIA_LLM = int(os.getenv("EXTRATO_MAX_CONCORRENCIA_LLM", "4"))
+
+# Score de um candidato por imagem que dispensa esperar as demais imagens.
+BANCO_SCORE_SAIDA_ANTECIPADA = float(os.getenv("BANCO_SCORE_SAIDA_ANTECIPADA", "0.95"))
+
+# Pool próprio para as chamadas bloqueantes: o executor padrão do asyncio tem poucas threads
+# em máquinas com poucos núcleos, o que serializaria os uploads de lotes grandes.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("EXTRATO_MAX_THREADS", "32")),
+    thread_name_prefix="extrato",
+)
+
+
+async def _em_thread(func, *args):
+    # Equivalente ao asyncio.to_thread, mas usando o pool acima.
+    loop = asyncio.get_running_loop()
+    contexto = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(contexto.run, func, *args))
+
+
+async def _enviar_para_parser(arquivo: BytesIO, file_name: str) -> str:
+
+    with span("upload_parser") as s:
+        if s.ativo:
+            registrar_tamanho("upload_parser", tamanho_arquivo(arquivo))
+        response_post_llama = await _em_thread(utils_extrato_functions.post_extrato_parser, arquivo, file_name)
+    if response_post_llama.status_code == 200:
+        return response_post_llama.json()["id"]
+    raise Exception("Falha ao enviar extrato para o parser.")
+
+
+async def _consultar_status(id: str) -> str:
+
+    response = await _em_thread(utils_extrato_functions.get_status_job_parser, id)
+    # 404 e erros transitórios contam como "ainda processando"; o prazo máximo do polling limita a espera.
+    if response.status_code in (404, 429) or response.status_code >= 500:
+        return "PENDING"
+    if response.status_code != 200:
+        raise Exception("Falha ao consultar o status do extrato no parser.")
+    return response.json()["status"]
+
+
+async def _aguardar_texto(id: str) -> str:
+
+    polls = 0
+
+    def consultar():
+        nonlocal polls
+        polls += 1
+        return _consultar_status(id)
+
+    with span("polling") as s:
+        try:
+            await aguardar_job_parser(id, consultar)
+        finally:
+            registrar_polls(polls)
+        s.anotar(polls=polls)
+
+    with span("download_texto") as s:
+        response_get_extrato_parser = await _em_thread(utils_extrato_functions.get_extrato_parser, id)
+        if response_get_extrato_parser.status_code != 200:
+            raise Exception("Falha ao obter o texto do extrato no parser.")
         text = response_get_extrato_parser.json()["text"]
-        
-        extrato = utils_extrato_functions.get_extrato_estruturado(text)
-        if extrato.banco.score < 0.8 or extrato.banco.banco.value == "NAO_IDENTIFICADO":
-            images_names = utils_extrato_functions.get_extrato_images_names(id)
-            if images_names is None:
-                raise Exception("Falha na requisição ao tentar obter nomes das imagens.")
-            elif images_names == []:
-                lista_extratos.append(extrato)
+        if s.ativo:
+            registrar_tamanho("texto_parser", len(text.encode()))
+    return text
+
+
+async def _classificar_imagem(id: str, name: str) -> Optional[BancoCandidato]:
+
+    response = await _em_thread(utils_extrato_functions.get_extrato_images, id, name)
+    if response.status_code != 200:
+        print(f"Falha ao baixar a imagem {name} do extrato {id}: status {response.status_code}")
+        return None
+    registrar_tamanho("imagem", len(response.content))
+    return await _em_thread(utils_extrato_functions.get_banco_candidato, response.content)
+
+
+async def _identificar_banco_por_imagens(id: str, extrato: Extrato) -> Extrato:
+    # Cada imagem é baixada e classificada na sua própria tarefa; os resultados são lidos na ordem
+    # em que ficam prontos. Um candidato com score >= BANCO_SCORE_SAIDA_ANTECIPADA encerra a votação.
+    # Falhas (download, modelo ou nenhum voto válido) mantêm o banco que veio da estruturação.
+
+    images_names = await _em_thread(utils_extrato_functions.get_extrato_images_names, id)
+    if images_names is None:
+        print(f"Falha na requisição ao tentar obter nomes das imagens do extrato {id}.")
+        return extrato
+    elif images_names == []:
+        return extrato
+
+    with span("fallback_imagens", imagens=len(images_names)):
+        return await _votar_por_imagens(id, extrato, images_names)
+
+
+async def _votar_por_imagens(id: str, extrato: Extrato, images_names: List[str]) -> Extrato:
+
+    tarefas = [asyncio.ensure_future(_classificar_imagem(id, name)) for name in images_names]
+    bancos_candidatos = []
+    try:
+        for proxima in asyncio.as_completed(tarefas):
+            try:
+                banco_candidato = await proxima
+            except Exception as e:
+                print(f"Erro ao classificar imagem do extrato {id}: {str(e)}")
                 continue
-            else:
-                bancos_candidatos = []
-                imagens_binarios = []
-                for name in images_names:
-                    response = utils_extrato_functions.get_extrato_images(id, name)
-                    if response.status_code == 200:
-                        imagens_binarios.append(response.content)
-                    else:
-                        raise Exception("Falha na requisição ao baixar imagem do extrato.")
-                
-                for binario in imagens_binarios:
-                    banco_candidato = utils_extrato_functions.get_banco_candidato(binario)
-                    if banco_candidato.score > 0.8 and banco_candidato.banco.value != "NAO_IDENTIFICADO":
-                        bancos_candidatos.append(banco_candidato.banco.value)
-                    else:
-                        bancos_candidatos.append("NAO_IDENTIFICADO")
-                
-                bancos_candidatos = [x for x in bancos_candidatos if x != "NAO_IDENTIFICADO"]
-                banco = Counter(bancos_candidatos).most_common(1)[0][0]
-                extrato.banco.banco = Banco(banco)
-
-                lista_extratos.append(extrato)
+            if banco_candidato is None or banco_candidato.score <= 0.8 or banco_candidato.banco == Banco.NAO_IDENTIFICADO:
                 continue
+            bancos_candidatos.append(banco_candidato)
+            if banco_candidato.score >= BANCO_SCORE_SAIDA_ANTECIPADA:
+                break
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+
+    if not bancos_candidatos:
+        return extrato
+
+    # Mais votado; empate decidido pela soma dos scores (a ordem de chegada não é determinística).
+    votos = Counter(candidato.banco for candidato in bancos_candidatos)
+    scores = Counter()
+    for candidato in bancos_candidatos:
+        scores[candidato.banco] += candidato.score
+    banco = max(votos, key=lambda b: (votos[b], scores[b]))
+    extrato.banco = max((c for c in bancos_candidatos if c.banco == banco), key=lambda c: c.score)
+
+    return extrato
+
+
+async def _estruturar(id: str, text: str, semaforo_llm: asyncio.Semaphore) -> Extrato:
+
+    async with semaforo_llm:
+        with span("estruturacao_llm"):
+            extrato = await _em_thread(utils_extrato_functions.get_extrato_estruturado, text)
+        if extrato.banco.score < 0.8 or extrato.banco.banco.value == "NAO_IDENTIFICADO":
+            # Marcadores do texto (CNPJ, ISPB, nome) resolvem a maioria dos casos sem baixar imagens.
+            banco_candidato = identificar_banco_por_texto(text)
+            estatisticas_bancos.registrar(banco_candidato is not None)
+            if banco_candidato is not None:
+                extrato.banco = banco_candidato
+            else:
+                extrato = await _identificar_banco_por_imagens(id, extrato)
+
+    return extrato
+
+
+async def _processar_arquivo(
+    arquivo: BytesIO,
+    file_name: str,
+    semaforo_llm: asyncio.Semaphore,
+    ao_concluir_arquivo: Optional[Callable[[Extrato], None]] = None,
+) -> Extrato:
+
+    # Reenvio do mesmo PDF: o resultado sai do cache sem passar pelo parser nem pela LLM.
+    cache = obter_cache_extratos()
+    chave = None
+    if cache is not None:
+        with span("cache") as s:
+            chave = await _em_thread(calcular_chave, arquivo)
+            em_cache = await _em_thread(cache.obter, chave)
+            s.anotar(acerto=em_cache is not None)
+        if em_cache is not None:
+            arquivo.close()
+            _, extrato = em_cache
+            if ao_concluir_arquivo is not None:
+                ao_concluir_arquivo(extrato)
+            return extrato
+
+    try:
+        id = await _enviar_para_parser(arquivo, file_name)
+    finally:
+        # O parser já tem o arquivo: libera a memória (ou o temporário em disco) sem esperar o resto do lote.
+        arquivo.close()
+    text = await _aguardar_texto(id)
+    extrato = await _estruturar(id, text, semaforo_llm)
+    if cache is not None:
+        await _em_thread(cache.salvar, chave, text, extrato)
+    if ao_concluir_arquivo is not None:
+        ao_concluir_arquivo(extrato)
+    return extrato
+
+
+async def formatar_extratos(
+    files: List[BytesIO],
+    max_concorrencia_llm: Optional[int] = None,
+    ao_concluir_arquivo: Optional[Callable[[Extrato], None]] = None,
+) -> List[Extrato]:
+    # As chamadas à LlamaCloud e à OpenAI são síncronas (requests/LangChain), então cada uma roda
+    # numa thread do _executor. Todos os arquivos seguem o pipeline ao mesmo tempo (upload,
+    # polling e estruturação); só a etapa de LLM é limitada pelo semáforo. O asyncio.gather
+    # devolve os resultados na ordem de entrada. O callback ao_concluir_arquivo é chamado a cada
+    # arquivo finalizado (usado para reportar progresso dos jobs de ingestão).
+
+    semaforo_llm = asyncio.Semaphore(max_concorrencia_llm or MAX_CONCORRENCIA_LLM)
 
-        else:
-            lista_extratos.append(extrato)
-            continue
+    lista_extratos = await asyncio.gather(
+        *(_processar_arquivo(arquivo, f"arquivo_{i}", semaforo_llm, ao_concluir_arquivo) for i, arquivo in enumerate(files))
+    )
 
-    return lista_extratos
\ No newline at end of file
+    return list(lista_extratos)
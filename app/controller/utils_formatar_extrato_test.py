@@ -0,0 +1,225 @@
+import asyncio
+from datetime import date
+from io import BytesIO
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from app.controller.utils_formatar_extrato import _identificar_banco_por_imagens, formatar_extratos
+from app.models import Banco, BancoCandidato, Extrato
+
+
+# Tempo máximo de espera nas barreiras: estourar significa que as chamadas não rodaram ao mesmo tempo.
+ESPERA_MAXIMA = 5
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, payload=None, content=b""):
+        self.status_code = status_code
+        self._payload = payload or {}
+        self.content = content
+
+    def json(self):
+        return self._payload
+
+
+class StubBackends:
+    """Simula LlamaCloud e OpenAI e conta as chamadas simultâneas ao parser e ao LLM.
+
+    Com barreiras, cada chamada espera as demais do grupo chegarem: o teste só passa se elas
+    estiverem em andamento ao mesmo tempo, sem depender de latências simuladas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.uploads_em_andamento = 0
+        self.pico_uploads = 0
+        self.llm_em_andamento = 0
+        self.pico_llm = 0
+        self.barreira_upload = None
+        self.barreira_llm = None
+
+    def post_extrato_parser(self, file, file_name="file_name"):
+        with self._lock:
+            self.uploads_em_andamento += 1
+            self.pico_uploads = max(self.pico_uploads, self.uploads_em_andamento)
+        if self.barreira_upload is not None:
+            self.barreira_upload.wait()
+        with self._lock:
+            self.uploads_em_andamento -= 1
+        return FakeResponse(payload={"id": file.getvalue().decode()})
+
+    def get_status_job_parser(self, id):
+        return FakeResponse(payload={"id": id, "status": "SUCCESS"})
+
+    def get_extrato_parser(self, id, type_result="text"):
+        return FakeResponse(payload={"text": id})
+
+    def get_extrato_estruturado(self, extrato_string):
+        with self._lock:
+            self.llm_em_andamento += 1
+            self.pico_llm = max(self.pico_llm, self.llm_em_andamento)
+        if self.barreira_llm is not None:
+            self.barreira_llm.wait()
+        with self._lock:
+            self.llm_em_andamento -= 1
+        dia = int(extrato_string.split("_")[1]) + 1
+        return Extrato(
+            banco=BancoCandidato(banco=Banco.ITAU, score=0.95),
+            extrato=[],
+            data=date(2025, 10, dia),
+        )
+
+
+@pytest.fixture(autouse=True)
+def sem_cache():
+    with patch("app.controller.utils_formatar_extrato.obter_cache_extratos", lambda: None):
+        yield
+
+
+@pytest.fixture
+def stubs():
+    backends = StubBackends()
+    alvo = "app.controller.utils_formatar_extrato.utils_extrato_functions"
+    with patch(f"{alvo}.post_extrato_parser", backends.post_extrato_parser), \
+         patch(f"{alvo}.get_status_job_parser", backends.get_status_job_parser), \
+         patch(f"{alvo}.get_extrato_parser", backends.get_extrato_parser), \
+         patch(f"{alvo}.get_extrato_estruturado", backends.get_extrato_estruturado):
+        yield backends
+
+
+def _arquivos(n):
+    return [BytesIO(f"extrato_{i}".encode()) for i in range(n)]
+
+
+def _formatar(n, max_concorrencia_llm):
+    return asyncio.run(formatar_extratos(_arquivos(n), max_concorrencia_llm=max_concorrencia_llm))
+
+
+class TestFormatarExtratosConcorrente:
+    # Os tempos do pipeline com latências simuladas ficam em python -m benchmarks.micro pipeline_concorrente.
+
+    def test_resultados_na_ordem_de_entrada(self, stubs):
+        extratos = _formatar(6, max_concorrencia_llm=6)
+
+        assert [extrato.data.day for extrato in extratos] == [1, 2, 3, 4, 5, 6]
+
+    def test_respeita_limite_de_concorrencia_llm(self, stubs):
+        stubs.barreira_llm = threading.Barrier(2, timeout=ESPERA_MAXIMA)
+        _formatar(6, max_concorrencia_llm=2)
+
+        assert stubs.pico_llm == 2
+
+    def test_arquivos_seguem_o_pipeline_ao_mesmo_tempo(self, stubs):
+        # Os 8 uploads só passam da barreira juntos; o LLM continua limitado pelo semáforo.
+        stubs.barreira_upload = threading.Barrier(8, timeout=ESPERA_MAXIMA)
+        stubs.barreira_llm = threading.Barrier(2, timeout=ESPERA_MAXIMA)
+        extratos = _formatar(8, max_concorrencia_llm=2)
+
+        assert len(extratos) == 8
+        assert stubs.pico_uploads == 8
+        assert stubs.pico_llm == 2
+
+
+class StubImagens:
+    """Simula o download das imagens e a classificação por visão; cada imagem tem o seu resultado."""
+
+    def __init__(self, resultados, barreira=None, bloqueadas=()):
+        # resultados: nome -> BancoCandidato, Exception (falha do modelo) ou int (status do download)
+        self.resultados = resultados
+        self.barreira = barreira
+        # Imagens cujo download só termina depois de liberar.set() (ou de ESPERA_MAXIMA).
+        self.bloqueadas = set(bloqueadas)
+        self.liberar = threading.Event()
+        self.classificadas = []
+
+    def get_extrato_images_names(self, id):
+        return list(self.resultados)
+
+    def get_extrato_images(self, id, image_name):
+        if self.barreira is not None:
+            self.barreira.wait()
+        if image_name in self.bloqueadas:
+            self.liberar.wait(ESPERA_MAXIMA)
+        resultado = self.resultados[image_name]
+        if isinstance(resultado, int):
+            return FakeResponse(status_code=resultado)
+        return FakeResponse(content=image_name.encode())
+
+    def get_banco_candidato(self, binario, file_format="pdf"):
+        nome = binario.decode()
+        self.classificadas.append(nome)
+        resultado = self.resultados[nome]
+        if isinstance(resultado, Exception):
+            raise resultado
+        return resultado
+
+
+def _identificar(stub):
+    extrato = Extrato(banco=BancoCandidato(banco=Banco.NAO_IDENTIFICADO, score=0.2), extrato=[], data=date(2025, 10, 1))
+    alvo = "app.controller.utils_formatar_extrato.utils_extrato_functions"
+    with patch(f"{alvo}.get_extrato_images_names", stub.get_extrato_images_names), \
+         patch(f"{alvo}.get_extrato_images", stub.get_extrato_images), \
+         patch(f"{alvo}.get_banco_candidato", stub.get_banco_candidato):
+        return asyncio.run(_identificar_banco_por_imagens("job", extrato))
+
+
+class TestIdentificarBancoPorImagens:
+
+    def test_imagens_em_paralelo(self):
+        candidato = BancoCandidato(banco=Banco.SANTANDER, score=0.9)
+        # Os três downloads só passam da barreira se estiverem em andamento ao mesmo tempo.
+        stub = StubImagens({"a.png": candidato, "b.png": candidato, "c.png": candidato},
+                           barreira=threading.Barrier(3, timeout=ESPERA_MAXIMA))
+
+        extrato = _identificar(stub)
+
+        assert extrato.banco.banco == Banco.SANTANDER
+        assert len(stub.classificadas) == 3
+
+    def test_saida_antecipada(self):
+        stub = StubImagens(
+            {"lenta.png": BancoCandidato(banco=Banco.BRADESCO, score=0.9), "rapida.png": BancoCandidato(banco=Banco.INTER, score=0.99)},
+            bloqueadas={"lenta.png"},
+        )
+
+        try:
+            extrato = _identificar(stub)
+            # A votação terminou sem esperar a imagem que ainda estava baixando.
+            assert extrato.banco.banco == Banco.INTER
+            assert stub.classificadas == ["rapida.png"]
+        finally:
+            stub.liberar.set()
+
+    def test_nenhum_voto_mantem_banco(self):
+        nao_identificado = BancoCandidato(banco=Banco.NAO_IDENTIFICADO, score=0.9)
+        stub = StubImagens({"a.png": nao_identificado, "b.png": BancoCandidato(banco=Banco.ITAU, score=0.5)})
+
+        extrato = _identificar(stub)
+
+        assert extrato.banco.banco == Banco.NAO_IDENTIFICADO
+
+    def test_falhas_de_download_e_modelo_sao_ignoradas(self):
+        stub = StubImagens({
+            "a.png": 500,
+            "b.png": RuntimeError("timeout"),
+            "c.png": BancoCandidato(banco=Banco.NUBANK, score=0.85),
+        })
+
+        extrato = _identificar(stub)
+
+        assert extrato.banco.banco == Banco.NUBANK
+        assert extrato.banco.score == 0.85
+
+    def test_maioria_decide(self):
+        stub = StubImagens({
+            "a.png": BancoCandidato(banco=Banco.PAN, score=0.85),
+            "b.png": BancoCandidato(banco=Banco.BMG, score=0.9),
+            "c.png": BancoCandidato(banco=Banco.PAN, score=0.82),
+        })
+
+        extrato = _identificar(stub)
+
+        assert extrato.banco.banco == Banco.PAN
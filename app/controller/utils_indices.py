@@ -0,0 +1,134 @@
+import os
+from typing import Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.controller.utils_admissao import ADMISSAO_BACKEND, COLLECTION_ADMISSAO
+from app.controller.utils_cache_extrato import CACHE_EXTRATOS, COLLECTION_CACHE_EXTRATOS
+from app.controller.utils_transferencias import ARMAZENAMENTO_TRANSFERENCIAS, COLLECTION_TRANSFERENCIAS
+
+
+# Opções que fazem parte da definição do índice: se divergirem do declarado, o índice só é recriado
+# com recriar=True (flask garantir-indices --recriar).
+OPCOES_COMPARADAS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+class Indice:
+    """Declaração de um índice: coleção, chaves e opções (unique, expireAfterSeconds...)."""
+
+    def __init__(self, colecao: str, chaves: List[tuple], **opcoes):
+        self.colecao = colecao
+        self.chaves = [(campo, direcao) for campo, direcao in chaves]
+        self.opcoes = opcoes
+        # Mesmo nome que o pymongo geraria ("user_id_1_mes_ano_1").
+        self.nome = opcoes.pop("name", "_".join(f"{campo}_{direcao}" for campo, direcao in self.chaves))
+
+    def __repr__(self):
+        return f"Indice({self.colecao}.{self.nome})"
+
+
+def indices_transferencias() -> List[Indice]:
+    """Índices da coleção de transferências (ARMAZENAMENTO_TRANSFERENCIAS=colecao e migração)."""
+
+    return [
+        # Export e análise por período.
+        Indice(COLLECTION_TRANSFERENCIAS, [("user_id", ASCENDING), ("data", ASCENDING)]),
+        # Filtro por categoria dentro de um período.
+        Indice(COLLECTION_TRANSFERENCIAS, [("user_id", ASCENDING), ("categoria", ASCENDING), ("data", ASCENDING)]),
+        # Remontagem da fatura na ordem original; o unique torna a migração idempotente.
+        Indice(COLLECTION_TRANSFERENCIAS, [("fatura_id", ASCENDING), ("extrato_id", ASCENDING), ("indice", ASCENDING)],
+               unique=True),
+    ]
+
+
+def indices_necessarios() -> List[Indice]:
+    """Todos os índices de que a aplicação depende, por coleção."""
+
+    collection_users = os.getenv("COLLECTION_USERS")
+    collection_faturas = os.getenv("COLLECTION_FATURAS")
+
+    indices = [
+        Indice(collection_users, [("email", ASCENDING)], unique=True),
+        Indice(collection_users, [("cpf", ASCENDING)], unique=True),
+        # Uma fatura por usuário e mês: o upsert de salvar_extratos depende deste índice único.
+        Indice(collection_faturas, [("user_id", ASCENDING), ("mes_ano", ASCENDING)], unique=True),
+        # Paginação por cursor da listagem de faturas (mais recentes primeiro).
+        Indice(collection_faturas, [("user_id", ASCENDING), ("_id", DESCENDING)]),
+        # Detecção de reenvio: busca a impressão digital do extrato sem ler as faturas.
+        Indice(collection_faturas, [("user_id", ASCENDING), ("extratos.impressao_digital", ASCENDING)]),
+    ]
+    if CACHE_EXTRATOS == "mongo":
+        indices += [
+            # TTL: o Mongo remove a entrada quando expira_em passa.
+            Indice(COLLECTION_CACHE_EXTRATOS, [("expira_em", ASCENDING)], expireAfterSeconds=0),
+            # Ordenação da remoção LRU.
+            Indice(COLLECTION_CACHE_EXTRATOS, [("ultimo_acesso", ASCENDING)]),
+        ]
+    if ARMAZENAMENTO_TRANSFERENCIAS == "colecao":
+        indices += indices_transferencias()
+    if ADMISSAO_BACKEND == "mongo":
+        # TTL: remove os baldes de tokens que já estariam cheios.
+        indices.append(Indice(COLLECTION_ADMISSAO, [("expira_em", ASCENDING)], expireAfterSeconds=0))
+    return [indice for indice in indices if indice.colecao]
+
+
+def _chaves(info: dict) -> tuple:
+    # O servidor pode devolver a direção como float (1.0); índices especiais ("text", "2dsphere") ficam como string.
+    return tuple((campo, int(direcao) if isinstance(direcao, float) else direcao) for campo, direcao in info["key"].items())
+
+
+def _mesmas_opcoes(existente: dict, indice: Indice) -> bool:
+    return all(existente.get(opcao) == indice.opcoes.get(opcao) for opcao in OPCOES_COMPARADAS
+               if opcao in existente or opcao in indice.opcoes)
+
+
+def _restaurar(collection, existente: dict) -> None:
+    # A recriação falhou depois do drop (ex.: duplicatas impedem o unique): volta o índice antigo.
+    opcoes = {opcao: existente[opcao] for opcao in OPCOES_COMPARADAS if opcao in existente}
+    try:
+        collection.create_index(list(existente["key"].items()), name=existente["name"], **opcoes)
+    except OperationFailure as e:
+        print(f"Erro ao restaurar o índice {existente['name']}: {str(e)}")
+
+
+def garantir_indices(db, indices: Optional[List[Indice]] = None, recriar: bool = False) -> Dict[str, list]:
+    """Compara os índices declarados com list_indexes e cria só os que faltam.
+
+    Um índice com as mesmas chaves mas opções diferentes (ex.: sem unique) vai para "divergentes" e fica
+    como está: removê-lo e recriá-lo bloqueia a coleção durante o build, então só acontece com recriar=True.
+    Falhas (ex.: duplicatas impedindo um índice unique) são reportadas em "erros" sem interromper os demais.
+    """
+
+    relatorio = {"criados": [], "recriados": [], "existentes": [], "divergentes": [], "erros": []}
+    por_colecao: Dict[str, List[Indice]] = {}
+    for indice in indices if indices is not None else indices_necessarios():
+        por_colecao.setdefault(indice.colecao, []).append(indice)
+
+    for colecao, declarados in por_colecao.items():
+        collection = db[colecao]
+        existentes = {_chaves(info): info for info in collection.list_indexes()}
+
+        for indice in declarados:
+            identificador = f"{colecao}.{indice.nome}"
+            existente = existentes.get(tuple(indice.chaves))
+            try:
+                if existente is not None and _mesmas_opcoes(existente, indice):
+                    relatorio["existentes"].append(identificador)
+                    continue
+                if existente is not None and not recriar:
+                    print(f"Índice {identificador} diverge do declarado ({indice.opcoes}); "
+                          f"rode 'flask garantir-indices --recriar' para recriá-lo.")
+                    relatorio["divergentes"].append(identificador)
+                    continue
+                if existente is not None:
+                    collection.drop_index(existente["name"])
+                collection.create_index(indice.chaves, name=indice.nome, **indice.opcoes)
+                relatorio["recriados" if existente is not None else "criados"].append(identificador)
+            except OperationFailure as e:
+                print(f"Erro ao criar o índice {identificador}: {str(e)}")
+                relatorio["erros"].append(identificador)
+                if existente is not None:
+                    _restaurar(collection, existente)
+
+    return relatorio
@@ -0,0 +1,85 @@
+import pytest
+from pymongo import ASCENDING
+
+from app import create_app
+from app.controller.utils_indices import Indice, garantir_indices, indices_necessarios
+
+mongomock = pytest.importorskip("mongomock")
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def declarados(monkeypatch):
+    monkeypatch.setenv("COLLECTION_USERS", "usuarios")
+    monkeypatch.setenv("COLLECTION_FATURAS", "faturas")
+    return indices_necessarios()
+
+
+class TestGarantirIndices:
+
+    def test_declara_indices_minimos(self, declarados):
+        nomes = {(indice.colecao, indice.nome) for indice in declarados}
+
+        assert {("usuarios", "email_1"), ("usuarios", "cpf_1"), ("faturas", "user_id_1_mes_ano_1")} <= nomes
+
+    def test_cria_so_os_que_faltam(self, db, declarados):
+        db.usuarios.create_index("email", unique=True)
+
+        primeiro = garantir_indices(db, declarados)
+        segundo = garantir_indices(db, declarados)
+
+        assert primeiro["existentes"] == ["usuarios.email_1"]
+        assert "usuarios.cpf_1" in primeiro["criados"]
+        assert segundo["criados"] == [] and segundo["recriados"] == []
+        assert len(segundo["existentes"]) == len(declarados)
+        assert db.usuarios.index_information()["cpf_1"]["unique"] is True
+
+    def test_indice_divergente_nao_e_removido_sem_recriar(self, db):
+        db.usuarios.create_index("email")
+
+        relatorio = garantir_indices(db, [Indice("usuarios", [("email", ASCENDING)], unique=True)])
+
+        assert relatorio["divergentes"] == ["usuarios.email_1"]
+        assert relatorio["recriados"] == []
+        assert "unique" not in db.usuarios.index_information()["email_1"]
+
+    def test_recria_indice_com_opcoes_diferentes(self, db):
+        db.usuarios.create_index("email")
+
+        relatorio = garantir_indices(db, [Indice("usuarios", [("email", ASCENDING)], unique=True)], recriar=True)
+
+        assert relatorio["recriados"] == ["usuarios.email_1"]
+        assert db.usuarios.index_information()["email_1"]["unique"] is True
+
+    def test_indice_ttl_do_cache(self, db, declarados):
+        garantir_indices(db, declarados)
+
+        indices = db.cache_extratos.index_information()
+        assert any(indice.get("expireAfterSeconds") == 0 for indice in indices.values())
+
+
+def test_comando_cli(db, declarados, monkeypatch):
+    monkeypatch.setattr("app.cli.get_db_connection", lambda: db)
+    resultado = create_app().test_cli_runner().invoke(args=["garantir-indices"])
+
+    assert resultado.exit_code == 0
+    assert "criados: usuarios.email_1" in resultado.output
+
+
+def test_comando_cli_so_recria_com_a_flag(db, declarados, monkeypatch):
+    monkeypatch.setattr("app.cli.get_db_connection", lambda: db)
+    db.usuarios.create_index("email")
+    runner = create_app().test_cli_runner()
+
+    sem_flag = runner.invoke(args=["garantir-indices"])
+    assert sem_flag.exit_code == 1
+    assert "divergentes: usuarios.email_1" in sem_flag.output
+    assert "unique" not in db.usuarios.index_information()["email_1"]
+
+    com_flag = runner.invoke(args=["garantir-indices", "--recriar"])
+    assert com_flag.exit_code == 0
+    assert "recriados: usuarios.email_1" in com_flag.output
@@ -0,0 +1,139 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+import os
+import threading
+import time
+import uuid
+from typing import Callable, List, Optional
+
+from app.controller.utils_formatar_extrato import formatar_extratos
+from app.controller.utils_metricas import rastrear, span
+
+
+# Backend local da fila de ingestão: um pool de threads no próprio processo e os jobs guardados em memória.
+# Cada worker do gunicorn tem a sua fila, então a consulta de status deve cair no mesmo processo
+# (o Procfile sobe um único processo por dyno).
+INGESTAO_MAX_WORKERS = int(os.getenv("INGESTAO_MAX_WORKERS", "2"))
+INGESTAO_JOB_TTL = int(os.getenv("INGESTAO_JOB_TTL", "3600"))
+
+STATUS_PENDENTE = "pendente"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+
+
+class JobStore:
+    """Guarda o estado dos jobs de ingestão em memória, descartando os finalizados após o TTL."""
+
+    def __init__(self, ttl: int = INGESTAO_JOB_TTL):
+        self._ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def criar(self, user_id: str, total_arquivos: int) -> dict:
+        agora = time.time()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "status": STATUS_PENDENTE,
+            "total_arquivos": total_arquivos,
+            "arquivos_processados": 0,
+            "criado_em": datetime.now(timezone.utc).isoformat(),
+            "finalizado_em": None,
+            "resultado": None,
+            "duplicados": None,
+            "erro": None,
+            "_expira_em": None,
+        }
+        with self._lock:
+            self._descartar_expirados(agora)
+            self._jobs[job["job_id"]] = job
+        return dict(job)
+
+    def atualizar(self, job_id: str, **campos) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(campos)
+            if campos.get("status") in (STATUS_CONCLUIDO, STATUS_ERRO):
+                job["finalizado_em"] = datetime.now(timezone.utc).isoformat()
+                job["_expira_em"] = time.time() + self._ttl
+
+    def incrementar_progresso(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job["arquivos_processados"] += 1
+
+    def obter(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def _descartar_expirados(self, agora: float) -> None:
+        expirados = [
+            job_id for job_id, job in self._jobs.items()
+            if job["_expira_em"] is not None and job["_expira_em"] < agora
+        ]
+        for job_id in expirados:
+            del self._jobs[job_id]
+
+
+_store = JobStore()
+_executor = ThreadPoolExecutor(max_workers=INGESTAO_MAX_WORKERS, thread_name_prefix="ingestao")
+
+
+def obter_job(job_id: str) -> Optional[dict]:
+    return _store.obter(job_id)
+
+
+def enfileirar_ingestao(
+    user_id: str,
+    arquivos: List[BytesIO],
+    ao_finalizar: Callable[[List[dict]], Optional[List[dict]]],
+    ao_encerrar: Optional[Callable[[], None]] = None,
+) -> str:
+    """Enfileira o processamento dos arquivos e retorna o id do job.
+
+    `ao_finalizar` recebe os extratos já convertidos em dict e é responsável por persistí-los; o que ele
+    devolver (os arquivos deduplicados) fica em job["duplicados"]. `ao_encerrar` é chamado quando o
+    processamento dos arquivos termina, com sucesso ou erro (libera a reserva do controle de admissão).
+    """
+
+    job = _store.criar(user_id, len(arquivos))
+    _executor.submit(_processar_job, job["job_id"], arquivos, ao_finalizar, ao_encerrar)
+    return job["job_id"]
+
+
+def _processar_job(
+    job_id: str,
+    arquivos: List[BytesIO],
+    ao_finalizar: Callable[[List[dict]], Optional[List[dict]]],
+    ao_encerrar: Optional[Callable[[], None]] = None,
+) -> None:
+
+    _store.atualizar(job_id, status=STATUS_PROCESSANDO)
+    try:
+        with rastrear("ingestao_assincrona", job_id=job_id, arquivos=len(arquivos)):
+            try:
+                extratos = asyncio.run(
+                    formatar_extratos(arquivos, ao_concluir_arquivo=lambda _: _store.incrementar_progresso(job_id))
+                )
+            finally:
+                if ao_encerrar is not None:
+                    ao_encerrar()
+            extratos = [extrato.to_dict() for extrato in extratos]
+            with span("gravacao"):
+                duplicados = ao_finalizar(extratos)
+        _store.atualizar(job_id, status=STATUS_CONCLUIDO, resultado=extratos, duplicados=duplicados or [])
+    except Exception as e:
+        print(f"Erro ao processar job de ingestão {job_id}: {str(e)}")
+        _store.atualizar(job_id, status=STATUS_ERRO, erro=str(e))
+    finally:
+        for arquivo in arquivos:
+            arquivo.close()
@@ -0,0 +1,134 @@
+from datetime import date
+from io import BytesIO
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller import utils_jobs
+from app.models import Banco, BancoCandidato, Extrato
+
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def _extrato():
+    return Extrato(
+        banco=BancoCandidato(banco=Banco.NUBANK, score=0.9),
+        extrato=[],
+        data=date(2025, 10, 1),
+    )
+
+
+def _aguardar_fim(job_id, timeout=5):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        job = utils_jobs.obter_job(job_id)
+        if job["status"] in (utils_jobs.STATUS_CONCLUIDO, utils_jobs.STATUS_ERRO):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job não terminou a tempo")
+
+
+class TestFilaIngestao:
+
+    def test_job_concluido_persiste_e_guarda_resultado(self):
+        liberar = threading.Event()
+
+        async def fake_formatar(arquivos, ao_concluir_arquivo=None):
+            liberar.wait(5)
+            extratos = [_extrato() for _ in arquivos]
+            for extrato in extratos:
+                ao_concluir_arquivo(extrato)
+            return extratos
+
+        salvos = []
+        with patch("app.controller.utils_jobs.formatar_extratos", fake_formatar):
+            job_id = utils_jobs.enfileirar_ingestao(USER_ID, [BytesIO(b"a"), BytesIO(b"b")], salvos.append)
+
+            job = utils_jobs.obter_job(job_id)
+            assert job["status"] in (utils_jobs.STATUS_PENDENTE, utils_jobs.STATUS_PROCESSANDO)
+            assert salvos == []
+
+            liberar.set()
+            job = _aguardar_fim(job_id)
+
+        assert job["status"] == utils_jobs.STATUS_CONCLUIDO
+        assert job["arquivos_processados"] == 2
+        assert len(job["resultado"]) == 2
+        assert salvos == [job["resultado"]]
+
+    def test_job_com_erro_nao_persiste(self):
+        async def fake_formatar(arquivos, ao_concluir_arquivo=None):
+            raise Exception("Falha ao enviar extrato para o parser.")
+
+        salvos = []
+        with patch("app.controller.utils_jobs.formatar_extratos", fake_formatar):
+            job_id = utils_jobs.enfileirar_ingestao(USER_ID, [BytesIO(b"a")], salvos.append)
+            job = _aguardar_fim(job_id)
+
+        assert job["status"] == utils_jobs.STATUS_ERRO
+        assert "parser" in job["erro"]
+        assert salvos == []
+
+    def test_jobs_expirados_sao_descartados(self):
+        store = utils_jobs.JobStore(ttl=0)
+        job = store.criar(USER_ID, 1)
+        store.atualizar(job["job_id"], status=utils_jobs.STATUS_CONCLUIDO)
+        time.sleep(0.01)
+
+        store.criar(USER_ID, 1)
+
+        assert store.obter(job["job_id"]) is None
+
+
+class TestRotasIngestaoAssincrona:
+
+    @pytest.fixture
+    def app(self):
+        app = create_app()
+        app.config["TESTING"] = True
+        return app
+
+    @pytest.fixture
+    def headers(self, app):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=USER_ID)}"}
+
+    @patch("app.routes.get_db")
+    @patch("app.routes.get_db_connection")
+    @patch("app.routes.enfileirar_ingestao")
+    def test_post_extrato_assincrono_retorna_202(self, mock_enfileirar, mock_get_db_connection, mock_get_db, app, headers):
+        mock_enfileirar.return_value = "abc123"
+
+        response = app.test_client().post(
+            f"/faturas/usuario/{USER_ID}?assincrono=true",
+            data={"file": (BytesIO(b"%PDF fake"), "extrato.pdf")},
+            content_type="multipart/form-data",
+            headers=headers,
+        )
+
+        assert response.status_code == 202
+        assert response.get_json()["job_id"] == "abc123"
+        assert response.headers["Location"] == "/faturas/jobs/abc123"
+
+    @patch("app.routes.get_db")
+    @patch("app.routes.obter_job")
+    def test_get_job_de_outro_usuario_e_negado(self, mock_obter_job, mock_get_db, app, headers):
+        mock_obter_job.return_value = {"job_id": "abc123", "user_id": "outro", "status": "pendente"}
+
+        response = app.test_client().get("/faturas/jobs/abc123", headers=headers)
+
+        assert response.status_code == 403
+
+    @patch("app.routes.get_db")
+    @patch("app.routes.obter_job")
+    def test_get_job_inexistente(self, mock_obter_job, mock_get_db, app, headers):
+        mock_obter_job.return_value = None
+
+        response = app.test_client().get("/faturas/jobs/abc123", headers=headers)
+
+        assert response.status_code == 404
@@ -0,0 +1,100 @@
+from datetime import date
+import os
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING
+
+from app.controller.utils_datas import LER_DATAS_LEGADAS, fatura_para_api, mes_ano_int
+
+
+# Tamanho de página de GET /faturas/ e /faturas/usuario/<id> (?limit=), com teto para não voltar a
+# carregar tudo de uma vez.
+FATURAS_LIMITE_PADRAO = int(os.getenv("FATURAS_LIMITE_PADRAO", "20"))
+FATURAS_LIMITE_MAXIMO = int(os.getenv("FATURAS_LIMITE_MAXIMO", "100"))
+
+# mes_ano é o inteiro YYYYMM, então from/to viram uma faixa ($gte/$lte). Faturas legadas guardam o texto
+# "MM/YYYY", que não ordena cronologicamente: enquanto LER_DATAS_LEGADAS estiver ligado, a faixa vem
+# acompanhada de um $in com os textos dos meses do intervalo. O limite evita um $in gigante.
+FATURAS_MAX_MESES_FILTRO = int(os.getenv("FATURAS_MAX_MESES_FILTRO", "240"))
+
+
+def _mes_para_indice(mes_ano: str) -> int:
+    numero = mes_ano_int(mes_ano)
+    return numero // 100 * 12 + numero % 100 - 1
+
+
+def _indice_para_mes(indice: int) -> str:
+    return f"{indice % 12 + 1:02d}/{indice // 12}"
+
+
+def meses_no_intervalo(de: Optional[str], ate: Optional[str]) -> List[str]:
+    """Meses "MM/YYYY" entre de e ate (inclusive). Sem ate, vai até o mês atual; sem de, volta FATURAS_MAX_MESES_FILTRO meses."""
+
+    hoje = date.today()
+    fim = _mes_para_indice(ate) if ate else hoje.year * 12 + hoje.month - 1
+    inicio = _mes_para_indice(de) if de else fim - FATURAS_MAX_MESES_FILTRO + 1
+    if inicio > fim:
+        raise ValueError("'from' deve ser anterior ou igual a 'to'")
+    if fim - inicio + 1 > FATURAS_MAX_MESES_FILTRO:
+        raise ValueError(f"Intervalo maior que {FATURAS_MAX_MESES_FILTRO} meses")
+    return [_indice_para_mes(indice) for indice in range(inicio, fim + 1)]
+
+
+def filtro_mes_ano(de: Optional[str], ate: Optional[str]) -> dict:
+    """Condição (para mesclar no filtro da consulta) das faturas entre os meses de e ate ("MM/YYYY")."""
+
+    # Valida o intervalo (e monta os textos legados) mesmo que só a faixa seja usada.
+    meses = meses_no_intervalo(de, ate)
+    faixa = {}
+    if de:
+        faixa["$gte"] = mes_ano_int(de)
+    if ate:
+        faixa["$lte"] = mes_ano_int(ate)
+    if not LER_DATAS_LEGADAS:
+        return {"mes_ano": faixa}
+    return {"$or": [{"mes_ano": faixa}, {"mes_ano": {"$in": meses}}]}
+
+
+def listar_faturas(faturas_collection, user_id: str, args, repositorio=None) -> Tuple[List[dict], Optional[str]]:
+    """Uma página de faturas do usuário, da mais recente para a mais antiga, e o cursor da próxima.
+
+    Parâmetros (query string): limit, cursor (o next_cursor da página anterior), from/to (MM/YYYY)
+    e incluir_extratos=true para trazer as listas de extratos (com as transferências lidas pelo
+    repositório, quando informado). Lança ValueError se algum for inválido.
+    """
+
+    try:
+        limite = int(args.get("limit", FATURAS_LIMITE_PADRAO))
+    except ValueError:
+        raise ValueError("'limit' deve ser um número inteiro")
+    if limite < 1:
+        raise ValueError("'limit' deve ser maior que zero")
+    limite = min(limite, FATURAS_LIMITE_MAXIMO)
+
+    filtro = {"user_id": user_id}
+    cursor = args.get("cursor")
+    if cursor:
+        try:
+            filtro["_id"] = {"$lt": ObjectId(cursor)}
+        except InvalidId:
+            raise ValueError("'cursor' inválido")
+    if args.get("from") or args.get("to"):
+        filtro.update(filtro_mes_ano(args.get("from"), args.get("to")))
+
+    incluir_extratos = args.get("incluir_extratos", "false").lower() == "true"
+    projecao = None if incluir_extratos else {"extratos": 0}
+
+    # Um documento a mais só para saber se existe próxima página. Índice (user_id, _id) atende filtro e ordenação.
+    faturas = list(faturas_collection.find(filtro, projecao).sort("_id", DESCENDING).limit(limite + 1))
+    proximo = None
+    if len(faturas) > limite:
+        faturas = faturas[:limite]
+        proximo = str(faturas[-1]["_id"])
+
+    for fatura in faturas:
+        if incluir_extratos and repositorio is not None:
+            fatura["extratos"] = repositorio.extratos_da_fatura(fatura)
+        fatura["_id"] = str(fatura["_id"])
+    return [fatura_para_api(fatura) for fatura in faturas], proximo
@@ -0,0 +1,133 @@
+import json
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller.utils_listagem_faturas import listar_faturas, meses_no_intervalo
+
+mongomock = pytest.importorskip("mongomock")
+
+
+USER_ID = "507f1f77bcf86cd799439011"
+N_FATURAS = 2000
+
+
+def _fatura(user_id, indice_mes, n_transferencias=20):
+    mes_ano = f"{indice_mes % 12 + 1:02d}/{2000 + indice_mes // 12}"
+    transferencias = [{"valor": -1.5 * i, "data": "01/01/2025", "origem": "PIX", "categoria": "OUTROS"} for i in range(n_transferencias)]
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "mes_ano": mes_ano,
+        "extratos": [{"banco": "NUBANK", "data": mes_ano, "transferencias": transferencias}],
+    }
+
+
+@pytest.fixture
+def faturas():
+    collection = mongomock.MongoClient().db.faturas
+    collection.insert_many([_fatura(USER_ID, i) for i in range(60)])
+    collection.insert_many([_fatura("outro", i) for i in range(5)])
+    return collection
+
+
+class TestMesesNoIntervalo:
+
+    def test_intervalo_atravessa_ano(self):
+        assert meses_no_intervalo("11/2024", "02/2025") == ["11/2024", "12/2024", "01/2025", "02/2025"]
+
+    @pytest.mark.parametrize("de,ate", [("13/2024", None), ("2024-01", None), ("03/2025", "01/2025"), ("01/1900", "01/2025")])
+    def test_parametros_invalidos(self, de, ate):
+        with pytest.raises(ValueError):
+            meses_no_intervalo(de, ate)
+
+
+class TestListarFaturas:
+
+    def test_percorre_todas_as_paginas_sem_repetir(self, faturas):
+        vistos = []
+        cursor = None
+        while True:
+            args = {"limit": "7"}
+            if cursor:
+                args["cursor"] = cursor
+            pagina, cursor = listar_faturas(faturas, USER_ID, args)
+            assert len(pagina) <= 7
+            vistos += [fatura["_id"] for fatura in pagina]
+            if cursor is None:
+                break
+
+        assert len(vistos) == 60 == len(set(vistos))
+        assert vistos == sorted(vistos, reverse=True)
+
+    def test_resumo_sem_extratos_por_padrao(self, faturas):
+        resumo, _ = listar_faturas(faturas, USER_ID, {})
+        completo, _ = listar_faturas(faturas, USER_ID, {"incluir_extratos": "true"})
+
+        assert all("extratos" not in fatura for fatura in resumo)
+        assert all("extratos" in fatura for fatura in completo)
+
+    def test_filtro_por_mes(self, faturas):
+        pagina, proximo = listar_faturas(faturas, USER_ID, {"from": "11/2001", "to": "02/2002", "limit": "100"})
+
+        assert sorted(fatura["mes_ano"] for fatura in pagina) == ["01/2002", "02/2002", "11/2001", "12/2001"]
+        assert proximo is None
+
+    @pytest.mark.parametrize("args", [{"limit": "0"}, {"limit": "abc"}, {"cursor": "xyz"}, {"from": "2025"}])
+    def test_parametros_invalidos(self, faturas, args):
+        with pytest.raises(ValueError):
+            listar_faturas(faturas, USER_ID, args)
+
+    def test_pagina_constante(self):
+        """Com milhares de faturas, o tamanho da página não cresce com o histórico."""
+        collection = mongomock.MongoClient().db.faturas
+        collection.insert_many([_fatura(USER_ID, i) for i in range(N_FATURAS)])
+
+        tudo = list(collection.find({"user_id": USER_ID}))
+        for fatura in tudo:
+            fatura["_id"] = str(fatura["_id"])
+        tamanho_tudo = len(json.dumps(tudo))
+
+        tamanhos = []
+        cursor = None
+        for _ in range(5):
+            args = {"limit": "20", "cursor": cursor} if cursor else {"limit": "20"}
+            pagina, cursor = listar_faturas(collection, USER_ID, args)
+            tamanhos.append(len(json.dumps(pagina)))
+
+        assert max(tamanhos) < 1.2 * min(tamanhos)
+        assert max(tamanhos) * 100 < tamanho_tudo
+
+
+class TestRotasListagem:
+
+    @pytest.fixture
+    def app(self):
+        app = create_app()
+        app.config["TESTING"] = True
+        return app
+
+    @pytest.fixture
+    def headers(self, app):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=USER_ID)}"}
+
+    def test_get_faturas_paginado(self, app, headers, faturas):
+        with patch("app.routes.get_db_connection", return_value={"faturas": faturas}), \
+             patch("app.routes.COLLECTION_FATURAS", "faturas"):
+            primeira = app.test_client().get("/faturas/?limit=50", headers=headers).get_json()
+            segunda = app.test_client().get(f"/faturas/?limit=50&cursor={primeira['next_cursor']}", headers=headers).get_json()
+
+        assert len(primeira["faturas"]) == 50
+        assert len(segunda["faturas"]) == 10
+        assert segunda["next_cursor"] is None
+
+    def test_parametro_invalido_retorna_400(self, app, headers, faturas):
+        with patch("app.routes.get_db_connection", return_value={"faturas": faturas}), \
+             patch("app.routes.COLLECTION_FATURAS", "faturas"):
+            response = app.test_client().get("/faturas/?limit=abc", headers=headers)
+
+        assert response.status_code == 400
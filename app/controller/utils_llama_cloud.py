@@ -0,0 +1,82 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+LLAMA_CLOUD_BASE_URL = os.getenv("LLAMA_CLOUD_BASE_URL", "https://api.cloud.llamaindex.ai/api/v1")
+LLAMA_POOL_SIZE = int(os.getenv("LLAMA_POOL_SIZE", "10"))
+LLAMA_TIMEOUT_CONEXAO = float(os.getenv("LLAMA_TIMEOUT_CONEXAO", "5"))
+LLAMA_TIMEOUT_LEITURA = float(os.getenv("LLAMA_TIMEOUT_LEITURA", "60"))
+LLAMA_RETRIES = int(os.getenv("LLAMA_RETRIES", "3"))
+
+# Só GETs são repetidos em respostas de erro; o upload é repetido apenas em falha de conexão,
+# para não criar jobs duplicados no parser.
+_STATUS_RETRY = (429, 500, 502, 503, 504)
+
+
+def _ler_api_key() -> str:
+    api_key = os.getenv("LLAMA_CLOUD_API_KEY")
+    if not api_key:
+        raise ValueError("A variável de ambiente LLAMA_CLOUD_API_KEY não está definida.")
+    return api_key
+
+
+class LlamaCloudClient:
+    """Cliente HTTP da LlamaCloud com sessão persistente (keep-alive), pool de conexões, timeouts e retries."""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = LLAMA_CLOUD_BASE_URL,
+        pool_size: int = LLAMA_POOL_SIZE,
+        timeout: Tuple[float, float] = (LLAMA_TIMEOUT_CONEXAO, LLAMA_TIMEOUT_LEITURA),
+        retries: int = LLAMA_RETRIES,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            backoff_factor=0.3,
+            status_forcelist=_STATUS_RETRY,
+            allowed_methods=frozenset({"GET"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(f"{self.base_url}{path}", **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(f"{self.base_url}{path}", **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_cliente: Optional[LlamaCloudClient] = None
+_cliente_lock = threading.Lock()
+
+
+def obter_cliente_llama() -> LlamaCloudClient:
+    """Cliente compartilhado pelo processo; a API key é lida uma única vez, na criação."""
+
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _cliente = LlamaCloudClient(_ler_api_key())
+    return _cliente
+
@@ -0,0 +1,104 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from app.controller import utils_extrato_functions, utils_llama_cloud
+from app.controller.utils_llama_cloud import LlamaCloudClient
+
+
+N_CHAMADAS = 50
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Simula a LlamaCloud: responde JSON com keep-alive e conta conexões novas."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.conexoes += 1
+
+    def _responder(self, payload):
+        corpo = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def do_GET(self):
+        self.server.autorizacoes.append(self.headers.get("Authorization"))
+        self._responder({"id": self.path.rsplit("/", 1)[-1], "status": "SUCCESS"})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self._responder({"id": "job-1"})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.conexoes = 0
+    server.autorizacoes = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _base_url(servidor):
+    return f"http://127.0.0.1:{servidor.server_address[1]}/api/v1"
+
+
+class TestLlamaCloudClient:
+
+    def test_reaproveita_conexao_e_envia_api_key(self, servidor):
+        cliente = LlamaCloudClient("chave", base_url=_base_url(servidor))
+
+        for i in range(5):
+            assert cliente.get(f"/parsing/job/{i}").json()["status"] == "SUCCESS"
+
+        assert servidor.conexoes == 1
+        assert servidor.autorizacoes == ["Bearer chave"] * 5
+
+    def test_funcoes_do_extrato_usam_cliente_compartilhado(self, servidor):
+        cliente = LlamaCloudClient("chave", base_url=_base_url(servidor))
+
+        with patch("app.controller.utils_extrato_functions.obter_cliente_llama", return_value=cliente):
+            response = utils_extrato_functions.post_extrato_parser(b"%PDF fake", "extrato.pdf")
+            status = utils_extrato_functions.get_status_job_parser("abc")
+
+        assert response.json()["id"] == "job-1"
+        assert status.json()["id"] == "abc"
+        assert servidor.conexoes == 1
+
+    def test_sem_api_key(self, monkeypatch):
+        monkeypatch.delenv("LLAMA_CLOUD_API_KEY", raising=False)
+        monkeypatch.setattr(utils_llama_cloud, "_cliente", None)
+
+        with pytest.raises(ValueError):
+            utils_llama_cloud.obter_cliente_llama()
+
+    def test_chamadas_avulsas_abrem_uma_conexao_cada(self, servidor):
+        url = _base_url(servidor)
+        for i in range(N_CHAMADAS):
+            requests.get(f"{url}/parsing/job/{i}", headers={"Authorization": "Bearer chave"})
+        conexoes_sem_pool = servidor.conexoes
+
+        cliente = LlamaCloudClient("chave", base_url=url)
+        for i in range(N_CHAMADAS):
+            cliente.get(f"/parsing/job/{i}")
+
+        assert conexoes_sem_pool == N_CHAMADAS
+        assert servidor.conexoes - conexoes_sem_pool == 1
@@ -0,0 +1,288 @@
+from bisect import bisect_left
+from contextvars import ContextVar
+import functools
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+# Métricas e rastro por etapa do pipeline de extratos. Desligadas, span() devolve um objeto nulo
+# compartilhado e as funções de registro retornam na primeira linha: nada é medido nem alocado.
+METRICAS_HABILITADAS = os.getenv("METRICAS_HABILITADAS", "False").lower() == "true"
+# Se definido, GET /metrics exige "Authorization: Bearer <METRICAS_TOKEN>".
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+BUCKETS_CONTAGEM = (1, 2, 5, 10, 20, 50, 100)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(rotulos: Rotulos, extra: Optional[Tuple[str, str]] = None) -> str:
+    pares = list(rotulos) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+def _numero(valor: float) -> str:
+    valor = float(valor)
+    if valor == float("inf"):
+        return "+Inf"
+    return str(int(valor)) if valor.is_integer() else repr(valor)
+
+
+class Registro:
+    """Contadores e histogramas com rótulos, exportados no formato de texto do Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._declaradas: Dict[str, Tuple[str, str, Optional[tuple]]] = {}
+        self._contadores: Dict[Tuple[str, Rotulos], float] = {}
+        self._histogramas: Dict[Tuple[str, Rotulos], list] = {}
+
+    def declarar(self, nome: str, tipo: str, ajuda: str, buckets: Optional[tuple] = None) -> None:
+        self._declaradas[nome] = (tipo, ajuda, tuple(buckets) if buckets else None)
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos) -> None:
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome: str, valor: float, **rotulos) -> None:
+        buckets = self._declaradas[nome][2]
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                # Contagem por bucket (não cumulativa), soma e total.
+                histograma = self._histogramas[chave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            histograma[0][bisect_left(buckets, valor)] += 1
+            histograma[1] += valor
+            histograma[2] += 1
+
+    def valor(self, nome: str, **rotulos) -> float:
+        """Valor atual de um contador (ou o total de observações de um histograma)."""
+
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            if chave in self._histogramas:
+                return self._histogramas[chave][2]
+            return self._contadores.get(chave, 0)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._contadores.clear()
+            self._histogramas.clear()
+
+    def exportar(self) -> str:
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {chave: [list(h[0]), h[1], h[2]] for chave, h in self._histogramas.items()}
+
+        linhas = []
+        for nome, (tipo, ajuda, buckets) in sorted(self._declaradas.items()):
+            series = sorted((rotulos, dados) for (n, rotulos), dados in (histogramas if tipo == "histogram" else contadores).items()
+                            if n == nome)
+            if not series:
+                continue
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} {tipo}"]
+            for rotulos, dados in series:
+                if tipo != "histogram":
+                    linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_numero(dados)}")
+                    continue
+                contagens, soma, total = dados
+                acumulado = 0
+                for limite, contagem in zip(list(buckets) + [float("inf")], contagens):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, ('le', _numero(limite)))} {acumulado}")
+                linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {_numero(soma)}")
+                linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {total}")
+        return "\n".join(linhas) + "\n"
+
+
+registro = Registro()
+registro.declarar("extrato_etapa_duracao_segundos", "histogram",
+                  "Duração de cada etapa do pipeline de extratos", BUCKETS_SEGUNDOS)
+registro.declarar("extrato_etapa_erros_total", "counter", "Etapas do pipeline de extratos que terminaram com erro")
+registro.declarar("extrato_payload_bytes", "histogram",
+                  "Tamanho dos dados de cada etapa (PDF enviado, texto do parser, imagens)", BUCKETS_BYTES)
+registro.declarar("extrato_polls_por_job", "histogram", "Consultas de status por job do parser", BUCKETS_CONTAGEM)
+registro.declarar("extrato_llm_tokens_total", "counter", "Tokens das chamadas à LLM por cadeia e tipo")
+
+
+class Rastro:
+    """Etapas e contadores de uma requisição (ou job), para a linha de log estruturada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.etapas: List[dict] = []
+        self.contadores: Dict[str, float] = {}
+
+    def adicionar(self, etapa: dict) -> None:
+        with self._lock:
+            self.etapas.append(etapa)
+
+    def somar(self, campo: str, valor: float) -> None:
+        with self._lock:
+            self.contadores[campo] = self.contadores.get(campo, 0) + valor
+
+
+# Propagado para as threads do pipeline pelo contextvars.copy_context() de _em_thread.
+_rastro: ContextVar[Optional[Rastro]] = ContextVar("rastro_metricas", default=None)
+
+
+class _SpanNulo:
+    ativo = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def anotar(self, **atributos) -> None:
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+class Span:
+    """Mede uma etapa: duração no histograma, erro no contador e a etapa no rastro da requisição."""
+
+    __slots__ = ("etapa", "atributos", "_inicio")
+    ativo = True
+
+    def __init__(self, etapa: str, atributos: dict):
+        self.etapa = etapa
+        self.atributos = atributos
+        self._inicio = 0.0
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_erro, erro, _):
+        duracao = time.perf_counter() - self._inicio
+        registro.observar("extrato_etapa_duracao_segundos", duracao, etapa=self.etapa)
+        if tipo_erro is not None:
+            registro.incrementar("extrato_etapa_erros_total", etapa=self.etapa)
+        rastro = _rastro.get()
+        if rastro is not None:
+            rastro.adicionar({"etapa": self.etapa, "duracao_ms": round(duracao * 1000, 2),
+                              **({"erro": tipo_erro.__name__} if tipo_erro is not None else {}), **self.atributos})
+        return False
+
+    def anotar(self, **atributos) -> None:
+        self.atributos.update(atributos)
+
+
+def span(etapa: str, **atributos):
+    """Context manager de uma etapa (`with span("upload_parser") as s: ...`); nulo com as métricas desligadas."""
+
+    if not METRICAS_HABILITADAS:
+        return _SPAN_NULO
+    return Span(etapa, atributos)
+
+
+def registrar_tamanho(etapa: str, tamanho: int) -> None:
+    if not METRICAS_HABILITADAS:
+        return
+    registro.observar("extrato_payload_bytes", tamanho, etapa=etapa)
+    rastro = _rastro.get()
+    if rastro is not None:
+        rastro.somar(f"bytes_{etapa}", tamanho)
+
+
+def registrar_polls(quantidade: int) -> None:
+    if not METRICAS_HABILITADAS:
+        return
+    registro.observar("extrato_polls_por_job", quantidade)
+    rastro = _rastro.get()
+    if rastro is not None:
+        rastro.somar("polls", quantidade)
+
+
+def registrar_tokens(cadeia: str, uso: Optional[dict]) -> None:
+    """Tokens de uma chamada à LLM (usage_metadata da AIMessage: input_tokens/output_tokens)."""
+
+    if not METRICAS_HABILITADAS or not uso:
+        return
+    for tipo, campo in (("entrada", "input_tokens"), ("saida", "output_tokens")):
+        quantidade = uso.get(campo) or 0
+        registro.incrementar("extrato_llm_tokens_total", quantidade, cadeia=cadeia, tipo=tipo)
+        rastro = _rastro.get()
+        if rastro is not None:
+            rastro.somar(f"tokens_{tipo}", quantidade)
+
+
+def emitir_log(evento: str, duracao: float, rastro: Rastro, **campos) -> None:
+    # Uma linha JSON por requisição, para o agregador de logs.
+    print(json.dumps({
+        "evento": evento,
+        "duracao_ms": round(duracao * 1000, 2),
+        **campos,
+        **rastro.contadores,
+        "etapas": rastro.etapas,
+    }, default=str, ensure_ascii=False), flush=True)
+
+
+class Rastreamento:
+    """Context manager de uma requisição ou job: junta as etapas num Rastro e emite a linha de log ao sair."""
+
+    ativo = True
+
+    def __init__(self, evento: str, campos: dict):
+        self.evento = evento
+        self.campos = campos
+        self.rastro = Rastro()
+        self._token = None
+        self._inicio = 0.0
+
+    def __enter__(self):
+        self._token = _rastro.set(self.rastro)
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo_erro, erro, _):
+        _rastro.reset(self._token)
+        if tipo_erro is not None:
+            self.campos.setdefault("erro", tipo_erro.__name__)
+        emitir_log(self.evento, time.perf_counter() - self._inicio, self.rastro, **self.campos)
+        return False
+
+    def anotar(self, **campos) -> None:
+        self.campos.update(campos)
+
+
+def rastrear(evento: str, **campos):
+    """`with rastrear("ingestao", job_id=...)`: nulo com as métricas desligadas."""
+
+    if not METRICAS_HABILITADAS:
+        return _SPAN_NULO
+    return Rastreamento(evento, campos)
+
+
+def rastreado(evento: str):
+    """Decorator de rota: rastreia a chamada com os argumentos da URL e o status da resposta."""
+
+    def decorator(funcao):
+        @functools.wraps(funcao)
+        def executar(*args, **kwargs):
+            if not METRICAS_HABILITADAS:
+                return funcao(*args, **kwargs)
+            with rastrear(evento, **kwargs) as rastreamento:
+                resultado = funcao(*args, **kwargs)
+                if isinstance(resultado, tuple) and len(resultado) > 1:
+                    rastreamento.anotar(status=resultado[1])
+                return resultado
+        return executar
+    return decorator
@@ -0,0 +1,186 @@
+import asyncio
+from io import BytesIO
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from flask_jwt_extended import create_access_token
+from langchain_core.runnables import RunnableLambda
+
+from app import create_app
+import app.controller.utils_metricas as utils_metricas
+from app.controller.utils_cadeias_llm import saida_estruturada
+from app.controller.utils_metricas import (
+    Registro,
+    rastreado,
+    rastrear,
+    registrar_polls,
+    registrar_tamanho,
+    registro,
+    span,
+)
+
+
+@pytest.fixture
+def habilitadas(monkeypatch):
+    monkeypatch.setattr(utils_metricas, "METRICAS_HABILITADAS", True)
+    registro.limpar()
+    yield
+    registro.limpar()
+
+
+def test_exportacao_no_formato_do_prometheus():
+    reg = Registro()
+    reg.declarar("duracao", "histogram", "Duração", (0.1, 1))
+    reg.declarar("erros_total", "counter", "Erros")
+    reg.declarar("sem_series", "counter", "Nunca incrementado")
+    reg.observar("duracao", 0.05, etapa="cache")
+    reg.observar("duracao", 0.5, etapa="cache")
+    reg.observar("duracao", 3, etapa="cache")
+    reg.incrementar("erros_total", etapa='com "aspas"')
+
+    assert reg.exportar().splitlines() == [
+        "# HELP duracao Duração",
+        "# TYPE duracao histogram",
+        'duracao_bucket{etapa="cache",le="0.1"} 1',
+        'duracao_bucket{etapa="cache",le="1"} 2',
+        'duracao_bucket{etapa="cache",le="+Inf"} 3',
+        'duracao_sum{etapa="cache"} 3.55',
+        'duracao_count{etapa="cache"} 3',
+        "# HELP erros_total Erros",
+        "# TYPE erros_total counter",
+        'erros_total{etapa="com \\"aspas\\""} 1',
+    ]
+
+
+def test_desligadas_nao_registram_nada():
+    registro.limpar()
+    with span("cache") as s:
+        s.anotar(acerto=True)
+    registrar_tamanho("upload_parser", 100)
+    registrar_polls(3)
+
+    assert s.ativo is False
+    assert registro.exportar() == "\n"
+
+
+def test_span_registra_duracao_erro_e_etapa_no_rastro(habilitadas, capsys):
+    with rastrear("ingestao", job_id="j1"):
+        with span("upload_parser", arquivo="a.pdf"):
+            registrar_tamanho("upload_parser", 2048)
+        with pytest.raises(ValueError):
+            with span("polling"):
+                raise ValueError("prazo")
+        registrar_polls(4)
+
+    assert registro.valor("extrato_etapa_duracao_segundos", etapa="upload_parser") == 1
+    assert registro.valor("extrato_etapa_erros_total", etapa="polling") == 1
+    assert registro.valor("extrato_polls_por_job") == 1
+
+    linha = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert linha["evento"] == "ingestao"
+    assert linha["job_id"] == "j1"
+    assert linha["bytes_upload_parser"] == 2048
+    assert linha["polls"] == 4
+    assert [(e["etapa"], e.get("erro")) for e in linha["etapas"]] == [("upload_parser", None), ("polling", "ValueError")]
+    assert linha["etapas"][0]["arquivo"] == "a.pdf"
+
+
+def test_tokens_da_saida_estruturada(habilitadas):
+    resposta = {"raw": SimpleNamespace(usage_metadata={"input_tokens": 120, "output_tokens": 30}),
+                "parsed": "extrato", "parsing_error": None}
+    modelo = SimpleNamespace(with_structured_output=lambda schema, include_raw: RunnableLambda(lambda _: resposta))
+
+    assert saida_estruturada(modelo, object, "extrato").invoke({}) == "extrato"
+    assert registro.valor("extrato_llm_tokens_total", cadeia="extrato", tipo="entrada") == 120
+    assert registro.valor("extrato_llm_tokens_total", cadeia="extrato", tipo="saida") == 30
+
+
+def test_saida_estruturada_repassa_erro_de_parsing():
+    resposta = {"raw": SimpleNamespace(usage_metadata=None), "parsed": None, "parsing_error": ValueError("json")}
+    modelo = SimpleNamespace(with_structured_output=lambda schema, include_raw: RunnableLambda(lambda _: resposta))
+
+    with pytest.raises(ValueError):
+        saida_estruturada(modelo, object, "banco").invoke({})
+
+
+def test_rastro_atravessa_as_tarefas_e_threads_do_pipeline(habilitadas, capsys):
+    from app.controller.utils_formatar_extrato import _em_thread
+
+    async def etapa(nome):
+        with span(nome):
+            await _em_thread(registrar_tamanho, nome, 10)
+
+    async def pipeline():
+        await asyncio.gather(etapa("a"), etapa("b"))
+
+    with rastrear("post_extrato"):
+        asyncio.run(pipeline())
+
+    linha = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert sorted(e["etapa"] for e in linha["etapas"]) == ["a", "b"]
+    assert linha["bytes_a"] == linha["bytes_b"] == 10
+
+
+def test_rastreado_anota_o_status(habilitadas, capsys):
+    @rastreado("rota")
+    def rota(user_id):
+        return {"ok": True}, 201
+
+    assert rota(user_id="u1") == ({"ok": True}, 201)
+    linha = json.loads(capsys.readouterr().out)
+    assert (linha["evento"], linha["user_id"], linha["status"]) == ("rota", "u1", 201)
+
+
+class TestRotaMetrics:
+
+    def test_desligada_responde_404(self):
+        assert create_app().test_client().get("/metrics").status_code == 404
+
+    def test_exporta_e_exige_token(self, habilitadas, monkeypatch):
+        monkeypatch.setattr(utils_metricas, "METRICAS_TOKEN", "segredo")
+        registro.observar("extrato_etapa_duracao_segundos", 0.2, etapa="cache")
+        cliente = create_app().test_client()
+
+        assert cliente.get("/metrics").status_code == 401
+        resposta = cliente.get("/metrics", headers={"Authorization": "Bearer segredo"})
+        assert resposta.status_code == 200
+        assert resposta.mimetype == "text/plain"
+        assert 'extrato_etapa_duracao_segundos_count{etapa="cache"} 1' in resposta.get_data(as_text=True)
+
+    def test_upload_emite_uma_linha_com_as_etapas(self, habilitadas, capsys):
+        mongomock = pytest.importorskip("mongomock")
+        db = mongomock.MongoClient().db
+        user_id = str(db.usuarios.insert_one({"faturas": []}).inserted_id)
+
+        async def formatar(arquivos):
+            return []
+
+        app = create_app()
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+
+        with patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios, "faturas": db.faturas}), \
+             patch("app.routes.COLLECTION_USERS", "usuarios"), patch("app.routes.COLLECTION_FATURAS", "faturas"), \
+             patch("app.routes.formatar_extratos", formatar):
+            resposta = app.test_client().post(f"/faturas/usuario/{user_id}", headers=headers,
+                                              content_type="multipart/form-data",
+                                              data={"file": [(BytesIO(b"%PDF"), "a.pdf")]})
+
+        assert resposta.status_code == 201
+        linhas = [json.loads(l) for l in capsys.readouterr().out.splitlines() if l.startswith("{")]
+        assert [(l["evento"], l["status"]) for l in linhas] == [("post_extrato", 201)]
+        assert [e["etapa"] for e in linhas[0]["etapas"]] == ["gravacao"]
+
+
+def test_desligadas_span_e_o_objeto_nulo():
+    """Desligadas, span() não aloca nem mede: devolve sempre o mesmo objeto nulo."""
+
+    registro.limpar()
+    with span("cache", arquivo="a.pdf") as s:
+        pass
+
+    assert s is utils_metricas._SPAN_NULO
+    assert span("llm_extrato") is s
+    assert registro.exportar() == "\n"
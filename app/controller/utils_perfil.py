@@ -0,0 +1,185 @@
+from contextvars import ContextVar
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from flask import request
+from pymongo import monitoring
+
+from app.controller.utils_metricas import BUCKETS_CONTAGEM, BUCKETS_SEGUNDOS, registro
+
+
+# Perfil das requisições: latência por rota e comandos do Mongo por coleção. Desligado, nem o
+# middleware nem o listener são instalados.
+PERFIL_HABILITADO = os.getenv("PERFIL_HABILITADO", "False").lower() == "true"
+# Requisições acima deste tempo são logadas com os comandos do Mongo que emitiram.
+PERFIL_LIMIAR_LENTO_MS = float(os.getenv("PERFIL_LIMIAR_LENTO_MS", "500"))
+# Teto de comandos listados na linha de log de uma requisição lenta (o total vai sempre).
+PERFIL_MAX_COMANDOS_LOG = int(os.getenv("PERFIL_MAX_COMANDOS_LOG", "50"))
+
+SEM_ROTA = "<sem rota>"
+SEM_COLECAO = "<banco>"
+
+registro.declarar("http_requisicao_duracao_segundos", "histogram",
+                  "Duração das requisições por rota, método e status", BUCKETS_SEGUNDOS)
+registro.declarar("http_mongo_comandos_por_requisicao", "histogram",
+                  "Comandos do Mongo emitidos por requisição, por rota", BUCKETS_CONTAGEM)
+registro.declarar("mongo_comando_duracao_segundos", "histogram",
+                  "Duração dos comandos do Mongo por coleção e comando", BUCKETS_SEGUNDOS)
+registro.declarar("mongo_comandos_falhos_total", "counter", "Comandos do Mongo que falharam, por coleção e comando")
+
+
+class PerfilRequisicao:
+    """Comandos do Mongo emitidos durante uma requisição (inclusive pelas threads do pipeline)."""
+
+    __slots__ = ("comandos",)
+
+    def __init__(self):
+        self.comandos: List[dict] = []
+
+
+_perfil: ContextVar[Optional[PerfilRequisicao]] = ContextVar("perfil_requisicao", default=None)
+
+
+def _colecao(comando_nome: str, comando: dict) -> str:
+    # find/insert/update/aggregate... trazem a coleção no valor do próprio comando; getMore, em "collection".
+    valor = comando.get("collection") if comando_nome == "getMore" else comando.get(comando_nome)
+    return valor if isinstance(valor, str) else SEM_COLECAO
+
+
+class ListenerComandos(monitoring.CommandListener):
+    """Mede cada comando do Mongo: histograma por coleção e comando, e o perfil da requisição atual."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # O evento de fim não traz o comando: a coleção é guardada no início, por requisição do driver.
+        self._pendentes: Dict[tuple, str] = {}
+
+    def started(self, event):
+        with self._lock:
+            self._pendentes[(event.connection_id, event.request_id)] = _colecao(event.command_name, event.command)
+
+    def succeeded(self, event):
+        self._registrar(event, erro=None)
+
+    def failed(self, event):
+        self._registrar(event, erro=str(event.failure.get("codeName") or event.failure.get("errmsg") or "erro"))
+
+    def _registrar(self, event, erro: Optional[str]) -> None:
+        with self._lock:
+            colecao = self._pendentes.pop((event.connection_id, event.request_id), SEM_COLECAO)
+        duracao = event.duration_micros / 1e6
+        registro.observar("mongo_comando_duracao_segundos", duracao, colecao=colecao, comando=event.command_name)
+        if erro is not None:
+            registro.incrementar("mongo_comandos_falhos_total", colecao=colecao, comando=event.command_name)
+
+        perfil = _perfil.get()
+        if perfil is not None:
+            comando = {"colecao": colecao, "comando": event.command_name, "duracao_ms": round(duracao * 1000, 2)}
+            if erro is not None:
+                comando["erro"] = erro
+            perfil.comandos.append(comando)
+
+
+def emitir_requisicao_lenta(metodo: str, rota: str, status: str, duracao: float, perfil: PerfilRequisicao) -> None:
+    comandos = perfil.comandos
+    print(json.dumps({
+        "evento": "requisicao_lenta",
+        "metodo": metodo,
+        "rota": rota,
+        "status": status,
+        "duracao_ms": round(duracao * 1000, 2),
+        "mongo_comandos": len(comandos),
+        "mongo_ms": round(sum(c["duracao_ms"] for c in comandos), 2),
+        "comandos": comandos[:PERFIL_MAX_COMANDOS_LOG],
+    }, ensure_ascii=False), flush=True)
+
+
+class _CorpoMedido:
+    """Repassa o corpo da resposta e fecha a medição quando o servidor termina de enviá-lo (streaming incluso)."""
+
+    def __init__(self, corpo, ao_fechar):
+        self._corpo = corpo
+        self._ao_fechar = ao_fechar
+
+    def __iter__(self):
+        return iter(self._corpo)
+
+    def close(self):
+        try:
+            if hasattr(self._corpo, "close"):
+                self._corpo.close()
+        finally:
+            self._ao_fechar()
+
+
+class MiddlewarePerfil:
+    """Middleware WSGI: duração de cada requisição por rota, método e status, e log das lentas."""
+
+    def __init__(self, wsgi_app, limiar_lento_ms: float = PERFIL_LIMIAR_LENTO_MS, relogio=time.perf_counter):
+        self.wsgi_app = wsgi_app
+        self.limiar_lento = limiar_lento_ms / 1000
+        self._relogio = relogio
+
+    def __call__(self, environ, start_response):
+        inicio = self._relogio()
+        perfil = PerfilRequisicao()
+        token = _perfil.set(perfil)
+        estado = {"status": "500"}
+
+        def start_response_medido(status, headers, *args):
+            estado["status"] = status.split(" ", 1)[0]
+            return start_response(status, headers, *args)
+
+        def finalizar():
+            try:
+                _perfil.reset(token)
+            except ValueError:
+                # close() chamado em outro contexto (servidores que trocam de thread no fim da resposta).
+                pass
+            self._finalizar(environ, estado["status"], self._relogio() - inicio, perfil)
+
+        try:
+            corpo = self.wsgi_app(environ, start_response_medido)
+        except BaseException:
+            finalizar()
+            raise
+        return _CorpoMedido(corpo, finalizar)
+
+    def _finalizar(self, environ, status: str, duracao: float, perfil: PerfilRequisicao) -> None:
+        # O template da rota ("/faturas/<fatura_id>") é anotado pelo before_request: mantém os rótulos finitos.
+        rota = environ.get("perfil.rota", SEM_ROTA)
+        metodo = environ.get("REQUEST_METHOD", "")
+        registro.observar("http_requisicao_duracao_segundos", duracao, rota=rota, metodo=metodo, status=status)
+        registro.observar("http_mongo_comandos_por_requisicao", len(perfil.comandos), rota=rota)
+        if duracao >= self.limiar_lento:
+            emitir_requisicao_lenta(metodo, rota, status, duracao, perfil)
+
+
+_listener: Optional[ListenerComandos] = None
+_listener_lock = threading.Lock()
+
+
+def registrar_listener() -> ListenerComandos:
+    """Registra o listener no pymongo uma vez por processo; vale para os MongoClient criados depois."""
+
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = ListenerComandos()
+            monitoring.register(_listener)
+    return _listener
+
+
+def instalar_perfil(app, limiar_lento_ms: float = PERFIL_LIMIAR_LENTO_MS) -> None:
+    """Envolve o app no middleware e registra o listener do Mongo. Chamar antes da primeira conexão."""
+
+    registrar_listener()
+
+    @app.before_request
+    def anotar_rota():
+        request.environ["perfil.rota"] = request.url_rule.rule if request.url_rule is not None else SEM_ROTA
+
+    app.wsgi_app = MiddlewarePerfil(app.wsgi_app, limiar_lento_ms)
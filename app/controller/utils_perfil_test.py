@@ -0,0 +1,155 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from bson import ObjectId
+from flask import Flask, Response, jsonify
+import pytest
+
+from app import create_app
+import app.controller.utils_perfil as utils_perfil
+from app.controller.utils_metricas import registro
+from app.controller.utils_perfil import (
+    SEM_COLECAO,
+    SEM_ROTA,
+    ListenerComandos,
+    _colecao,
+    instalar_perfil,
+    registrar_listener,
+)
+
+# Teste com o driver de verdade: precisa de um mongod (o mongomock não emite eventos de comando).
+MONGO_URI_TESTES = os.getenv("MONGO_URI_TESTES")
+
+
+@pytest.fixture(autouse=True)
+def limpar_registro():
+    registro.limpar()
+    yield
+    registro.limpar()
+
+
+def _executar(listener, comando_nome, comando, micros, request_id=1, falha=None):
+    base = {"connection_id": ("localhost", 27017), "request_id": request_id, "command_name": comando_nome}
+    listener.started(SimpleNamespace(command=comando, **base))
+    if falha is None:
+        listener.succeeded(SimpleNamespace(duration_micros=micros, **base))
+    else:
+        listener.failed(SimpleNamespace(duration_micros=micros, failure=falha, **base))
+
+
+@pytest.fixture
+def app():
+    """App mínimo com o perfil instalado; as rotas simulam os comandos que o driver emitiria."""
+
+    listener = ListenerComandos()
+    app = Flask(__name__)
+    instalar_perfil(app, limiar_lento_ms=50)
+
+    @app.route("/usuarios/<user_id>", methods=["PUT"])
+    def atualizar(user_id):
+        for i, colecao in enumerate(["usuarios", "usuarios", "usuarios"]):
+            _executar(listener, "find", {"find": colecao, "filter": {}}, 20_000, request_id=i)
+        _executar(listener, "update", {"update": "usuarios"}, 5_000, request_id=9)
+        time.sleep(0.06)
+        return jsonify({"ok": True}), 200
+
+    @app.route("/rapida")
+    def rapida():
+        _executar(listener, "find", {"find": "faturas"}, 100)
+        return jsonify({"ok": True})
+
+    @app.route("/stream")
+    def stream():
+        def gerar():
+            yield "a"
+            time.sleep(0.06)
+            _executar(listener, "getMore", {"getMore": 1, "collection": "faturas"}, 60_000)
+            yield "b"
+        return Response(gerar())
+
+    return app
+
+
+def test_colecao_do_comando():
+    assert _colecao("find", {"find": "faturas"}) == "faturas"
+    assert _colecao("getMore", {"getMore": 123, "collection": "faturas"}) == "faturas"
+    assert _colecao("ping", {"ping": 1}) == SEM_COLECAO
+
+
+def test_listener_registra_duracao_e_falhas_por_colecao():
+    listener = ListenerComandos()
+    _executar(listener, "find", {"find": "faturas"}, 1500)
+    _executar(listener, "createIndexes", {"createIndexes": "usuarios"}, 800, falha={"codeName": "IndexKeySpecsConflict"})
+
+    assert registro.valor("mongo_comando_duracao_segundos", colecao="faturas", comando="find") == 1
+    assert registro.valor("mongo_comandos_falhos_total", colecao="usuarios", comando="createIndexes") == 1
+    assert listener._pendentes == {}
+
+
+def test_requisicao_lenta_e_logada_com_os_comandos(app, capsys):
+    # O servidor WSGI chama close() ao terminar de enviar a resposta; o cliente de teste, só quando pedido.
+    resposta = app.test_client().put("/usuarios/abc")
+    resposta.close()
+
+    assert resposta.status_code == 200
+    linha = json.loads(capsys.readouterr().out)
+    assert (linha["evento"], linha["metodo"], linha["rota"], linha["status"]) == \
+        ("requisicao_lenta", "PUT", "/usuarios/<user_id>", "200")
+    assert linha["mongo_comandos"] == 4
+    assert linha["mongo_ms"] == 65
+    assert [c["comando"] for c in linha["comandos"]] == ["find", "find", "find", "update"]
+    assert registro.valor("http_requisicao_duracao_segundos", rota="/usuarios/<user_id>", metodo="PUT", status="200") == 1
+
+
+def test_requisicao_rapida_so_alimenta_o_histograma(app, capsys):
+    cliente = app.test_client()
+    cliente.get("/rapida").close()
+    inexistente = cliente.get("/inexistente")
+    inexistente.close()
+
+    assert inexistente.status_code == 404
+
+    assert capsys.readouterr().out == ""
+    assert registro.valor("http_requisicao_duracao_segundos", rota="/rapida", metodo="GET", status="200") == 1
+    assert registro.valor("http_requisicao_duracao_segundos", rota=SEM_ROTA, metodo="GET", status="404") == 1
+    assert registro.valor("http_mongo_comandos_por_requisicao", rota="/rapida") == 1
+
+
+def test_streaming_conta_o_corpo_inteiro(app, capsys):
+    resposta = app.test_client().get("/stream")
+
+    assert resposta.get_data(as_text=True) == "ab"
+    assert capsys.readouterr().out == ""
+    resposta.close()
+    linha = json.loads(capsys.readouterr().out)
+    assert linha["rota"] == "/stream"
+    assert linha["comandos"] == [{"colecao": "faturas", "comando": "getMore", "duracao_ms": 60.0}]
+
+
+def test_metrics_exposto_so_com_o_perfil(monkeypatch):
+    monkeypatch.setattr(utils_perfil, "PERFIL_HABILITADO", True)
+    registro.observar("http_requisicao_duracao_segundos", 0.1, rota="/faturas/", metodo="GET", status="200")
+
+    resposta = create_app().test_client().get("/metrics")
+
+    assert resposta.status_code == 200
+    assert 'http_requisicao_duracao_segundos_count{metodo="GET",rota="/faturas/",status="200"} 1' in resposta.get_data(as_text=True)
+
+
+@pytest.mark.skipif(not MONGO_URI_TESTES, reason="defina MONGO_URI_TESTES para rodar contra um mongod")
+def test_listener_com_o_driver():
+    from pymongo import MongoClient
+
+    registrar_listener()
+    cliente = MongoClient(MONGO_URI_TESTES, serverSelectionTimeoutMS=2000)
+    db = cliente[f"teste_perfil_{ObjectId()}"]
+    try:
+        db.faturas.insert_one({"x": 1})
+        db.faturas.find_one({"x": 1})
+        assert registro.valor("mongo_comando_duracao_segundos", colecao="faturas", comando="find") == 1
+        assert registro.valor("mongo_comando_duracao_segundos", colecao="faturas", comando="insert") == 1
+    finally:
+        cliente.drop_database(db.name)
+        cliente.close()
@@ -0,0 +1,149 @@
+import asyncio
+from collections import deque
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+
+# O intervalo começa abaixo de 1s (extratos pequenos ficam prontos rápido) e dobra a cada consulta
+# até o teto, com jitter para que vários jobs não consultem a API em sincronia.
+POLLING_INTERVALO_INICIAL = float(os.getenv("POLLING_INTERVALO_INICIAL", "0.5"))
+POLLING_INTERVALO_MAXIMO = float(os.getenv("POLLING_INTERVALO_MAXIMO", "8"))
+POLLING_FATOR = float(os.getenv("POLLING_FATOR", "2"))
+POLLING_PRAZO_MAXIMO = float(os.getenv("POLLING_PRAZO_MAXIMO", "600"))
+
+STATUS_SUCESSO = {"SUCCESS", "PARTIAL_SUCCESS"}
+STATUS_FALHA = {"ERROR", "CANCELED", "CANCELLED"}
+
+
+class ParserTimeoutError(Exception):
+    """O job do parser não terminou dentro do prazo máximo de espera."""
+
+
+class ParserJobError(Exception):
+    """O parser reportou falha no job."""
+
+
+class MetricasPolling:
+    """Registra o tempo até o resultado e o número de consultas de cada job aguardado."""
+
+    def __init__(self, max_registros: int = 200):
+        self._lock = threading.Lock()
+        self._registros = deque(maxlen=max_registros)
+        self._total_jobs = 0
+        self._total_segundos = 0.0
+        self._total_consultas = 0
+        self._acordados_por_webhook = 0
+        self._timeouts = 0
+
+    def registrar(self, job_id: str, segundos: float, consultas: int, status: str, via_webhook: bool) -> None:
+        with self._lock:
+            self._registros.append({
+                "job_id": job_id,
+                "segundos": round(segundos, 3),
+                "consultas": consultas,
+                "status": status,
+                "via_webhook": via_webhook,
+            })
+            self._total_jobs += 1
+            self._total_segundos += segundos
+            self._total_consultas += consultas
+            self._acordados_por_webhook += int(via_webhook)
+            self._timeouts += int(status == "TIMEOUT")
+
+    def resumo(self) -> dict:
+        with self._lock:
+            return {
+                "total_jobs": self._total_jobs,
+                "media_segundos": self._total_segundos / self._total_jobs if self._total_jobs else 0.0,
+                "media_consultas": self._total_consultas / self._total_jobs if self._total_jobs else 0.0,
+                "acordados_por_webhook": self._acordados_por_webhook,
+                "timeouts": self._timeouts,
+                "jobs_recentes": list(self._registros),
+            }
+
+
+metricas_polling = MetricasPolling()
+
+# job_id -> (loop, evento) dos jobs aguardando neste processo; o webhook acorda a espera correspondente.
+_esperas = {}
+_esperas_lock = threading.Lock()
+
+
+def notificar_conclusao(job_id: str) -> bool:
+    """Acorda a espera do job (chamado pela rota de webhook). Retorna False se ninguém aguarda o job aqui."""
+
+    with _esperas_lock:
+        espera = _esperas.get(job_id)
+    if espera is None:
+        return False
+    loop, evento = espera
+    try:
+        loop.call_soon_threadsafe(evento.set)
+    except RuntimeError:
+        # O loop da espera já foi fechado (asyncio.run terminou sem remover a entrada): descarta a espera.
+        with _esperas_lock:
+            if _esperas.get(job_id) is espera:
+                del _esperas[job_id]
+        return False
+    return True
+
+
+def proximo_intervalo(intervalo: float) -> float:
+    """Aplica jitter ao intervalo atual: valor sorteado entre metade e o intervalo inteiro."""
+    return intervalo / 2 + random.uniform(0, intervalo / 2)
+
+
+async def aguardar_job_parser(
+    job_id: str,
+    consultar_status: Callable[[], Awaitable[str]],
+    intervalo_inicial: Optional[float] = None,
+    intervalo_maximo: Optional[float] = None,
+    prazo_maximo: Optional[float] = None,
+) -> None:
+    """Aguarda o job do parser terminar com sucesso, consultando só o endpoint de status.
+
+    `consultar_status` deve retornar o status do job (ex.: "PENDING", "SUCCESS"). Levanta
+    ParserJobError se o job falhar e ParserTimeoutError se o prazo máximo for excedido.
+    """
+
+    intervalo = intervalo_inicial or POLLING_INTERVALO_INICIAL
+    intervalo_maximo = intervalo_maximo or POLLING_INTERVALO_MAXIMO
+    prazo_maximo = prazo_maximo or POLLING_PRAZO_MAXIMO
+
+    inicio = time.monotonic()
+    evento = asyncio.Event()
+    with _esperas_lock:
+        _esperas[job_id] = (asyncio.get_running_loop(), evento)
+
+    consultas = 0
+    via_webhook = False
+    status = "PENDING"
+    try:
+        while True:
+            status = (await consultar_status()).upper()
+            consultas += 1
+            if status in STATUS_SUCESSO:
+                return
+            if status in STATUS_FALHA:
+                raise ParserJobError(f"O parser falhou ao processar o extrato (status {status}).")
+
+            restante = prazo_maximo - (time.monotonic() - inicio)
+            if restante <= 0:
+                status = "TIMEOUT"
+                raise ParserTimeoutError("Tempo máximo de espera pelo parser excedido.")
+
+            try:
+                await asyncio.wait_for(evento.wait(), timeout=min(proximo_intervalo(intervalo), restante))
+                via_webhook = True
+                evento.clear()
+            except asyncio.TimeoutError:
+                pass
+            intervalo = min(intervalo * POLLING_FATOR, intervalo_maximo)
+    finally:
+        with _esperas_lock:
+            _esperas.pop(job_id, None)
+        segundos = time.monotonic() - inicio
+        metricas_polling.registrar(job_id, segundos, consultas, status, via_webhook)
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.controller import utils_polling
+from app.controller.utils_polling import (
+    ParserJobError,
+    ParserTimeoutError,
+    aguardar_job_parser,
+    notificar_conclusao,
+)
+
+
+def _status_em_sequencia(*status):
+    respostas = list(status)
+    chamadas = []
+
+    async def consultar():
+        chamadas.append(time.monotonic())
+        return respostas.pop(0) if len(respostas) > 1 else respostas[0]
+
+    return consultar, chamadas
+
+
+class TestAguardarJobParser:
+
+    def test_sucesso_imediato_faz_uma_consulta(self):
+        consultar, chamadas = _status_em_sequencia("SUCCESS")
+
+        asyncio.run(aguardar_job_parser("job-1", consultar, intervalo_inicial=0.01))
+
+        assert len(chamadas) == 1
+
+    def test_intervalos_crescem_exponencialmente(self):
+        consultar, chamadas = _status_em_sequencia("PENDING", "PENDING", "PENDING", "PENDING", "SUCCESS")
+
+        with patch("app.controller.utils_polling.proximo_intervalo", lambda intervalo: intervalo):
+            asyncio.run(aguardar_job_parser("job-2", consultar, intervalo_inicial=0.01, intervalo_maximo=1))
+
+        esperas = [b - a for a, b in zip(chamadas, chamadas[1:])]
+        assert len(chamadas) == 5
+        assert esperas[-1] > 3 * esperas[0]
+
+    def test_intervalo_respeita_teto(self):
+        consultar, chamadas = _status_em_sequencia(*(["PENDING"] * 6), "SUCCESS")
+
+        with patch("app.controller.utils_polling.proximo_intervalo", lambda intervalo: intervalo):
+            asyncio.run(aguardar_job_parser("job-3", consultar, intervalo_inicial=0.01, intervalo_maximo=0.02))
+
+        esperas = [b - a for a, b in zip(chamadas, chamadas[1:])]
+        assert max(esperas) < 0.1
+
+    def test_falha_do_parser_levanta_erro(self):
+        consultar, _ = _status_em_sequencia("PENDING", "ERROR")
+
+        with pytest.raises(ParserJobError):
+            asyncio.run(aguardar_job_parser("job-4", consultar, intervalo_inicial=0.01))
+
+    def test_prazo_maximo(self):
+        consultar, _ = _status_em_sequencia("PENDING")
+
+        inicio = time.monotonic()
+        with pytest.raises(ParserTimeoutError):
+            asyncio.run(aguardar_job_parser("job-5", consultar, intervalo_inicial=0.05, prazo_maximo=0.2))
+
+        assert time.monotonic() - inicio < 1
+        assert utils_polling.metricas_polling.resumo()["jobs_recentes"][-1]["status"] == "TIMEOUT"
+
+    def test_webhook_acorda_a_espera(self):
+        consultar, chamadas = _status_em_sequencia("PENDING", "SUCCESS")
+
+        threading.Timer(0.05, notificar_conclusao, args=("job-6",)).start()
+        inicio = time.monotonic()
+        asyncio.run(aguardar_job_parser("job-6", consultar, intervalo_inicial=30, prazo_maximo=60))
+
+        assert time.monotonic() - inicio < 5
+        assert len(chamadas) == 2
+        registro = utils_polling.metricas_polling.resumo()["jobs_recentes"][-1]
+        assert registro["job_id"] == "job-6"
+        assert registro["via_webhook"] is True
+
+    def test_notificar_job_desconhecido(self):
+        assert notificar_conclusao("job-inexistente") is False
+
+    def test_notificar_espera_de_loop_fechado(self):
+        loop = asyncio.new_event_loop()
+        loop.close()
+        utils_polling._esperas["job-7"] = (loop, asyncio.Event())
+
+        assert notificar_conclusao("job-7") is False
+        assert "job-7" not in utils_polling._esperas
+
+    def test_metricas_registram_tempo_e_consultas(self):
+        metricas = utils_polling.MetricasPolling()
+        metricas.registrar("a", 1.0, 3, "SUCCESS", False)
+        metricas.registrar("b", 3.0, 5, "SUCCESS", True)
+
+        resumo = metricas.resumo()
+
+        assert resumo["total_jobs"] == 2
+        assert resumo["media_segundos"] == 2.0
+        assert resumo["media_consultas"] == 4.0
+        assert resumo["acordados_por_webhook"] == 1
+
+
+def test_webhook_exige_o_segredo(monkeypatch):
+    from app import create_app
+
+    monkeypatch.setenv("LLAMA_WEBHOOK_SECRET", "segredo")
+    cliente = create_app().test_client()
+
+    assert cliente.post("/faturas/parser/webhook", json={"job_id": "j1"}).status_code == 403
+    assert cliente.post("/faturas/parser/webhook", json={"job_id": "j1"},
+                        headers={"X-Webhook-Token": "outro"}).status_code == 403
+    resposta = cliente.post("/faturas/parser/webhook", json={"job_id": "j1"}, headers={"X-Webhook-Token": "segredo"})
+    assert resposta.status_code == 200
+    assert resposta.get_json()["acordado"] is False
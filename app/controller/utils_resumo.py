@@ -0,0 +1,118 @@
+from typing import Dict, Iterable, List, Optional
+
+from bson import ObjectId
+
+from app.models import Banco, CategoriaGasto, OrigemTransacao
+
+
+# Totais mantidos em "resumo" na fatura e no usuário. As chaves dos agrupamentos são os nomes dos
+# enums (ALIMENTACAO, PIX, NUBANK): os valores têm acentos e espaços, ruins como caminho de campo no $inc.
+AGRUPAMENTOS = {
+    "por_categoria": CategoriaGasto,
+    "por_origem": OrigemTransacao,
+    "por_banco": Banco,
+}
+
+
+def _nome_enum(enum_cls, valor: Optional[str]) -> str:
+    try:
+        return enum_cls(valor).name
+    except ValueError:
+        # Aceita também o nome (ex.: bancos já são gravados pelo nome); o resto cai em OUTROS.
+        return valor if valor in enum_cls.__members__ else "OUTROS"
+
+
+def resumo_vazio() -> dict:
+    return {
+        "total_entradas": 0.0,
+        "total_saidas": 0.0,
+        "saldo": 0.0,
+        "quantidade_transferencias": 0,
+        "quantidade_extratos": 0,
+        **{agrupamento: {} for agrupamento in AGRUPAMENTOS},
+    }
+
+
+def calcular_resumo(extratos: Iterable[dict]) -> dict:
+    """Resumo dos extratos (no formato de Extrato.to_dict): entradas, saídas, saldo, contagens e totais por grupo."""
+
+    resumo = resumo_vazio()
+    for extrato in extratos:
+        resumo["quantidade_extratos"] += 1
+        banco = _nome_enum(Banco, extrato.get("banco"))
+        for transferencia in extrato.get("transferencias", []):
+            valor = float(transferencia.get("valor") or 0)
+            resumo["total_entradas" if valor >= 0 else "total_saidas"] += valor
+            resumo["saldo"] += valor
+            resumo["quantidade_transferencias"] += 1
+            chaves = {
+                "por_categoria": _nome_enum(CategoriaGasto, transferencia.get("categoria")),
+                "por_origem": _nome_enum(OrigemTransacao, transferencia.get("origem")),
+                "por_banco": banco,
+            }
+            for agrupamento, chave in chaves.items():
+                resumo[agrupamento][chave] = resumo[agrupamento].get(chave, 0.0) + valor
+    return resumo
+
+
+def para_incremento(resumo: dict, prefixo: str = "resumo") -> Dict[str, float]:
+    """Achata o resumo em caminhos para $inc ("resumo.por_categoria.ALIMENTACAO": -52.3), sem os zeros."""
+
+    incremento = {}
+    for campo, valor in resumo.items():
+        if isinstance(valor, dict):
+            incremento.update(para_incremento(valor, f"{prefixo}.{campo}"))
+        elif valor:
+            incremento[f"{prefixo}.{campo}"] = valor
+    return incremento
+
+
+def somar_resumos(resumos: List[dict]) -> dict:
+    """Soma resumos (usado no backfill do resumo do usuário a partir das faturas)."""
+
+    total = resumo_vazio()
+    for resumo in resumos:
+        for caminho, valor in para_incremento(resumo, "").items():
+            *grupos, campo = caminho.strip(".").split(".")
+            destino = total
+            for grupo in grupos:
+                destino = destino.setdefault(grupo, {})
+            destino[campo] = destino.get(campo, 0) + valor
+    return total
+
+
+def formatar_resumo(resumo: Optional[dict]) -> dict:
+    """Resumo para a API: campos ausentes viram zero e valores em reais são arredondados para centavos."""
+
+    completo = resumo_vazio()
+    for campo, valor in (resumo or {}).items():
+        completo[campo] = valor
+    for campo in ("total_entradas", "total_saidas", "saldo"):
+        completo[campo] = round(completo[campo], 2)
+    for agrupamento in AGRUPAMENTOS:
+        completo[agrupamento] = {chave: round(valor, 2) for chave, valor in completo[agrupamento].items()}
+    return completo
+
+
+def recalcular_resumos(users_collection, faturas_collection, repositorio=None) -> dict:
+    """Backfill: recalcula do zero o resumo de cada fatura e de cada usuário.
+
+    Idempotente. Uploads feitos durante a execução podem ser contados duas vezes ou nenhuma no
+    resumo do usuário, então rode com a ingestão parada (ou rode de novo depois).
+    Com um repositório de transferências, as transferências são lidas do layout configurado.
+    """
+
+    por_usuario: Dict[str, dict] = {}
+    faturas = 0
+    for fatura in faturas_collection.find({}, {"user_id": 1, "extratos": 1}):
+        extratos = repositorio.extratos_da_fatura(fatura) if repositorio else fatura.get("extratos", [])
+        resumo = calcular_resumo(extratos)
+        faturas_collection.update_one({"_id": fatura["_id"]}, {"$set": {"resumo": resumo}})
+        # Só o resumo acumulado por usuário fica em memória, não as faturas.
+        por_usuario[fatura["user_id"]] = somar_resumos([por_usuario.get(fatura["user_id"], resumo_vazio()), resumo])
+        faturas += 1
+
+    for user_id, resumo in por_usuario.items():
+        users_collection.update_one({"_id": ObjectId(user_id)}, {"$set": {"resumo": resumo}})
+
+    return {"faturas": faturas, "usuarios": len(por_usuario)}
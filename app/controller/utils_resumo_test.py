@@ -0,0 +1,138 @@
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller.utils_resumo import calcular_resumo, formatar_resumo, recalcular_resumos
+from app.controller.utils_salvar_fatura import salvar_extratos
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def _extrato(banco="NUBANK", mes_ano="10/2025", transferencias=None):
+    return {"banco": banco, "data": mes_ano, "_id": str(ObjectId()), "transferencias": transferencias or []}
+
+
+def _t(valor, categoria="Alimentação", origem="PIX"):
+    return {"valor": valor, "data": "05/10/2025", "origem": origem, "categoria": categoria}
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.usuarios.insert_one({"name": "Teste", "faturas": []}).inserted_id
+
+
+class TestCalcularResumo:
+
+    def test_totais_por_grupo(self):
+        resumo = calcular_resumo([
+            _extrato("NUBANK", transferencias=[_t(-50.0), _t(-20.5, "Transporte", "Compra com cartão"), _t(1000.0, "Outros", "Transferência")]),
+            _extrato("ITAU", transferencias=[_t(-10.0)]),
+        ])
+
+        assert resumo["total_entradas"] == 1000.0
+        assert resumo["total_saidas"] == -80.5
+        assert resumo["saldo"] == 919.5
+        assert resumo["quantidade_transferencias"] == 4
+        assert resumo["quantidade_extratos"] == 2
+        assert resumo["por_categoria"] == {"ALIMENTACAO": -60.0, "TRANSPORTE": -20.5, "OUTROS": 1000.0}
+        assert resumo["por_origem"]["PIX"] == -60.0
+        assert resumo["por_banco"] == {"NUBANK": 929.5, "ITAU": -10.0}
+
+    def test_valor_desconhecido_vira_outros(self):
+        resumo = calcular_resumo([_extrato(transferencias=[_t(-1.0, "Categoria nova", "Cheque")])])
+
+        assert resumo["por_categoria"] == {"OUTROS": -1.0}
+        assert resumo["por_origem"] == {"OUTROS": -1.0}
+
+    def test_formatar_preenche_e_arredonda(self):
+        formatado = formatar_resumo({"total_saidas": -0.1 - 0.2, "por_categoria": {"LAZER": -0.1 - 0.2}})
+
+        assert formatado["total_saidas"] == -0.3
+        assert formatado["por_categoria"] == {"LAZER": -0.3}
+        assert formatado["quantidade_transferencias"] == 0
+
+
+class TestResumoIncremental:
+
+    def test_incremento_igual_ao_recalculo(self, db, user_id):
+        lotes = [
+            [_extrato(transferencias=[_t(-50.0), _t(200.0, "Outros", "Depósito")])],
+            [_extrato("ITAU", transferencias=[_t(-30.0, "Saúde")]), _extrato(transferencias=[_t(-5.0)])],
+            [_extrato(mes_ano="11/2025", transferencias=[_t(-7.0, "Lazer e Entretenimento")])],
+        ]
+        for extratos in lotes:
+            salvar_extratos(db.usuarios, db.faturas, user_id, extratos)
+
+        incrementais = {f["_id"]: formatar_resumo(f["resumo"]) for f in db.faturas.find()}
+        usuario_incremental = formatar_resumo(db.usuarios.find_one({"_id": user_id})["resumo"])
+
+        recalcular_resumos(db.usuarios, db.faturas)
+
+        assert incrementais == {f["_id"]: formatar_resumo(f["resumo"]) for f in db.faturas.find()}
+        assert usuario_incremental == formatar_resumo(db.usuarios.find_one({"_id": user_id})["resumo"])
+        assert usuario_incremental["quantidade_transferencias"] == 5
+        assert usuario_incremental["por_categoria"]["ALIMENTACAO"] == -55.0
+
+    def test_backfill_de_dados_antigos(self, db, user_id):
+        db.faturas.insert_one({"user_id": str(user_id), "mes_ano": "09/2025", "extratos": [_extrato(transferencias=[_t(-12.0)])]})
+
+        resultado = recalcular_resumos(db.usuarios, db.faturas)
+
+        assert resultado == {"faturas": 1, "usuarios": 1}
+        assert db.faturas.find_one()["resumo"]["por_categoria"] == {"ALIMENTACAO": -12.0}
+        assert db.usuarios.find_one({"_id": user_id})["resumo"]["total_saidas"] == -12.0
+
+    def test_comando_cli(self, db, user_id, monkeypatch):
+        monkeypatch.setenv("COLLECTION_USERS", "usuarios")
+        monkeypatch.setenv("COLLECTION_FATURAS", "faturas")
+        monkeypatch.setattr("app.cli.get_db_connection", lambda: db)
+        db.faturas.insert_one({"user_id": str(user_id), "mes_ano": "09/2025", "extratos": []})
+
+        resultado = create_app().test_cli_runner().invoke(args=["recalcular-resumos"])
+
+        assert resultado.exit_code == 0
+        assert "1 faturas, 1 usuários" in resultado.output
+
+
+class TestRotaResumo:
+
+    @pytest.fixture
+    def app(self):
+        app = create_app()
+        app.config["TESTING"] = True
+        return app
+
+    def test_resumo_em_uma_leitura(self, app, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato(transferencias=[_t(-50.0)])])
+        fatura_id = db.faturas.find_one()["_id"]
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+        with patch("app.routes.get_db_connection", return_value={"faturas": db.faturas}), \
+             patch("app.routes.COLLECTION_FATURAS", "faturas"), \
+             patch.object(db.faturas, "find_one", wraps=db.faturas.find_one) as find_one:
+            response = app.test_client().get(f"/faturas/{fatura_id}/resumo", headers=headers)
+
+        assert response.status_code == 200
+        assert response.get_json()["resumo"]["por_categoria"] == {"ALIMENTACAO": -50.0}
+        find_one.assert_called_once()
+        assert "extratos" not in find_one.call_args[0][1]
+
+    def test_resumo_do_usuario(self, app, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato(transferencias=[_t(-50.0), _t(10.0)])])
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+        with patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios}), \
+             patch("app.routes.COLLECTION_USERS", "usuarios"):
+            response = app.test_client().get(f"/faturas/usuario/{user_id}/resumo", headers=headers)
+
+        assert response.get_json()["resumo"]["saldo"] == -40.0
@@ -0,0 +1,99 @@
+from typing import Dict, List
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.controller.utils_datas import LER_DATAS_LEGADAS, mes_ano_int, mes_ano_texto
+from app.controller.utils_resumo import calcular_resumo, para_incremento
+from app.controller.utils_transferencias import RepositorioEmbutido
+
+
+def _agrupar_por_mes(extratos: List[dict]) -> Dict[int, List[dict]]:
+    # Cada extrato vai para a fatura do seu próprio mês (a ordem de chegada é mantida dentro do mês).
+    por_mes: Dict[int, List[dict]] = {}
+    for extrato in extratos:
+        por_mes.setdefault(mes_ano_int(extrato["data"]), []).append(extrato)
+    return por_mes
+
+
+def _filtro_mes(mes_ano: int):
+    # Enquanto houver faturas legadas, o mês também casa o texto "MM/YYYY": o upload entra na fatura
+    # existente em vez de criar uma nova com mes_ano inteiro.
+    return {"$in": [mes_ano, mes_ano_texto(mes_ano)]} if LER_DATAS_LEGADAS else mes_ano
+
+
+def _upserts(faturas_collection, operacoes: List[UpdateOne]) -> List[ObjectId]:
+    """bulk_write não ordenado; devolve os _id das faturas criadas.
+
+    Se dois uploads criam a mesma fatura ao mesmo tempo, o índice único em (user_id, mes_ano) recusa
+    um dos upserts (E11000); essas operações são repetidas uma vez e, com o documento já existente,
+    viram updates comuns.
+    """
+
+    criadas = []
+    for tentativa in range(2):
+        try:
+            resultado = faturas_collection.bulk_write(operacoes, ordered=False).bulk_api_result
+        except BulkWriteError as e:
+            resultado = e.details
+            duplicadas = [erro["index"] for erro in resultado["writeErrors"] if erro["code"] == 11000]
+            if tentativa or len(duplicadas) < len(resultado["writeErrors"]):
+                raise
+            operacoes = [operacoes[indice] for indice in duplicadas]
+        else:
+            operacoes = []
+        criadas += [upsert["_id"] for upsert in resultado.get("upserted", [])]
+        if not operacoes:
+            break
+    return criadas
+
+
+def salvar_extratos(users_collection, faturas_collection, user_id_obj: ObjectId, extratos: List[dict],
+                    repositorio=None) -> None:
+    """Adiciona os extratos (já em dict) às faturas dos seus meses, criando as que faltarem.
+
+    Os extratos são agrupados pelo próprio mês e todas as faturas afetadas recebem um upsert num único
+    bulk_write não ordenado; o índice único em (user_id, mes_ano) impede faturas duplicadas quando dois
+    uploads do mesmo mês chegam juntos. O resumo de cada fatura e o do usuário são incrementados ($inc)
+    com os totais dos extratos novos, e o usuário recebe as referências das faturas criadas num único
+    update com $addToSet. O repositório de transferências decide se elas vão embutidas nos extratos ou
+    para a coleção própria.
+    """
+
+    repositorio = repositorio or RepositorioEmbutido(faturas_collection)
+    user_id = str(user_id_obj)
+    por_mes = _agrupar_por_mes(extratos)
+
+    novos_ids: Dict[int, ObjectId] = {}
+    operacoes = []
+    for mes_ano, extratos_do_mes in por_mes.items():
+        novos_ids[mes_ano] = ObjectId()
+        atualizacao = {
+            "$setOnInsert": {"_id": novos_ids[mes_ano], "mes_ano": mes_ano},
+            "$push": {"extratos": {"$each": repositorio.extratos_para_fatura(extratos_do_mes)}},
+        }
+        incremento_mes = para_incremento(calcular_resumo(extratos_do_mes))
+        if incremento_mes:
+            atualizacao["$inc"] = incremento_mes
+        operacoes.append(UpdateOne({"user_id": user_id, "mes_ano": _filtro_mes(mes_ano)}, atualizacao, upsert=True))
+
+    criadas = set(_upserts(faturas_collection, operacoes))
+
+    if repositorio.modo == "colecao":
+        # A coleção de transferências precisa do _id das faturas que já existiam: uma consulta para todas.
+        ids_por_mes = {mes_ano: id_novo for mes_ano, id_novo in novos_ids.items() if id_novo in criadas}
+        existentes = [mes_ano for mes_ano in por_mes if mes_ano not in ids_por_mes]
+        if existentes:
+            filtro = {"$in": [valor for mes_ano in existentes for valor in (mes_ano, mes_ano_texto(mes_ano))]}
+            for fatura in faturas_collection.find({"user_id": user_id, "mes_ano": filtro}, {"mes_ano": 1}):
+                ids_por_mes[mes_ano_int(fatura["mes_ano"])] = fatura["_id"]
+        for mes_ano, extratos_do_mes in por_mes.items():
+            repositorio.gravar(user_id, ids_por_mes[mes_ano], mes_ano, extratos_do_mes)
+
+    # versao_analise invalida os resultados de análise em cache desse usuário.
+    atualizacao_usuario = {"$inc": {**para_incremento(calcular_resumo(extratos)), "versao_analise": 1}}
+    novas = [str(novos_ids[mes_ano]) for mes_ano in sorted(novos_ids) if novos_ids[mes_ano] in criadas]
+    if novas:
+        atualizacao_usuario["$addToSet"] = {"faturas": {"$each": novas}}
+    users_collection.update_one({"_id": user_id_obj}, atualizacao_usuario)
@@ -0,0 +1,184 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import time
+
+import pytest
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.controller.utils_indices import garantir_indices, indices_necessarios
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.controller.utils_transferencias import RepositorioColecao
+
+mongomock = pytest.importorskip("mongomock")
+
+
+N_UPLOADS = 16
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setenv("COLLECTION_USERS", "usuarios")
+    monkeypatch.setenv("COLLECTION_FATURAS", "faturas")
+    db = mongomock.MongoClient().db
+    garantir_indices(db, indices_necessarios())
+    return db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.usuarios.insert_one({"name": "Teste", "email": "t@t.com", "cpf": "1", "faturas": []}).inserted_id
+
+
+class ColecaoComLatencia:
+    """Simula a latência de rede antes de cada operação, abrindo a janela de corrida entre round trips."""
+
+    def __init__(self, collection, latencia=0.005):
+        self._collection = collection
+        self._latencia = latencia
+
+    def __getattr__(self, nome):
+        metodo = getattr(self._collection, nome)
+
+        def chamar(*args, **kwargs):
+            time.sleep(self._latencia)
+            return metodo(*args, **kwargs)
+        return chamar
+
+
+class ColecaoContada:
+    """Conta as chamadas de cada método (round trips) e repassa para a coleção."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.chamadas = {}
+
+    def __getattr__(self, nome):
+        self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+        return getattr(self._collection, nome)
+
+
+class ColecaoComCorrida:
+    """No primeiro bulk_write, outro upload cria antes a fatura da primeira operação e o upsert dela falha com E11000."""
+
+    def __init__(self, collection, fatura_concorrente):
+        self._collection = collection
+        self._fatura_concorrente = fatura_concorrente
+        self.tentativas = 0
+
+    def __getattr__(self, nome):
+        return getattr(self._collection, nome)
+
+    def bulk_write(self, operacoes, ordered=True):
+        self.tentativas += 1
+        if self.tentativas > 1:
+            return self._collection.bulk_write(operacoes, ordered=ordered)
+        self._collection.insert_one(self._fatura_concorrente)
+        resultado = self._collection.bulk_write(operacoes[1:], ordered=ordered).bulk_api_result if operacoes[1:] else {}
+        raise BulkWriteError({
+            "writeErrors": [{"index": 0, "code": 11000, "errmsg": "E11000 duplicate key error"}],
+            "upserted": [{"index": u["index"] + 1, "_id": u["_id"]} for u in resultado.get("upserted", [])],
+        })
+
+
+def _extrato(mes_ano, valor=-10.0):
+    return {"banco": "NUBANK", "data": mes_ano, "transferencias": [{"valor": valor}]}
+
+
+class TestSalvarExtratos:
+
+    def test_cria_fatura_e_referencia(self, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("10/2025")])
+
+        fatura = db.faturas.find_one({"user_id": str(user_id), "mes_ano": 202510})
+        assert len(fatura["extratos"]) == 1
+        assert db.usuarios.find_one({"_id": user_id})["faturas"] == [str(fatura["_id"])]
+
+    def test_fatura_legada_recebe_o_upload(self, db, user_id):
+        # Fatura gravada antes das datas nativas (mes_ano em texto): o upload do mesmo mês entra nela.
+        db.faturas.insert_one({"user_id": str(user_id), "mes_ano": "10/2025", "extratos": [_extrato("10/2025")]})
+
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato(datetime(2025, 10, 1))])
+
+        assert db.faturas.count_documents({}) == 1
+        assert len(db.faturas.find_one()["extratos"]) == 2
+
+    def test_fatura_existente_nao_duplica_referencia(self, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("10/2025")])
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("10/2025"), _extrato("10/2025")])
+
+        assert db.faturas.count_documents({}) == 1
+        assert len(db.faturas.find_one()["extratos"]) == 3
+        assert len(db.usuarios.find_one({"_id": user_id})["faturas"]) == 1
+
+    def test_indice_unico_impede_duplicata(self, db, user_id):
+        db.faturas.insert_one({"user_id": str(user_id), "mes_ano": "10/2025", "extratos": []})
+        with pytest.raises(DuplicateKeyError):
+            db.faturas.insert_one({"user_id": str(user_id), "mes_ano": "10/2025", "extratos": []})
+
+    def test_uploads_paralelos_sem_duplicatas(self, db, user_id):
+        barreira = threading.Barrier(N_UPLOADS)
+
+        def upload(i):
+            barreira.wait()
+            salvar_extratos(ColecaoComLatencia(db.usuarios), ColecaoComLatencia(db.faturas), user_id, [_extrato("10/2025", valor=-i)])
+
+        with ThreadPoolExecutor(max_workers=N_UPLOADS) as executor:
+            list(executor.map(upload, range(N_UPLOADS)))
+
+        faturas = list(db.faturas.find({"user_id": str(user_id)}))
+        assert len(faturas) == 1
+        assert len(faturas[0]["extratos"]) == N_UPLOADS
+        assert db.usuarios.find_one({"_id": user_id})["faturas"] == [str(faturas[0]["_id"])]
+
+    def test_meses_diferentes_viram_faturas_diferentes(self, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("09/2025")])
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("10/2025")])
+
+        assert db.faturas.count_documents({"user_id": str(user_id)}) == 2
+        assert len(db.usuarios.find_one({"_id": user_id})["faturas"]) == 2
+
+    def test_upload_com_meses_misturados(self, db, user_id):
+        faturas, usuarios = ColecaoContada(db.faturas), ColecaoContada(db.usuarios)
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato(datetime(2025, 9, 1), valor=-1.0)])
+
+        salvar_extratos(usuarios, faturas, user_id, [
+            _extrato(datetime(2025, 10, 1), valor=-2.0),
+            _extrato(datetime(2025, 9, 1), valor=-3.0),
+            _extrato(datetime(2025, 11, 1), valor=-4.0),
+            _extrato(datetime(2025, 10, 1), valor=-5.0),
+        ])
+
+        por_mes = {f["mes_ano"]: f for f in db.faturas.find({"user_id": str(user_id)})}
+        assert {mes: [e["transferencias"][0]["valor"] for e in f["extratos"]] for mes, f in por_mes.items()} == {
+            202509: [-1.0, -3.0], 202510: [-2.0, -5.0], 202511: [-4.0]}
+        assert por_mes[202510]["resumo"]["saldo"] == -7.0
+        usuario = db.usuarios.find_one({"_id": user_id})
+        assert sorted(usuario["faturas"]) == sorted(str(f["_id"]) for f in por_mes.values())
+        assert usuario["resumo"]["saldo"] == -15.0
+        # Um round trip para as faturas e um para o usuário, independentemente do número de arquivos.
+        assert faturas.chamadas == {"bulk_write": 1}
+        assert usuarios.chamadas == {"update_one": 1}
+
+    def test_corrida_na_criacao_repete_o_upsert(self, db, user_id):
+        concorrente = {"user_id": str(user_id), "mes_ano": 202510, "extratos": [_extrato(datetime(2025, 10, 1))]}
+        faturas = ColecaoComCorrida(db.faturas, concorrente)
+
+        salvar_extratos(db.usuarios, faturas, user_id, [_extrato(datetime(2025, 10, 1)), _extrato(datetime(2025, 11, 1))])
+
+        assert faturas.tentativas == 2
+        assert db.faturas.count_documents({}) == 2
+        assert len(db.faturas.find_one({"mes_ano": 202510})["extratos"]) == 2
+        # A fatura criada pelo outro upload é referenciada por ele; este só adiciona a de novembro.
+        assert db.usuarios.find_one({"_id": user_id})["faturas"] == [str(db.faturas.find_one({"mes_ano": 202511})["_id"])]
+
+    def test_meses_misturados_na_colecao_de_transferencias(self, db, user_id):
+        repositorio = RepositorioColecao(db.faturas, db.transferencias)
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato(datetime(2025, 9, 1))], repositorio)
+
+        salvar_extratos(db.usuarios, db.faturas, user_id,
+                        [_extrato(datetime(2025, 9, 1), valor=-3.0), _extrato(datetime(2025, 10, 1), valor=-4.0)], repositorio)
+
+        for fatura in db.faturas.find():
+            valores = sorted(t["valor"] for t in db.transferencias.find({"fatura_id": fatura["_id"]}))
+            assert valores == ([-10.0, -3.0] if fatura["mes_ano"] == 202509 else [-4.0])
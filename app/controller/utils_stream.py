@@ -0,0 +1,135 @@
+from datetime import date, datetime
+import json
+import os
+from typing import Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+
+from app.controller.utils_datas import (
+    data_datetime,
+    data_texto,
+    extrato_para_api,
+    fatura_para_api,
+    mes_ano_texto,
+    transferencia_para_api,
+)
+from app.controller.utils_listagem_faturas import filtro_mes_ano
+
+
+# Documentos por lote do cursor de agregação: só um lote fica em memória de cada vez.
+STREAM_TAMANHO_LOTE = int(os.getenv("STREAM_TAMANHO_LOTE", "500"))
+
+# Campos de cada transferência no export, na ordem de saída.
+CAMPOS_TRANSFERENCIA = ("valor", "data", "origem", "categoria")
+
+
+def _padrao_json(obj):
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+
+def para_json(obj) -> str:
+    """json.dumps compacto; ObjectId vira string e datas viram ISO 8601."""
+    return json.dumps(obj, default=_padrao_json, ensure_ascii=False, separators=(",", ":"))
+
+
+def pipeline_transferencias_fatura(fatura_id: ObjectId) -> List[dict]:
+    """Uma linha por transferência da fatura (com os dados do extrato); extratos vazios geram uma linha sem transferência."""
+
+    return [
+        {"$match": {"_id": fatura_id}},
+        {"$unwind": {"path": "$extratos", "includeArrayIndex": "indice_extrato"}},
+        {"$unwind": {"path": "$extratos.transferencias", "preserveNullAndEmptyArrays": True}},
+        {"$project": {"_id": 0, "indice_extrato": 1, "extrato": "$extratos"}},
+    ]
+
+
+def stream_fatura(fatura: dict, linhas: Iterable[dict]) -> Iterator[str]:
+    """Emite {"success": true, "fatura": {..., "extratos": [...]}} aos pedaços.
+
+    `fatura` são os campos da fatura sem os extratos; `linhas` vem de pipeline_transferencias_fatura
+    (ordenadas por extrato), então cada extrato é aberto na primeira linha e fechado quando o índice muda.
+    """
+
+    cabecalho = para_json({"success": True, "fatura": fatura_para_api({**fatura, "extratos": []})})
+    # Tudo até o "[" de "extratos":[]}}; o fechamento é emitido no final.
+    yield cabecalho[:-len("]}}")]
+
+    indice_atual = None
+    primeira_transferencia = True
+    for linha in linhas:
+        extrato = linha["extrato"]
+        transferencia = extrato.pop("transferencias", None)
+        if linha["indice_extrato"] != indice_atual:
+            if indice_atual is not None:
+                yield "]},"
+            indice_atual = linha["indice_extrato"]
+            primeira_transferencia = True
+            yield para_json(extrato_para_api({**extrato, "transferencias": []}))[:-len("]}")]
+        if transferencia is not None:
+            yield ("" if primeira_transferencia else ",") + para_json(transferencia_para_api(transferencia))
+            primeira_transferencia = False
+
+    if indice_atual is not None:
+        yield "]}"
+    yield "]}}"
+
+
+def pipeline_transferencias_usuario(user_id: str, de: Optional[date], ate: Optional[date]) -> List[dict]:
+    """Transferências do usuário nas faturas dos meses entre de e ate, uma por documento."""
+
+    filtro = {"user_id": user_id}
+    if de or ate:
+        filtro.update(filtro_mes_ano(
+            f"{de.month:02d}/{de.year}" if de else None,
+            f"{ate.month:02d}/{ate.year}" if ate else None,
+        ))
+    return [
+        {"$match": filtro},
+        {"$sort": {"_id": 1}},
+        {"$unwind": "$extratos"},
+        {"$unwind": "$extratos.transferencias"},
+        {"$project": {
+            "_id": 0,
+            "fatura_id": "$_id",
+            "mes_ano": 1,
+            "banco": "$extratos.banco",
+            "transferencia": "$extratos.transferencias",
+        }},
+    ]
+
+
+def filtrar_transferencias(linhas: Iterable[dict], de: Optional[date], ate: Optional[date]) -> Iterator[dict]:
+    """Achata cada linha do pipeline numa transferência e aplica o intervalo de datas (o $match só filtra por mês)."""
+
+    for linha in linhas:
+        transferencia = linha["transferencia"]
+        # datetime gravado ou "DD/MM/YYYY" de faturas legadas.
+        data = data_datetime(transferencia.get("data"))
+        data = data.date() if data else None
+        if (de and (data is None or data < de)) or (ate and (data is None or data > ate)):
+            continue
+        item = {"fatura_id": linha["fatura_id"], "mes_ano": mes_ano_texto(linha.get("mes_ano")), "banco": linha.get("banco")}
+        for campo in CAMPOS_TRANSFERENCIA:
+            item[campo] = transferencia.get(campo)
+        item["data"] = data_texto(item["data"])
+        yield item
+
+
+def stream_ndjson(itens: Iterable[dict]) -> Iterator[str]:
+    """Um objeto JSON por linha."""
+    for item in itens:
+        yield para_json(item) + "\n"
+
+
+def stream_lista_json(chave: str, itens: Iterable[dict]) -> Iterator[str]:
+    """{"success": true, "<chave>": [...]} emitido item a item."""
+    yield '{"success":true,' + para_json(chave) + ":["
+    primeiro = True
+    for item in itens:
+        yield ("" if primeiro else ",") + para_json(item)
+        primeiro = False
+    yield "]}"
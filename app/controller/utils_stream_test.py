@@ -0,0 +1,180 @@
+from datetime import date
+import json
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller.utils_stream import (
+    filtrar_transferencias,
+    pipeline_transferencias_fatura,
+    pipeline_transferencias_usuario,
+    stream_fatura,
+    stream_lista_json,
+    stream_ndjson,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+
+USER_ID = "507f1f77bcf86cd799439011"
+
+
+def _transferencia(i, mes=10, ano=2025):
+    return {"valor": -float(i), "data": f"{i % 28 + 1:02d}/{mes:02d}/{ano}", "origem": "PIX", "categoria": "OUTROS"}
+
+
+def _fatura(mes=10, ano=2025, n_extratos=2, n_transferencias=3, user_id=USER_ID):
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "mes_ano": f"{mes:02d}/{ano}",
+        "extratos": [
+            {"banco": "NUBANK", "data": f"{mes:02d}/{ano}", "_id": str(ObjectId()),
+             "transferencias": [_transferencia(e * 100 + i, mes, ano) for i in range(n_transferencias)]}
+            for e in range(n_extratos)
+        ],
+    }
+
+
+@pytest.fixture
+def faturas():
+    return mongomock.MongoClient().db.faturas
+
+
+def _stream_fatura(faturas, fatura_id):
+    cabecalho = faturas.find_one({"_id": fatura_id}, {"extratos": 0})
+    return "".join(stream_fatura(cabecalho, faturas.aggregate(pipeline_transferencias_fatura(fatura_id))))
+
+
+class TestStreamFatura:
+
+    def test_igual_ao_documento_completo(self, faturas):
+        fatura = _fatura()
+        fatura["extratos"].append({"banco": "ITAU", "data": "10/2025", "_id": "vazio", "transferencias": []})
+        faturas.insert_one(fatura)
+
+        resposta = json.loads(_stream_fatura(faturas, fatura["_id"]))
+
+        esperado = {**fatura, "_id": str(fatura["_id"])}
+        assert resposta == {"success": True, "fatura": esperado}
+
+    def test_fatura_sem_extratos(self, faturas):
+        fatura = _fatura(n_extratos=0)
+        faturas.insert_one(fatura)
+
+        assert json.loads(_stream_fatura(faturas, fatura["_id"]))["fatura"]["extratos"] == []
+
+
+class TestExportTransferencias:
+
+    def test_filtra_periodo_por_data(self, faturas):
+        faturas.insert_many([_fatura(9), _fatura(10), _fatura(11), _fatura(10, user_id="outro")])
+        de, ate = date(2025, 10, 2), date(2025, 11, 1)
+
+        linhas = faturas.aggregate(pipeline_transferencias_usuario(USER_ID, de, ate))
+        itens = list(filtrar_transferencias(linhas, de, ate))
+
+        datas = [date(*reversed([int(parte) for parte in item["data"].split("/")])) for item in itens]
+        assert len(datas) == 6
+        assert all(de <= data <= ate for data in datas)
+        assert all(item["banco"] == "NUBANK" and item["fatura_id"] for item in itens)
+
+    def test_formatos(self):
+        itens = [{"a": 1}, {"a": ObjectId("507f1f77bcf86cd799439011")}]
+
+        assert "".join(stream_ndjson(itens)).splitlines() == ['{"a":1}', '{"a":"507f1f77bcf86cd799439011"}']
+        assert json.loads("".join(stream_lista_json("itens", itens))) == {
+            "success": True, "itens": [{"a": 1}, {"a": "507f1f77bcf86cd799439011"}]
+        }
+        assert json.loads("".join(stream_lista_json("itens", []))) == {"success": True, "itens": []}
+
+    def test_memoria_constante(self):
+        """Pico de memória do serializador não cresce com o número de transferências (cursor simulado)."""
+
+        def cursor(n):
+            for i in range(n):
+                yield {"fatura_id": ObjectId(), "mes_ano": "10/2025", "banco": "NUBANK", "transferencia": _transferencia(i)}
+
+        def pico_stream(n):
+            tracemalloc.start()
+            for _ in stream_ndjson(filtrar_transferencias(cursor(n), date(2025, 10, 1), date(2025, 10, 31))):
+                pass
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return pico
+
+        def pico_lista(n):
+            tracemalloc.start()
+            json.dumps([linha for linha in cursor(n)], default=str)
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return pico
+
+        pequeno, grande = pico_stream(2_000), pico_stream(20_000)
+        lista_grande = pico_lista(20_000)
+
+        assert grande < 2 * pequeno
+        assert grande * 20 < lista_grande
+
+
+class TestRotasStream:
+
+    @pytest.fixture
+    def app(self):
+        app = create_app()
+        app.config["TESTING"] = True
+        return app
+
+    @pytest.fixture
+    def headers(self, app):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=USER_ID)}"}
+
+    def _patch_db(self, faturas):
+        return patch("app.routes.get_db_connection", return_value={"faturas": faturas}), patch("app.routes.COLLECTION_FATURAS", "faturas")
+
+    def test_get_fatura_streaming(self, app, headers, faturas):
+        fatura = _fatura()
+        faturas.insert_one(fatura)
+        banco, colecao = self._patch_db(faturas)
+
+        with banco, colecao:
+            response = app.test_client().get(f"/faturas/{fatura['_id']}", headers=headers)
+
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert len(response.get_json()["fatura"]["extratos"]) == 2
+
+    def test_get_fatura_de_outro_usuario(self, app, headers, faturas):
+        fatura = _fatura(user_id="outro")
+        faturas.insert_one(fatura)
+        banco, colecao = self._patch_db(faturas)
+
+        with banco, colecao:
+            response = app.test_client().get(f"/faturas/{fatura['_id']}", headers=headers)
+
+        assert response.status_code == 403
+
+    def test_exportar_ndjson(self, app, headers, faturas):
+        faturas.insert_many([_fatura(9), _fatura(10)])
+        banco, colecao = self._patch_db(faturas)
+
+        with banco, colecao:
+            response = app.test_client().get(
+                f"/faturas/usuario/{USER_ID}/transferencias?from=2025-10-01&to=2025-10-31", headers=headers
+            )
+
+        assert response.mimetype == "application/x-ndjson"
+        linhas = [json.loads(linha) for linha in response.get_data(as_text=True).splitlines()]
+        assert len(linhas) == 6
+        assert all(linha["mes_ano"] == "10/2025" for linha in linhas)
+
+    @pytest.mark.parametrize("query", ["from=01/10/2025", "formato=csv"])
+    def test_exportar_parametros_invalidos(self, app, headers, query):
+        response = app.test_client().get(f"/faturas/usuario/{USER_ID}/transferencias?{query}", headers=headers)
+
+        assert response.status_code == 400
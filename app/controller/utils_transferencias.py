@@ -0,0 +1,215 @@
+from datetime import date, datetime, time, timedelta
+import os
+from typing import Dict, Iterator, List, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from app.controller.utils_datas import data_datetime, data_texto, mes_ano_int, mes_ano_texto
+from app.controller.utils_stream import (
+    CAMPOS_TRANSFERENCIA,
+    STREAM_TAMANHO_LOTE,
+    filtrar_transferencias,
+    pipeline_transferencias_fatura,
+    pipeline_transferencias_usuario,
+)
+
+
+# Onde as transferências ficam guardadas:
+# - "embutido": dentro de faturas.extratos[].transferencias[] (layout original);
+# - "colecao": um documento por transferência em COLLECTION_TRANSFERENCIAS, com data datetime e valor
+#   numérico, indexável por data e categoria; a fatura guarda só os dados de cada extrato.
+# Antes de trocar para "colecao", rode "flask migrar-transferencias": a migração copia as transferências
+# embutidas para a coleção sem removê-las das faturas. A troca é só de ida: o que for gravado no layout
+# "colecao" existe apenas na coleção e some das leituras se o modo voltar para "embutido" (não há
+# migração de volta).
+ARMAZENAMENTO_TRANSFERENCIAS = os.getenv("ARMAZENAMENTO_TRANSFERENCIAS", "embutido").lower()
+COLLECTION_TRANSFERENCIAS = os.getenv("COLLECTION_TRANSFERENCIAS", "transferencias")
+
+# Documentos por insert_many na migração.
+MIGRACAO_TAMANHO_LOTE = int(os.getenv("MIGRACAO_TAMANHO_LOTE", "1000"))
+
+
+def _id_extrato(extrato: dict, indice: int) -> str:
+    # Extrato.to_dict sempre gera um _id; extratos antigos sem ele são identificados pela posição.
+    return extrato.get("_id") or f"indice-{indice}"
+
+
+def documento_transferencia(user_id: str, fatura_id: ObjectId, mes_ano, extrato: dict,
+                            indice_extrato: int, indice: int, transferencia: dict) -> dict:
+    """Documento da coleção de transferências a partir de uma transferência de Extrato.to_dict (ou legada, com texto)."""
+
+    return {
+        "user_id": user_id,
+        "fatura_id": fatura_id,
+        "extrato_id": _id_extrato(extrato, indice_extrato),
+        "indice": indice,
+        "mes_ano": mes_ano_int(mes_ano),
+        "banco": extrato.get("banco"),
+        "data": data_datetime(transferencia.get("data")),
+        "valor": float(transferencia.get("valor") or 0),
+        "origem": transferencia.get("origem"),
+        "categoria": transferencia.get("categoria"),
+    }
+
+
+def campos_transferencia(documento: dict) -> dict:
+    """Transferência como fica embutida no extrato (valor, data, origem, categoria)."""
+    return {campo: documento.get(campo) for campo in CAMPOS_TRANSFERENCIA}
+
+
+class RepositorioEmbutido:
+    """Transferências dentro das faturas (faturas.extratos[].transferencias[])."""
+
+    modo = "embutido"
+
+    def __init__(self, faturas_collection):
+        self.faturas = faturas_collection
+
+    def extratos_para_fatura(self, extratos: List[dict]) -> List[dict]:
+        """O que vai para o $push em faturas.extratos."""
+        return extratos
+
+    def gravar(self, user_id: str, fatura_id: ObjectId, mes_ano: int, extratos: List[dict]) -> None:
+        """Grava as transferências fora da fatura, depois do upsert (nada a fazer neste layout)."""
+
+    def remover(self, fatura_id: ObjectId, extrato_id: str) -> None:
+        """Apaga as transferências de um extrato retirado da fatura (aqui saem junto com ele)."""
+
+    def linhas_fatura(self, fatura_id: ObjectId) -> Iterator[dict]:
+        """Linhas {"indice_extrato", "extrato"} na ordem de stream_fatura."""
+        return self.faturas.aggregate(pipeline_transferencias_fatura(fatura_id), batchSize=STREAM_TAMANHO_LOTE)
+
+    def transferencias_usuario(self, user_id: str, de: Optional[date], ate: Optional[date]) -> Iterator[dict]:
+        """Transferências do usuário no período, no formato do export. Lança ValueError se o intervalo for inválido."""
+        pipeline = pipeline_transferencias_usuario(user_id, de, ate)
+        return filtrar_transferencias(self.faturas.aggregate(pipeline, batchSize=STREAM_TAMANHO_LOTE), de, ate)
+
+    def extratos_da_fatura(self, fatura: dict) -> List[dict]:
+        """Extratos completos (com as transferências) de uma fatura lida com o campo extratos."""
+        return fatura.get("extratos", [])
+
+
+class RepositorioColecao:
+    """Transferências em coleção própria; as faturas guardam só os dados de cada extrato."""
+
+    modo = "colecao"
+
+    def __init__(self, faturas_collection, transferencias_collection):
+        self.faturas = faturas_collection
+        self.transferencias = transferencias_collection
+
+    def extratos_para_fatura(self, extratos: List[dict]) -> List[dict]:
+        for extrato in extratos:
+            # gravar() liga as transferências ao extrato por este _id.
+            extrato.setdefault("_id", str(ObjectId()))
+        return [
+            {**{campo: valor for campo, valor in extrato.items() if campo != "transferencias"},
+             "quantidade_transferencias": len(extrato.get("transferencias", []))}
+            for extrato in extratos
+        ]
+
+    def gravar(self, user_id: str, fatura_id: ObjectId, mes_ano: int, extratos: List[dict]) -> None:
+        # Depois do upsert da fatura (o _id só é conhecido aí). Se o processo cair entre os dois passos,
+        # o extrato fica na fatura sem transferências; o resumo já foi incrementado com elas.
+        documentos = [
+            documento_transferencia(user_id, fatura_id, mes_ano, extrato, indice_extrato, indice, transferencia)
+            for indice_extrato, extrato in enumerate(extratos)
+            for indice, transferencia in enumerate(extrato.get("transferencias", []))
+        ]
+        if documentos:
+            self.transferencias.insert_many(documentos, ordered=False)
+
+    def remover(self, fatura_id: ObjectId, extrato_id: str) -> None:
+        self.transferencias.delete_many({"fatura_id": fatura_id, "extrato_id": extrato_id})
+
+    def _sem_metadados(self, extrato: dict) -> dict:
+        return {campo: valor for campo, valor in extrato.items()
+                if campo not in ("transferencias", "quantidade_transferencias")}
+
+    def linhas_fatura(self, fatura_id: ObjectId) -> Iterator[dict]:
+        # Extratos migrados ainda têm as transferências embutidas: a projeção as descarta.
+        fatura = self.faturas.find_one({"_id": fatura_id}, {"extratos.transferencias": 0})
+        for indice_extrato, extrato in enumerate((fatura or {}).get("extratos", [])):
+            extrato = self._sem_metadados(extrato)
+            cursor = self.transferencias.find(
+                {"fatura_id": fatura_id, "extrato_id": _id_extrato(extrato, indice_extrato)}
+            ).sort("indice", ASCENDING).batch_size(STREAM_TAMANHO_LOTE)
+            vazio = True
+            for documento in cursor:
+                vazio = False
+                yield {"indice_extrato": indice_extrato,
+                       "extrato": {**extrato, "transferencias": campos_transferencia(documento)}}
+            if vazio:
+                yield {"indice_extrato": indice_extrato, "extrato": extrato}
+
+    def transferencias_usuario(self, user_id: str, de: Optional[date], ate: Optional[date]) -> Iterator[dict]:
+        filtro = {"user_id": user_id}
+        if de or ate:
+            filtro["data"] = {}
+            if de:
+                filtro["data"]["$gte"] = datetime.combine(de, time.min)
+            if ate:
+                filtro["data"]["$lt"] = datetime.combine(ate + timedelta(days=1), time.min)
+        # Índice (user_id, data) atende o filtro e a ordenação.
+        cursor = self.transferencias.find(filtro).sort("data", ASCENDING).batch_size(STREAM_TAMANHO_LOTE)
+        return (
+            {"fatura_id": documento["fatura_id"], "mes_ano": mes_ano_texto(documento.get("mes_ano")),
+             "banco": documento.get("banco"), **campos_transferencia(documento), "data": data_texto(documento.get("data"))}
+            for documento in cursor
+        )
+
+    def extratos_da_fatura(self, fatura: dict) -> List[dict]:
+        por_extrato: Dict[str, List[dict]] = {}
+        for documento in self.transferencias.find({"fatura_id": ObjectId(fatura["_id"])}).sort(
+                [("extrato_id", ASCENDING), ("indice", ASCENDING)]):
+            por_extrato.setdefault(documento["extrato_id"], []).append(campos_transferencia(documento))
+        return [
+            {**self._sem_metadados(extrato), "transferencias": por_extrato.get(_id_extrato(extrato, indice), [])}
+            for indice, extrato in enumerate(fatura.get("extratos", []))
+        ]
+
+
+def obter_repositorio(db, faturas_collection):
+    """Repositório do layout configurado em ARMAZENAMENTO_TRANSFERENCIAS."""
+
+    if ARMAZENAMENTO_TRANSFERENCIAS == "colecao":
+        return RepositorioColecao(faturas_collection, db[COLLECTION_TRANSFERENCIAS])
+    return RepositorioEmbutido(faturas_collection)
+
+
+def migrar_transferencias(faturas_collection, transferencias_collection) -> dict:
+    """Copia as transferências embutidas nas faturas para a coleção de transferências.
+
+    Idempotente graças ao índice único (fatura_id, extrato_id, indice) de indices_transferencias(), que
+    precisa existir antes: os inserts são não ordenados e as duplicatas de uma execução anterior são
+    ignoradas, então a migração pode ser interrompida e rodada de novo. As faturas não são alteradas, mas
+    a troca para "colecao" é só de ida: o que for gravado depois dela existe apenas na coleção.
+    """
+
+    relatorio = {"faturas": 0, "transferencias": 0, "inseridas": 0}
+    documentos = []
+
+    def enviar():
+        if not documentos:
+            return
+        try:
+            relatorio["inseridas"] += len(transferencias_collection.insert_many(documentos, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(erro["code"] != 11000 for erro in e.details["writeErrors"]):
+                raise
+            relatorio["inseridas"] += e.details["nInserted"]
+        documentos.clear()
+
+    for fatura in faturas_collection.find({}, {"user_id": 1, "mes_ano": 1, "extratos": 1}):
+        relatorio["faturas"] += 1
+        for indice_extrato, extrato in enumerate(fatura.get("extratos", [])):
+            for indice, transferencia in enumerate(extrato.get("transferencias", [])):
+                documentos.append(documento_transferencia(fatura["user_id"], fatura["_id"], fatura.get("mes_ano"),
+                                                          extrato, indice_extrato, indice, transferencia))
+                relatorio["transferencias"] += 1
+                if len(documentos) >= MIGRACAO_TAMANHO_LOTE:
+                    enviar()
+    enviar()
+    return relatorio
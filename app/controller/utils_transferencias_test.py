@@ -0,0 +1,151 @@
+from datetime import date, datetime
+import json
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.controller import utils_transferencias
+from app.controller.utils_datas import extrato_para_api
+from app.controller.utils_indices import garantir_indices, indices_transferencias
+from app.controller.utils_salvar_fatura import salvar_extratos
+from app.controller.utils_stream import stream_fatura
+from app.controller.utils_transferencias import (
+    COLLECTION_TRANSFERENCIAS,
+    RepositorioColecao,
+    RepositorioEmbutido,
+    migrar_transferencias,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def _extrato(banco, mes, n, _id=None, legado=False):
+    # legado: datas em texto, como eram gravadas antes das datas nativas.
+    extrato = {"banco": banco, "data": f"{mes:02d}/2025" if legado else datetime(2025, mes, 1), "transferencias": [
+        {"valor": -float(i), "data": f"{i % 28 + 1:02d}/{mes:02d}/2025" if legado else datetime(2025, mes, i % 28 + 1),
+         "origem": "PIX", "categoria": "Alimentação" if i % 2 else "Outros"}
+        for i in range(n)
+    ]}
+    if _id:
+        extrato["_id"] = _id
+    return extrato
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+@pytest.fixture
+def user_id(db):
+    return db.usuarios.insert_one({"name": "Teste", "faturas": []}).inserted_id
+
+
+def _stream(repositorio, fatura_id):
+    cabecalho = repositorio.faturas.find_one({"_id": fatura_id}, {"extratos": 0})
+    return json.loads("".join(stream_fatura(cabecalho, repositorio.linhas_fatura(fatura_id))))
+
+
+class TestRepositorioColecao:
+
+    def test_salvar_grava_uma_transferencia_por_documento(self, db, user_id):
+        repositorio = RepositorioColecao(db.faturas, db.transferencias)
+
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("NUBANK", 10, 3, "e1")], repositorio)
+
+        fatura = db.faturas.find_one()
+        assert fatura["extratos"] == [{"banco": "NUBANK", "data": datetime(2025, 10, 1), "_id": "e1", "quantidade_transferencias": 3}]
+        documentos = list(db.transferencias.find().sort("indice", 1))
+        assert [d["valor"] for d in documentos] == [0.0, -1.0, -2.0]
+        assert documentos[1]["data"] == datetime(2025, 10, 2)
+        assert {(d["user_id"], d["fatura_id"], d["extrato_id"], d["banco"]) for d in documentos} == {
+            (str(user_id), fatura["_id"], "e1", "NUBANK")}
+        assert fatura["resumo"]["quantidade_transferencias"] == 3
+
+    def test_fatura_remontada_igual_ao_layout_embutido(self, db, user_id):
+        embutido = RepositorioEmbutido(mongomock.MongoClient().db.faturas)
+        colecao = RepositorioColecao(db.faturas, db.transferencias)
+        extratos = [_extrato("NUBANK", 10, 4, "e1"), _extrato("ITAU", 10, 0, "vazio"), _extrato("ITAU", 10, 2, "e2")]
+        for repositorio in (embutido, colecao):
+            repositorio.faturas.insert_one({"_id": ObjectId("65f000000000000000000001"), "user_id": str(user_id),
+                                            "mes_ano": 202510, "extratos": repositorio.extratos_para_fatura(
+                                                [dict(e) for e in extratos])})
+        colecao.gravar(str(user_id), ObjectId("65f000000000000000000001"), 202510, extratos)
+
+        fatura_id = ObjectId("65f000000000000000000001")
+        assert _stream(colecao, fatura_id) == _stream(embutido, fatura_id)
+        fatura = colecao.faturas.find_one({"_id": fatura_id})
+        assert colecao.extratos_da_fatura(fatura) == extratos
+
+    def test_export_por_periodo_usa_datas_reais(self, db, user_id):
+        repositorio = RepositorioColecao(db.faturas, db.transferencias)
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("NUBANK", 10, 28, "e1")], repositorio)
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("NUBANK", 11, 28, "e2")], repositorio)
+
+        itens = list(repositorio.transferencias_usuario(str(user_id), date(2025, 10, 20), date(2025, 11, 5)))
+
+        assert [item["data"] for item in itens][:2] == ["20/10/2025", "21/10/2025"]
+        assert itens[-1]["data"] == "05/11/2025"
+        assert len(itens) == 9 + 5
+        assert set(itens[0]) == {"fatura_id", "mes_ano", "banco", "valor", "data", "origem", "categoria"}
+
+
+class TestMigracao:
+
+    def test_migracao_idempotente_e_mantem_layout_embutido(self, db, user_id):
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("NUBANK", 10, 5, "e1", legado=True)])
+        salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("ITAU", 11, 3, legado=True)])  # sem _id
+        antes = list(db.faturas.find())
+        garantir_indices(db, indices_transferencias())
+
+        primeira = migrar_transferencias(db.faturas, db.transferencias)
+        segunda = migrar_transferencias(db.faturas, db.transferencias)
+
+        assert primeira == {"faturas": 2, "transferencias": 8, "inseridas": 8}
+        assert segunda == {"faturas": 2, "transferencias": 8, "inseridas": 0}
+        assert db.transferencias.count_documents({}) == 8
+        assert list(db.faturas.find()) == antes
+
+        embutido, colecao = RepositorioEmbutido(db.faturas), RepositorioColecao(db.faturas, db.transferencias)
+        for fatura in antes:
+            assert _stream(colecao, fatura["_id"]) == _stream(embutido, fatura["_id"])
+            assert [extrato_para_api(e) for e in colecao.extratos_da_fatura(fatura)] == \
+                [extrato_para_api(e) for e in fatura["extratos"]]
+        assert list(colecao.transferencias_usuario(str(user_id), None, None)) == \
+            sorted(embutido.transferencias_usuario(str(user_id), None, None),
+                   key=lambda item: datetime.strptime(item["data"], "%d/%m/%Y"))
+
+
+def test_indices_da_colecao(db):
+    relatorio = garantir_indices(db, indices_transferencias())
+
+    assert relatorio["criados"] == [
+        f"{COLLECTION_TRANSFERENCIAS}.user_id_1_data_1",
+        f"{COLLECTION_TRANSFERENCIAS}.user_id_1_categoria_1_data_1",
+        f"{COLLECTION_TRANSFERENCIAS}.fatura_id_1_extrato_id_1_indice_1",
+    ]
+
+
+def test_rotas_no_modo_colecao(db, user_id, monkeypatch):
+    monkeypatch.setattr(utils_transferencias, "ARMAZENAMENTO_TRANSFERENCIAS", "colecao")
+    repositorio = RepositorioColecao(db.faturas, db.transferencias)
+    salvar_extratos(db.usuarios, db.faturas, user_id, [_extrato("NUBANK", 10, 3, "e1")], repositorio)
+    fatura_id = db.faturas.find_one()["_id"]
+    app = create_app()
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user_id))}"}
+
+    conexao = {"usuarios": db.usuarios, "faturas": db.faturas, COLLECTION_TRANSFERENCIAS: db.transferencias}
+    with patch("app.routes.get_db_connection", return_value=conexao), \
+         patch("app.routes.COLLECTION_USERS", "usuarios"), patch("app.routes.COLLECTION_FATURAS", "faturas"):
+        cliente = app.test_client()
+        fatura = cliente.get(f"/faturas/{fatura_id}", headers=headers).get_json()["fatura"]
+        listagem = cliente.get(f"/faturas/usuario/{user_id}?incluir_extratos=true", headers=headers).get_json()
+        export = cliente.get(f"/faturas/usuario/{user_id}/transferencias?from=2025-10-02", headers=headers)
+
+    assert [t["valor"] for t in fatura["extratos"][0]["transferencias"]] == [0.0, -1.0, -2.0]
+    assert listagem["faturas"][0]["extratos"][0]["transferencias"][2]["data"] == "03/10/2025"
+    assert [json.loads(linha)["data"] for linha in export.get_data(as_text=True).splitlines()] == ["02/10/2025", "03/10/2025"]
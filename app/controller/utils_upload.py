@@ -0,0 +1,99 @@
+from io import BytesIO
+import os
+import shutil
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Iterator, Optional, Union
+import uuid
+
+
+# Limites do upload de extratos. O total da requisição vira o MAX_CONTENT_LENGTH do Flask (413 antes de
+# ler o corpo); o limite por arquivo é conferido na rota, sem ler o arquivo.
+UPLOAD_MAX_BYTES_REQUISICAO = int(os.getenv("UPLOAD_MAX_BYTES_REQUISICAO", str(100 * 1024 * 1024)))
+UPLOAD_MAX_BYTES_ARQUIVO = int(os.getenv("UPLOAD_MAX_BYTES_ARQUIVO", str(20 * 1024 * 1024)))
+
+# Arquivos copiados para a ingestão assíncrona ficam em memória até este tamanho e depois vão para um
+# arquivo temporário em disco.
+UPLOAD_LIMITE_MEMORIA = int(os.getenv("UPLOAD_LIMITE_MEMORIA", str(512 * 1024)))
+
+# Tamanho dos blocos lidos do arquivo ao copiar e ao enviar para a LlamaCloud.
+UPLOAD_TAMANHO_BLOCO = int(os.getenv("UPLOAD_TAMANHO_BLOCO", str(64 * 1024)))
+
+
+class ArquivoGrandeDemais(Exception):
+    """Arquivo do upload acima de UPLOAD_MAX_BYTES_ARQUIVO (a rota responde 413)."""
+
+    def __init__(self, arquivo: str, tamanho: int, limite: int):
+        super().__init__(f"O arquivo '{arquivo}' tem {tamanho} bytes; o limite por arquivo é {limite} bytes")
+        self.arquivo = arquivo
+        self.tamanho = tamanho
+
+
+def tamanho_arquivo(arquivo: BinaryIO) -> int:
+    """Tamanho pelo seek no fim (sem ler o conteúdo). Devolve o arquivo na posição inicial."""
+
+    arquivo.seek(0, os.SEEK_END)
+    tamanho = arquivo.tell()
+    arquivo.seek(0)
+    return tamanho
+
+
+def validar_tamanhos(files, limite: Optional[int] = None) -> None:
+    """Lança ArquivoGrandeDemais para o primeiro FileStorage acima do limite (padrão UPLOAD_MAX_BYTES_ARQUIVO)."""
+
+    limite = limite or UPLOAD_MAX_BYTES_ARQUIVO
+    for f in files:
+        tamanho = tamanho_arquivo(f.stream)
+        if tamanho > limite:
+            raise ArquivoGrandeDemais(f.filename, tamanho, limite)
+
+
+def copiar_para_spool(stream: BinaryIO, limite_memoria: int = UPLOAD_LIMITE_MEMORIA) -> SpooledTemporaryFile:
+    """Cópia em blocos para um SpooledTemporaryFile, que passa para o disco acima de limite_memoria.
+
+    Usado quando o arquivo precisa sobreviver à requisição (ingestão assíncrona): o Flask fecha os
+    streams do upload ao terminar a resposta.
+    """
+
+    copia = SpooledTemporaryFile(max_size=limite_memoria, mode="w+b")
+    stream.seek(0)
+    shutil.copyfileobj(stream, copia, UPLOAD_TAMANHO_BLOCO)
+    copia.seek(0)
+    return copia
+
+
+class CorpoMultipart:
+    """Corpo multipart/form-data que lê o arquivo em blocos enquanto é enviado.
+
+    O requests monta o corpo inteiro em memória quando recebe files=; este objeto é iterável e tem
+    tamanho conhecido, então o requests envia com Content-Length e vai lendo o arquivo do disco (ou do
+    spool) bloco a bloco. Pode ser iterado de novo (retry de conexão): cada iteração volta ao início.
+    """
+
+    def __init__(self, campos: dict, nome_campo: str, nome_arquivo: str, arquivo: Union[BinaryIO, bytes],
+                 content_type: str = "application/pdf", tamanho_bloco: int = UPLOAD_TAMANHO_BLOCO):
+        self.arquivo = BytesIO(arquivo) if isinstance(arquivo, (bytes, bytearray)) else arquivo
+        self.tamanho_bloco = tamanho_bloco
+        boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+
+        partes = [
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'
+            for nome, valor in campos.items()
+        ]
+        partes.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{nome_campo}"; filename="{nome_arquivo}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        )
+        self._inicio = "".join(partes).encode()
+        self._fim = f"\r\n--{boundary}--\r\n".encode()
+        self._tamanho = len(self._inicio) + tamanho_arquivo(self.arquivo) + len(self._fim)
+
+    def __len__(self) -> int:
+        return self._tamanho
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._inicio
+        self.arquivo.seek(0)
+        for bloco in iter(lambda: self.arquivo.read(self.tamanho_bloco), b""):
+            yield bloco
+        yield self._fim
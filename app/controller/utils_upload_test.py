@@ -0,0 +1,183 @@
+from datetime import datetime
+from io import BytesIO
+import os
+import tempfile
+import tracemalloc
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+from requests.models import RequestEncodingMixin
+from werkzeug.formparser import parse_form_data
+from werkzeug.test import EnvironBuilder
+
+from app import create_app
+from app.controller import utils_upload
+from app.controller.utils_upload import CorpoMultipart, copiar_para_spool
+
+mongomock = pytest.importorskip("mongomock")
+
+
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def arquivo_grande():
+    """PDF falso de 16 MB em disco, como o werkzeug guarda os uploads grandes."""
+    with tempfile.TemporaryFile() as arquivo:
+        bloco = os.urandom(MB)
+        for _ in range(16):
+            arquivo.write(bloco)
+        arquivo.seek(0)
+        yield arquivo
+
+
+def _pico_de_memoria(funcao):
+    tracemalloc.start()
+    try:
+        funcao()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class TestCorpoMultipart:
+
+    def test_formato_igual_ao_do_requests(self):
+        corpo = CorpoMultipart({"max_pages": 10, "fast_mode": True}, "file", "extrato.pdf", b"%PDF conteudo")
+        dados = b"".join(corpo)
+
+        _, form, files = parse_form_data({
+            "REQUEST_METHOD": "POST", "CONTENT_TYPE": corpo.content_type,
+            "CONTENT_LENGTH": str(len(dados)), "wsgi.input": BytesIO(dados),
+        })
+
+        assert len(corpo) == len(dados)
+        assert form.to_dict() == {"max_pages": "10", "fast_mode": "True"}
+        assert files["file"].filename == "extrato.pdf"
+        assert files["file"].mimetype == "application/pdf"
+        assert files["file"].read() == b"%PDF conteudo"
+
+    def test_pode_ser_enviado_de_novo(self):
+        corpo = CorpoMultipart({}, "file", "a.pdf", BytesIO(b"abc"))
+        assert b"".join(corpo) == b"".join(corpo)
+
+    def test_memoria_do_envio(self, arquivo_grande):
+        """Pico de memória para montar o corpo do upload de 16 MB (requests files= vs. streaming)."""
+        def com_requests():
+            RequestEncodingMixin._encode_files({"file": ("extrato.pdf", arquivo_grande, "application/pdf")}, {"max_pages": 10})
+
+        def em_blocos():
+            for _ in CorpoMultipart({"max_pages": 10}, "file", "extrato.pdf", arquivo_grande):
+                pass
+
+        pico_requests = _pico_de_memoria(com_requests)
+        pico_blocos = _pico_de_memoria(em_blocos)
+
+        assert pico_requests > 16 * MB
+        assert pico_blocos < MB
+
+
+def test_spool_vai_para_o_disco_acima_do_limite():
+    pequeno = copiar_para_spool(BytesIO(b"x" * 100), limite_memoria=1024)
+    grande = copiar_para_spool(BytesIO(b"x" * 4096), limite_memoria=1024)
+
+    assert not pequeno._rolled and grande._rolled
+    assert grande.read() == b"x" * 4096
+
+
+class TestRotaUpload:
+
+    @pytest.fixture
+    def app(self):
+        return create_app()
+
+    @pytest.fixture
+    def db(self):
+        db = mongomock.MongoClient().db
+        return db
+
+    def _headers(self, app, user_id):
+        with app.app_context():
+            return {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+
+    def _patches(self, db, formatar):
+        return (
+            patch("app.routes.get_db_connection", return_value={"usuarios": db.usuarios, "faturas": db.faturas}),
+            patch("app.routes.COLLECTION_USERS", "usuarios"),
+            patch("app.routes.COLLECTION_FATURAS", "faturas"),
+            patch("app.routes.formatar_extratos", formatar),
+        )
+
+    def test_arquivo_acima_do_limite(self, app, db, monkeypatch):
+        monkeypatch.setattr(utils_upload, "UPLOAD_MAX_BYTES_ARQUIVO", 1024)
+        user_id = str(db.usuarios.insert_one({"faturas": []}).inserted_id)
+        chamadas = []
+
+        async def formatar(arquivos):
+            chamadas.append(arquivos)
+            return []
+
+        p1, p2, p3, p4 = self._patches(db, formatar)
+        with p1, p2, p3, p4:
+            response = app.test_client().post(
+                f"/faturas/usuario/{user_id}", headers=self._headers(app, user_id), content_type="multipart/form-data",
+                data={"file": [(BytesIO(b"x" * 100), "ok.pdf"), (BytesIO(b"x" * 2048), "grande.pdf")]})
+
+        assert response.status_code == 413
+        assert response.get_json()["arquivo"] == "grande.pdf"
+        assert chamadas == []
+
+    def test_requisicao_acima_do_limite(self, app, db):
+        app.config["MAX_CONTENT_LENGTH"] = 1024
+        user_id = str(ObjectId())
+
+        async def formatar(arquivos):
+            return []
+
+        p1, p2, p3, p4 = self._patches(db, formatar)
+        with p1, p2, p3, p4:
+            response = app.test_client().post(
+                f"/faturas/usuario/{user_id}", headers=self._headers(app, user_id), content_type="multipart/form-data",
+                data={"file": (BytesIO(b"x" * 4096), "grande.pdf")})
+
+        assert response.status_code == 413
+        assert response.get_json()["success"] is False
+
+    def test_benchmark_memoria_do_upload(self, app, db):
+        """Benchmark: pico de memória da rota com 5 PDFs de 4 MB; os arquivos não são copiados para a memória."""
+        user_id = str(db.usuarios.insert_one({"faturas": []}).inserted_id)
+        recebidos = []
+
+        class ExtratoFalso:
+            def __init__(self, indice):
+                self.indice = indice
+
+            def to_dict(self):
+                return {"_id": str(ObjectId()), "banco": "ITAU", "data": datetime(2025, 10, 1), "transferencias": [
+                    {"valor": -float(self.indice), "data": datetime(2025, 10, 1), "origem": "PIX", "categoria": "Outros"}]}
+
+        async def formatar(arquivos):
+            for arquivo in arquivos:
+                # Como o parser: o arquivo é lido em blocos e liberado logo depois do envio.
+                recebidos.append(type(arquivo).__name__)
+                for _ in CorpoMultipart({}, "file", "x.pdf", arquivo):
+                    pass
+                arquivo.close()
+            return [ExtratoFalso(i) for i in range(len(arquivos))]
+
+        # O corpo da requisição é montado antes de medir: só conta o que a rota aloca.
+        environ = EnvironBuilder(
+            path=f"/faturas/usuario/{user_id}", method="POST", headers=self._headers(app, user_id),
+            data={"file": [(BytesIO(os.urandom(4 * MB)), f"extrato_{i}.pdf") for i in range(5)]},
+        ).get_environ()
+
+        respostas = []
+        p1, p2, p3, p4 = self._patches(db, formatar)
+        with p1, p2, p3, p4:
+            pico = _pico_de_memoria(lambda: respostas.append(app.test_client().open(environ)))
+
+        assert respostas[0].status_code == 201
+        assert "BytesIO" not in recebidos
+        assert pico < 4 * MB
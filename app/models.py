@@ -1,4 +1,4 @@
-from datetime import date
+from datetime import date, datetime
 from enum import Enum
 from typing import List
 
@@ -69,6 +69,11 @@ class Transferencia(BaseModel):
     categoria: CategoriaGasto = Field(..., description="Categoria da pessoa ou entidade que enviou ou recebeu a transação.")
 
 
+class ListaTransferencias(BaseModel):
+
+    extrato: List[Transferencia] = Field(..., description="Lista completa das transferências realizadas e recebidas neste trecho do extrato bancário.")
+
+
 class Extrato(BaseModel):
 
     banco : BancoCandidato = Field(..., description="Informações sobre o banco que o extrato pertence")
@@ -76,17 +81,18 @@ class Extrato(BaseModel):
     data : date = Field(..., description="Coloque a data do primeiro dia relativo ao mês do extrato.")
 
     def to_dict(self) -> dict:
-        
+        # Datas nativas (datetime no BSON), que ordenam e aceitam consultas por faixa; os textos
+        # "MM/YYYY" e "DD/MM/YYYY" são montados só na resposta da API (utils_datas).
         json = dict()
         json["banco"] = self.banco.banco.value
-        json["data"] = "/".join(str(self.data).split("-")[0:2][::-1])
+        json["data"] = datetime(self.data.year, self.data.month, 1)
         json["_id"] = str(ObjectId())
         json["transferencias"] = []
         for transferencia in self.extrato:
             json["transferencias"].append(
                 {
                     "valor": transferencia.valor,
-                    "data": "/".join(str(transferencia.data).split("-")[::-1]),
+                    "data": datetime(transferencia.data.year, transferencia.data.month, transferencia.data.day),
                     "origem": transferencia.origem.value,
                     "categoria": transferencia.categoria.value
                 }
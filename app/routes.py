@@ -1,34 +1,47 @@
 import asyncio
 from datetime import datetime
-from io import BytesIO
+import hmac
 import os
 import re
 
 from bson import ObjectId
 from bson.errors import InvalidId
 from validate_docbr import CPF
-from flask import jsonify, request
+from flask import Response, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.security import generate_password_hash
 from pymongo import ReturnDocument
 
 from app.controller.utils_formatar_extrato import formatar_extratos
+from app.controller.utils_admissao import LimiteExcedido, LoteGrandeDemais, custo_upload, obter_controle_admissao
+from app.controller.utils_analise import analisar, parametros_analise
+from app.controller.utils_bancos import estatisticas_bancos
+from app.controller.utils_cache_extrato import obter_cache_extratos
+from app.controller.utils_deduplicacao import modo_deduplicacao, salvar_sem_duplicados
+from app.controller.utils_datas import extrato_para_api, fatura_para_api, mes_ano_texto
+from app.controller.utils_jobs import enfileirar_ingestao, obter_job
+from app.controller.utils_listagem_faturas import listar_faturas
+import app.controller.utils_metricas as utils_metricas
+import app.controller.utils_perfil as utils_perfil
+from app.controller.utils_metricas import rastreado, registro, span
+from app.controller.utils_polling import metricas_polling, notificar_conclusao
+from app.controller.utils_resumo import formatar_resumo
+from app.controller.utils_stream import stream_fatura, stream_lista_json, stream_ndjson
+from app.controller.utils_transferencias import obter_repositorio
+from app.controller.utils_upload import ArquivoGrandeDemais, copiar_para_spool, tamanho_arquivo, validar_tamanhos
 from _db import get_db , get_db_connection
 
 COLLECTION_USERS = os.getenv("COLLECTION_USERS")
 COLLECTION_FATURAS = os.getenv("COLLECTION_FATURAS")
+# Quando verdadeiro, POST /faturas/usuario/<user_id> sempre responde 202 e processa em background.
+# Também pode ser pedido por requisição com ?assincrono=true.
+INGESTAO_ASSINCRONA = os.getenv("INGESTAO_ASSINCRONA", "False").lower() == "true"
 
 
 def register_routes_user(app):
     """Registra todas as rotas de usuários - Richardson Nível 2"""
     
-    # Criar índices na primeira inicialização
-    @app.before_request
-    def create_indexes():
-        collection = get_db()
-        collection.create_index("email", unique=True)
-    
-
     @app.route("/usuarios", methods=["GET"])
     @jwt_required()
     def list_users():
@@ -305,21 +318,27 @@ def register_routes_invoices(app):
     @app.route("/faturas/", methods=["GET"])
     @jwt_required()
     def get_faturas():
-        """GET /faturas - Listar apenas faturas do usuário autenticado"""
+        """GET /faturas - Listar apenas faturas do usuário autenticado (paginado: limit, cursor, from, to, incluir_extratos)"""
         try:
             user_id = get_jwt_identity()  # ← Pega ID do token
             db = get_db_connection()
             faturas_collection = db[COLLECTION_FATURAS]
             
             # ← Filtra apenas faturas do usuário logado
-            faturas = list(faturas_collection.find({"user_id": user_id}))
-            for fatura in faturas:
-                fatura["_id"] = str(fatura["_id"])
+            faturas, next_cursor = listar_faturas(
+                faturas_collection, user_id, request.args, obter_repositorio(db, faturas_collection)
+            )
             
             return jsonify({
                 "success": True,
-                "faturas": faturas
+                "faturas": faturas,
+                "next_cursor": next_cursor
             }), 200
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 400
         except Exception as e:
             return jsonify({
                 "success": False,
@@ -330,7 +349,7 @@ def register_routes_invoices(app):
     @app.route("/faturas/usuario/<user_id>", methods=["GET"])
     @jwt_required()
     def get_user_faturas(user_id):
-        """GET /faturas/usuario/<user_id> - Listar faturas (apenas próprias)"""
+        """GET /faturas/usuario/<user_id> - Listar faturas (apenas próprias, paginado como GET /faturas)"""
         try:
             current_user_id = get_jwt_identity()
             
@@ -362,14 +381,20 @@ def register_routes_invoices(app):
                 }), 404
             
             # Buscar faturas do usuário
-            faturas = list(faturas_collection.find({"user_id": str(obj_id)}))
-            for fatura in faturas:
-                fatura["_id"] = str(fatura["_id"])
+            faturas, next_cursor = listar_faturas(
+                faturas_collection, str(obj_id), request.args, obter_repositorio(db, faturas_collection)
+            )
             
             return jsonify({
                 "success": True,
-                "faturas": faturas
+                "faturas": faturas,
+                "next_cursor": next_cursor
             }), 200
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 400
         except Exception as e:
             return jsonify({
                 "success": False,
@@ -379,6 +404,7 @@ def register_routes_invoices(app):
 
     @app.route("/faturas/usuario/<user_id>", methods=["POST"])
     @jwt_required()
+    @rastreado("post_extrato")
     def post_extrato(user_id):
         """POST /faturas/usuario/<user_id> - Adicionar extrato (apenas próprio)"""
         try:
@@ -402,6 +428,7 @@ def register_routes_invoices(app):
             db = get_db_connection()
             users_collection = db[COLLECTION_USERS]
             faturas_collection = db[COLLECTION_FATURAS]
+            repositorio = obter_repositorio(db, faturas_collection)
         except Exception as e:
             print(f"Erro ao conectar no db: {str(e)}")
             return jsonify({
@@ -417,44 +444,99 @@ def register_routes_invoices(app):
                     "message": "Nenhum arquivo enviado"
                 }), 400
             
-            buffers = []
-            for f in files:
-                data = f.read()
-                f.stream.seek(0)
-                buffer = BytesIO(data)
-                buffer.name = f.filename
-                buffers.append(buffer)
-        
-            extratos = [extrato.to_dict() for extrato in asyncio.run(formatar_extratos(buffers))]
-            mes_ano = extratos[0]["data"]
+            try:
+                validar_tamanhos(files)
+            except ArquivoGrandeDemais as e:
+                return jsonify({
+                    "success": False,
+                    "message": str(e),
+                    "arquivo": e.arquivo
+                }), 413
+
+            try:
+                duplicados_modo = modo_deduplicacao(request.args.get("duplicados"))
+            except ValueError as e:
+                return jsonify({
+                    "success": False,
+                    "message": str(e)
+                }), 400
+            controle = obter_controle_admissao()
+            reserva = None
+            if controle is not None:
+                try:
+                    custo = custo_upload([tamanho_arquivo(f.stream) for f in files])
+                    reserva = controle.admitir(str(user_id_obj), custo, len(files))
+                except LimiteExcedido as e:
+                    response = jsonify({
+                        "success": False,
+                        "message": str(e),
+                        "motivo": e.motivo
+                    })
+                    response.headers["Retry-After"] = str(e.retry_apos)
+                    return response, 429
+                except LoteGrandeDemais as e:
+                    return jsonify({
+                        "success": False,
+                        "message": str(e)
+                    }), 413
+
+            def liberar():
+                if controle is not None:
+                    controle.liberar(reserva)
+
+            arquivos = [f.filename for f in files]
+
+            def salvar(extratos):
+                return salvar_sem_duplicados(users_collection, faturas_collection, user_id_obj, extratos,
+                                             arquivos, repositorio, duplicados_modo)
+
+            assincrono = request.args.get("assincrono", str(INGESTAO_ASSINCRONA)).lower() == "true"
+            if assincrono:
+                # O Flask fecha os streams do upload ao fim da requisição: o job recebe cópias em spool.
+                try:
+                    job_id = enfileirar_ingestao(
+                        str(user_id_obj), [copiar_para_spool(f.stream) for f in files], salvar, ao_encerrar=liberar
+                    )
+                except Exception:
+                    liberar()
+                    raise
+                response = jsonify({
+                    "success": True,
+                    "message": "Extrato recebido e em processamento",
+                    "job_id": job_id,
+                    "status_url": f"/faturas/jobs/{job_id}"
+                })
+                response.headers["Location"] = f"/faturas/jobs/{job_id}"
+                return response, 202
+
+            # Os streams do werkzeug (em memória até 500 KB, depois em arquivo temporário) vão direto para o parser.
+            try:
+                extratos = [extrato.to_dict() for extrato in asyncio.run(formatar_extratos([f.stream for f in files]))]
+            finally:
+                # A vaga é do parser e da LLM: volta antes da gravação no banco.
+                liberar()
+            with span("gravacao"):
+                duplicados = salvar(extratos)
+
+            ignorados = {d["indice"] for d in duplicados if d["acao"] == "ignorado"}
+            if ignorados and len(ignorados) == len(extratos):
+                return jsonify({
+                    "success": True,
+                    "message": "Nenhum extrato novo: todos já tinham sido enviados",
+                    "extrato": [],
+                    "duplicados": duplicados
+                }), 200
 
-            fatura = faturas_collection.find_one({"user_id": str(user_id_obj), "mes_ano": mes_ano})
-            if not fatura:
-                fatura_data = {
-                    "user_id": str(user_id_obj),
-                    "mes_ano": mes_ano,
-                    "extratos": []
-                }
-                result = faturas_collection.insert_one(fatura_data)
-                fatura_id = result.inserted_id
-                users_collection.update_one(
-                    {"_id": user_id_obj},
-                    {"$push": {"faturas": str(fatura_id)}}
-                )
-            else:
-                fatura_id = fatura["_id"]
-
-            # Adicionar extrato à lista de extratos da faturaExtrato
-            faturas_collection.update_one(
-                {"_id": fatura_id},
-                {"$push": {"extratos": {"$each": extratos}}}
-            )
-            
             return jsonify({
                 "success": True,
                 "message": "Extrato adicionado com sucesso",
-                "extrato": extratos
+                "extrato": [extrato_para_api(extrato) for indice, extrato in enumerate(extratos)
+                            if indice not in ignorados],
+                "duplicados": duplicados
             }), 201
+        except RequestEntityTooLarge:
+            # Corpo acima de MAX_CONTENT_LENGTH: o handler de 413 do app responde.
+            raise
         except Exception as e:
             print(f"Erro ao adicionar extrato: {str(e)}")
             return jsonify({
@@ -462,17 +544,116 @@ def register_routes_invoices(app):
                 "message": str(e)
             }), 500
 
-    def _bson_to_json_compatible(obj):
-        """Converte recursivamente ObjectId e datetime para tipos JSON-serializáveis."""
-        if isinstance(obj, ObjectId):
-            return str(obj)
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        if isinstance(obj, dict):
-            return {k: _bson_to_json_compatible(v) for k, v in obj.items()}
-        if isinstance(obj, list):
-            return [_bson_to_json_compatible(v) for v in obj]
-        return obj
+    @app.route("/faturas/jobs/<job_id>", methods=["GET"])
+    @jwt_required()
+    def get_job_ingestao(job_id):
+        """GET /faturas/jobs/<job_id> - Progresso e resultado de uma ingestão assíncrona (apenas própria)"""
+        current_user_id = get_jwt_identity()
+
+        job = obter_job(job_id)
+        if not job:
+            return jsonify({
+                "success": False,
+                "message": "Job não encontrado"
+            }), 404
+
+        # ← VERIFICAÇÃO: Usuário só vê seus próprios jobs
+        if job["user_id"] != current_user_id:
+            return jsonify({
+                "success": False,
+                "message": "Acesso negado. Você só pode ver seus próprios jobs"
+            }), 403
+
+        if job.get("resultado"):
+            job = {**job, "resultado": [extrato_para_api(extrato) for extrato in job["resultado"]]}
+        return jsonify({
+            "success": True,
+            "job": job
+        }), 200
+
+    @app.route("/faturas/parser/webhook", methods=["POST"])
+    def parser_webhook():
+        """POST /faturas/parser/webhook - Aviso da LlamaCloud de que um job terminou (acorda o polling)"""
+        segredo = os.getenv("LLAMA_WEBHOOK_SECRET")
+        token = request.headers.get("X-Webhook-Token") or request.args.get("token")
+        if segredo and not hmac.compare_digest(token or "", segredo):
+            return jsonify({
+                "success": False,
+                "message": "Token do webhook inválido"
+            }), 403
+
+        data = request.get_json(silent=True) or {}
+        job_id = data.get("job_id") or data.get("jobId") or data.get("id")
+        if not job_id:
+            return jsonify({
+                "success": False,
+                "message": "job_id é obrigatório"
+            }), 400
+
+        # A espera só existe no processo que enviou o extrato; nos demais o polling segue normalmente.
+        acordado = notificar_conclusao(job_id)
+        return jsonify({
+            "success": True,
+            "acordado": acordado
+        }), 200
+
+    @app.route("/faturas/parser/metricas-dev", methods=["GET"])
+    def get_metricas_parser_desenvolvimento():
+        """GET /faturas/parser/metricas-dev - Tempo até o resultado por job do parser (APENAS DESENVOLVIMENTO)"""
+        if os.getenv("FLASK_ENV") != "development":
+            return jsonify({
+                "success": False,
+                "message": "Esta rota está disponível apenas em desenvolvimento"
+            }), 403
+
+        return jsonify({
+            "success": True,
+            "metricas": metricas_polling.resumo()
+        }), 200
+
+    @app.route("/faturas/cache/metricas-dev", methods=["GET"])
+    def get_metricas_cache_desenvolvimento():
+        """GET /faturas/cache/metricas-dev - Hits e misses do cache de extratos (APENAS DESENVOLVIMENTO)"""
+        if os.getenv("FLASK_ENV") != "development":
+            return jsonify({
+                "success": False,
+                "message": "Esta rota está disponível apenas em desenvolvimento"
+            }), 403
+
+        cache = obter_cache_extratos()
+        return jsonify({
+            "success": True,
+            "metricas": cache.estatisticas.resumo() if cache is not None else None
+        }), 200
+
+    @app.route("/faturas/admissao/metricas-dev", methods=["GET"])
+    def get_metricas_admissao_desenvolvimento():
+        """GET /faturas/admissao/metricas-dev - Uploads admitidos e recusados pelo controle de admissão (APENAS DESENVOLVIMENTO)"""
+        if os.getenv("FLASK_ENV") != "development":
+            return jsonify({
+                "success": False,
+                "message": "Esta rota está disponível apenas em desenvolvimento"
+            }), 403
+
+        controle = obter_controle_admissao()
+        return jsonify({
+            "success": True,
+            "metricas": controle.estatisticas.resumo() if controle is not None else None
+        }), 200
+
+    @app.route("/faturas/bancos/metricas-dev", methods=["GET"])
+    def get_metricas_bancos_desenvolvimento():
+        """GET /faturas/bancos/metricas-dev - Bancos identificados pelo texto vs. fallback por imagens (APENAS DESENVOLVIMENTO)"""
+        if os.getenv("FLASK_ENV") != "development":
+            return jsonify({
+                "success": False,
+                "message": "Esta rota está disponível apenas em desenvolvimento"
+            }), 403
+
+        return jsonify({
+            "success": True,
+            "metricas": estatisticas_bancos.resumo()
+        }), 200
 
     @app.route("/faturas/<fatura_id>", methods=["GET"])
     @jwt_required()
@@ -492,7 +673,8 @@ def register_routes_invoices(app):
             db = get_db_connection()
             faturas_collection = db[COLLECTION_FATURAS]
 
-            fatura = faturas_collection.find_one({"_id": fatura_obj_id})
+            # Só os campos da fatura; os extratos vêm depois, por um cursor, direto para a resposta.
+            fatura = faturas_collection.find_one({"_id": fatura_obj_id}, {"extratos": 0})
             if not fatura:
                 return jsonify({
                     "success": False,
@@ -506,19 +688,201 @@ def register_routes_invoices(app):
                     "message": "Acesso negado. Você só pode ver suas próprias faturas"
                 }), 403
 
-            # converte campos BSON não serializáveis
-            fatura_serializavel = _bson_to_json_compatible(fatura)
+            linhas = obter_repositorio(db, faturas_collection).linhas_fatura(fatura_obj_id)
+            return Response(stream_fatura(fatura, linhas), mimetype="application/json"), 200
+
+        except Exception as e:
+            app.logger.exception("Erro ao buscar fatura")
+            return jsonify({
+                "success": False,
+                "message": "Erro interno ao buscar fatura"
+            }), 500
+
+    @app.route("/faturas/<fatura_id>/resumo", methods=["GET"])
+    @jwt_required()
+    def get_resumo_fatura(fatura_id):
+        """GET /faturas/<fatura_id>/resumo - Totais da fatura por categoria, origem e banco (apenas própria)"""
+        current_user_id = get_jwt_identity()
+
+        try:
+            fatura_obj_id = ObjectId(fatura_id)
+        except InvalidId:
+            return jsonify({
+                "success": False,
+                "message": "ID de fatura inválido"
+            }), 400
+
+        try:
+            db = get_db_connection()
+            faturas_collection = db[COLLECTION_FATURAS]
+
+            fatura = faturas_collection.find_one({"_id": fatura_obj_id}, {"user_id": 1, "mes_ano": 1, "resumo": 1})
+            if not fatura:
+                return jsonify({
+                    "success": False,
+                    "message": "Fatura não encontrada"
+                }), 404
+
+            # ← VERIFICAÇÃO: Usuário só vê suas próprias faturas
+            if fatura["user_id"] != current_user_id:
+                return jsonify({
+                    "success": False,
+                    "message": "Acesso negado. Você só pode ver suas próprias faturas"
+                }), 403
+
+            return jsonify({
+                "success": True,
+                "fatura_id": fatura_id,
+                "mes_ano": mes_ano_texto(fatura.get("mes_ano")),
+                "resumo": formatar_resumo(fatura.get("resumo"))
+            }), 200
+        except Exception as e:
+            app.logger.exception("Erro ao buscar resumo da fatura")
+            return jsonify({
+                "success": False,
+                "message": "Erro interno ao buscar resumo da fatura"
+            }), 500
+
+    @app.route("/faturas/usuario/<user_id>/resumo", methods=["GET"])
+    @jwt_required()
+    def get_resumo_usuario(user_id):
+        """GET /faturas/usuario/<user_id>/resumo - Totais de todas as faturas do usuário (apenas próprio)"""
+        current_user_id = get_jwt_identity()
+
+        # ← VERIFICAÇÃO: Usuário só vê seu próprio resumo
+        if current_user_id != user_id:
+            return jsonify({
+                "success": False,
+                "message": "Acesso negado. Você só pode ver seu próprio resumo"
+            }), 403
+
+        try:
+            obj_id = ObjectId(user_id)
+        except InvalidId:
+            return jsonify({
+                "success": False,
+                "message": "ID de usuário inválido"
+            }), 400
+
+        try:
+            db = get_db_connection()
+            users_collection = db[COLLECTION_USERS]
+
+            user = users_collection.find_one({"_id": obj_id}, {"resumo": 1})
+            if not user:
+                return jsonify({
+                    "success": False,
+                    "message": "Usuário não encontrado"
+                }), 404
 
             return jsonify({
                 "success": True,
-                "fatura": fatura_serializavel
+                "resumo": formatar_resumo(user.get("resumo"))
             }), 200
+        except Exception as e:
+            app.logger.exception("Erro ao buscar resumo do usuário")
+            return jsonify({
+                "success": False,
+                "message": "Erro interno ao buscar resumo do usuário"
+            }), 500
+
+    @app.route("/faturas/usuario/<user_id>/analise", methods=["GET"])
+    @jwt_required()
+    def get_analise_usuario(user_id):
+        """GET /faturas/usuario/<user_id>/analise - Totais agrupados por período e categoria/origem/banco (apenas próprio)"""
+        current_user_id = get_jwt_identity()
+
+        # ← VERIFICAÇÃO: Usuário só analisa suas próprias transferências
+        if current_user_id != user_id:
+            return jsonify({
+                "success": False,
+                "message": "Acesso negado. Você só pode analisar suas próprias transferências"
+            }), 403
 
+        try:
+            obj_id = ObjectId(user_id)
+            parametros = parametros_analise(request.args)
+        except InvalidId:
+            return jsonify({
+                "success": False,
+                "message": "ID de usuário inválido"
+            }), 400
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": str(e)
+            }), 400
+
+        try:
+            db = get_db_connection()
+            repositorio = obter_repositorio(db, db[COLLECTION_FATURAS])
+            analise = analisar(db[COLLECTION_USERS], repositorio, obj_id, parametros)
+            if analise is None:
+                return jsonify({
+                    "success": False,
+                    "message": "Usuário não encontrado"
+                }), 404
+
+            resultado, em_cache = analise
+            return jsonify({
+                "success": True,
+                "parametros": parametros,
+                "resultado": resultado,
+                "cache": em_cache
+            }), 200
         except Exception as e:
-            app.logger.exception("Erro ao buscar fatura")
+            app.logger.exception("Erro ao calcular análise")
             return jsonify({
                 "success": False,
-                "message": "Erro interno ao buscar fatura"
+                "message": "Erro interno ao calcular análise"
+            }), 500
+
+    @app.route("/faturas/usuario/<user_id>/transferencias", methods=["GET"])
+    @jwt_required()
+    def exportar_transferencias(user_id):
+        """GET /faturas/usuario/<user_id>/transferencias - Exporta as transferências do período em NDJSON ou JSON (apenas próprias)"""
+        current_user_id = get_jwt_identity()
+
+        # ← VERIFICAÇÃO: Usuário só exporta suas próprias transferências
+        if current_user_id != user_id:
+            return jsonify({
+                "success": False,
+                "message": "Acesso negado. Você só pode exportar suas próprias transferências"
+            }), 403
+
+        formato = request.args.get("formato", "ndjson").lower()
+        if formato not in ("ndjson", "json"):
+            return jsonify({
+                "success": False,
+                "message": "formato deve ser 'ndjson' ou 'json'"
+            }), 400
+
+        try:
+            de = datetime.strptime(request.args["from"], "%Y-%m-%d").date() if request.args.get("from") else None
+            ate = datetime.strptime(request.args["to"], "%Y-%m-%d").date() if request.args.get("to") else None
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": f"Período inválido (use from/to no formato YYYY-MM-DD): {str(e)}"
+            }), 400
+
+        try:
+            db = get_db_connection()
+            repositorio = obter_repositorio(db, db[COLLECTION_FATURAS])
+            transferencias = repositorio.transferencias_usuario(user_id, de, ate)
+            if formato == "json":
+                return Response(stream_lista_json("transferencias", transferencias), mimetype="application/json"), 200
+            return Response(stream_ndjson(transferencias), mimetype="application/x-ndjson"), 200
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": f"Período inválido: {str(e)}"
+            }), 400
+        except Exception as e:
+            app.logger.exception("Erro ao exportar transferências")
+            return jsonify({
+                "success": False,
+                "message": "Erro interno ao exportar transferências"
             }), 500
 
     @app.route("/faturas-dev", methods=["GET"])
@@ -540,6 +904,7 @@ def register_routes_invoices(app):
             # Converter ObjectId para string
             for fatura in faturas:
                 fatura["_id"] = str(fatura["_id"])
+            faturas = [fatura_para_api(fatura) for fatura in faturas]
             
             return jsonify({
                 "success": True,
@@ -552,3 +917,25 @@ def register_routes_invoices(app):
                 "message": str(e)
             }), 500
 
+
+def register_routes_metrics(app):
+    """Registra a rota de métricas no formato do Prometheus"""
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metricas():
+        """GET /metrics - Métricas do pipeline (METRICAS_HABILITADAS=True) e perfil das requisições (PERFIL_HABILITADO=True)"""
+        if not (utils_metricas.METRICAS_HABILITADAS or utils_perfil.PERFIL_HABILITADO):
+            return jsonify({
+                "success": False,
+                "message": "Métricas desabilitadas"
+            }), 404
+
+        if utils_metricas.METRICAS_TOKEN:
+            autorizacao = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(autorizacao, f"Bearer {utils_metricas.METRICAS_TOKEN}"):
+                return jsonify({
+                    "success": False,
+                    "message": "Token de métricas inválido"
+                }), 401
+
+        return Response(registro.exportar(), mimetype="text/plain; version=0.0.4")
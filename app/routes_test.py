@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import MagicMock, patch
 from bson import ObjectId
+from flask_jwt_extended import create_access_token
 from app import create_app
 
 
@@ -580,24 +581,31 @@ class TestPostExtratoAdvanced:
 
 
 class TestIndexCreation:
-    """Testes para criação de índices"""
-    
+    """Gerenciamento de índices não acontece durante requisições"""
+
+    CHAMADAS_DE_INDICE = ("create_index", "create_indexes", "list_indexes", "index_information", "drop_index")
+
+    @patch("app.routes.get_db_connection")
     @patch("app.routes.get_db")
-    def test_before_request_creates_index(self, mock_get_db, client):
-        """Testa se os índices são criados antes da primeira requisição"""
+    def test_requisicoes_nao_gerenciam_indices(self, mock_get_db, mock_get_db_connection, app, client):
+        """Conta as chamadas ao banco por requisição e garante que nenhuma mexe em índices"""
+        with app.app_context():
+            headers = {"Authorization": f"Bearer {create_access_token(identity='507f1f77bcf86cd799439011')}"}
         mock_collection = MagicMock()
+        mock_collection.find_one.return_value = None
         mock_get_db.return_value = mock_collection
-        
-        # Fazer qualquer requisição para disparar before_request
-        response = client.get("/usuarios")
-        
-        # Verificar se create_index foi chamado
-        mock_collection.create_index.assert_called()
-        
-        # Verificar os argumentos da chamada
-        call_args = mock_collection.create_index.call_args
-        assert call_args[0][0] == "email"
-        assert call_args[1].get("unique") == True
+        mock_db = MagicMock()
+        mock_db.__getitem__.return_value = mock_collection
+        mock_get_db_connection.return_value = mock_db
+
+        client.get("/usuarios", headers=headers)
+        client.post("/usuarios", json={"name": "x"})
+        client.get("/faturas/", headers=headers)
+
+        chamadas = [nome for nome, _, _ in mock_collection.mock_calls + mock_db.mock_calls]
+        assert len(chamadas) > 0
+        for metodo in self.CHAMADAS_DE_INDICE:
+            assert not any(nome.endswith(metodo) for nome in chamadas), metodo
 
 
 class TestGetUserFaturasEmpty:
@@ -0,0 +1,83 @@
+"""python -m benchmarks [--salvar-baseline caminho] [--comparar caminho] ..."""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import sys
+
+from dotenv import load_dotenv
+
+from benchmarks.harness import ENDPOINTS, Cenario, carregar_baseline, comparar, executar, formatar_tabela, salvar_baseline
+
+
+def _mix(texto: str) -> dict:
+    mix = {}
+    for par in texto.split(","):
+        endpoint, _, peso = par.partition("=")
+        if endpoint not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"endpoint desconhecido: {endpoint} (use {', '.join(ENDPOINTS)})")
+        mix[endpoint] = int(peso)
+    return mix
+
+
+def main(argv=None) -> int:
+    padrao = Cenario()
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark da API com parser e LLM simulados.")
+    parser.add_argument("--mongo-uri", help="mongod local; sem ele, usa o mongomock")
+    parser.add_argument("--usuarios", type=int, default=padrao.usuarios)
+    parser.add_argument("--meses", type=int, default=padrao.meses)
+    parser.add_argument("--extratos-por-mes", type=int, default=padrao.extratos_por_mes)
+    parser.add_argument("--transferencias-por-extrato", type=int, default=padrao.transferencias_por_extrato)
+    parser.add_argument("--requisicoes", type=int, default=padrao.requisicoes)
+    parser.add_argument("--concorrencia", type=int, default=padrao.concorrencia)
+    parser.add_argument("--mix", type=_mix, default=padrao.mix, help="pesos, ex.: login=1,listar_faturas=4,obter_fatura=4,upload=1")
+    parser.add_argument("--tamanho-pdf", type=int, default=padrao.tamanho_pdf)
+    parser.add_argument("--latencia-parser", type=float, default=padrao.latencia_processamento_parser,
+                        help="segundos até o job do parser ficar pronto")
+    parser.add_argument("--latencia-llm", type=float, default=padrao.latencia_llm, help="segundos por chamada à LLM")
+    parser.add_argument("--semente", type=int, default=padrao.semente)
+    parser.add_argument("--salvar-baseline", metavar="CAMINHO", help="grava o resultado em JSON")
+    parser.add_argument("--comparar", metavar="CAMINHO", help="compara com um baseline e sai com 1 se houver regressão")
+    parser.add_argument("--verboso", action="store_true", help="mostra os logs da aplicação durante a carga")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora relativa aceita na comparação (padrão 0.2)")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    cenario = Cenario(
+        usuarios=args.usuarios,
+        meses=args.meses,
+        extratos_por_mes=args.extratos_por_mes,
+        transferencias_por_extrato=args.transferencias_por_extrato,
+        requisicoes=args.requisicoes,
+        concorrencia=args.concorrencia,
+        mix=args.mix,
+        tamanho_pdf=args.tamanho_pdf,
+        latencia_processamento_parser=args.latencia_parser,
+        latencia_llm=args.latencia_llm,
+        semente=args.semente,
+    )
+    if args.verboso:
+        resultado = executar(cenario, args.mongo_uri)
+    else:
+        with redirect_stdout(io.StringIO()):
+            resultado = executar(cenario, args.mongo_uri)
+
+    baseline = carregar_baseline(args.comparar) if args.comparar else None
+    print(formatar_tabela(resultado, baseline))
+
+    if args.salvar_baseline:
+        salvar_baseline(resultado, args.salvar_baseline)
+        print(f"Baseline salvo em {args.salvar_baseline}")
+
+    if baseline is not None:
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        for regressao in regressoes:
+            print(f"REGRESSÃO {regressao}")
+        if regressoes:
+            return 1
+        print("Sem regressões em relação ao baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+"""Benchmark da API: create_app() contra um MongoDB local (mongomock ou mongod), com parser e LLM simulados.
+
+Semeia usuários e faturas pelo mesmo caminho de gravação das rotas, repete uma carga mista (login, listagem,
+fatura, upload) com várias threads e mede p50/p95/p99 e vazão por endpoint. O upload percorre o pipeline
+inteiro (multipart, polling, pré-classificador, estruturação, deduplicação, gravação): só a LlamaCloud e a
+OpenAI são trocadas por dublês que respondem com latência configurável.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timezone
+from io import BytesIO
+import inspect
+import json
+import os
+import platform
+import random
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from unittest.mock import patch
+
+from bson import ObjectId
+from flask_jwt_extended import create_access_token
+from langchain_core.runnables import RunnableLambda
+from werkzeug.security import generate_password_hash
+
+import _db
+from app import create_app
+import app.controller.utils_admissao as utils_admissao
+import app.controller.utils_cache_extrato as utils_cache_extrato
+import app.controller.utils_extrato_functions as utils_extrato_functions
+import app.controller.utils_llama_cloud as utils_llama_cloud
+import app.routes as routes
+from app.controller.utils_cadeias_llm import limpar_cadeias
+from app.controller.utils_deduplicacao import salvar_sem_duplicados
+from app.controller.utils_indices import garantir_indices, indices_necessarios
+from app.controller.utils_transferencias import obter_repositorio
+from app.models import Banco, BancoCandidato, CategoriaGasto, Extrato, ListaTransferencias, OrigemTransacao, Transferencia
+
+
+COLLECTION_USERS = "usuarios"
+COLLECTION_FATURAS = "faturas"
+SENHA = "senha-benchmark"
+
+ENDPOINTS = ("login", "listar_faturas", "obter_fatura", "upload")
+METRICAS_LATENCIA = ("p50_ms", "p95_ms", "p99_ms")
+# Com poucas amostras o p95/p99 é a maior medida: só entram na comparação a partir destes tamanhos.
+AMOSTRAS_MINIMAS = {"p50_ms": 1, "p95_ms": 20, "p99_ms": 100}
+
+_BANCOS = [Banco.NUBANK, Banco.ITAU, Banco.BRADESCO, Banco.INTER, Banco.SANTANDER]
+
+
+@dataclass
+class Cenario:
+    """Parâmetros de uma execução; vão junto com os resultados no baseline."""
+
+    usuarios: int = 20
+    meses: int = 12
+    extratos_por_mes: int = 2
+    transferencias_por_extrato: int = 60
+    requisicoes: int = 400
+    concorrencia: int = 8
+    # Peso de cada endpoint na carga mista.
+    mix: Dict[str, int] = field(default_factory=lambda: {"login": 1, "listar_faturas": 4, "obter_fatura": 4, "upload": 1})
+    tamanho_pdf: int = 200 * 1024
+    # Latências simuladas, em segundos.
+    latencia_upload_parser: float = 0.05
+    latencia_processamento_parser: float = 0.8
+    latencia_consulta_parser: float = 0.02
+    latencia_llm: float = 0.6
+    semente: int = 42
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+
+    if not valores:
+        return 0.0
+    posto = max(1, -(-len(valores) * p // 100))
+    return valores[int(posto) - 1]
+
+
+# --- Dublês da LlamaCloud e da OpenAI ---------------------------------------------------------------
+
+class RespostaFalsa:
+
+    def __init__(self, status_code: int, dados=None, content: bytes = b""):
+        self.status_code = status_code
+        self._dados = dados
+        self.content = content
+
+    def json(self):
+        return self._dados
+
+
+class LlamaCloudFalso:
+    """Responde como a API de parsing: o job fica PENDING por `latencia_processamento` e depois devolve o texto."""
+
+    def __init__(self, cenario: Cenario, relogio=time.monotonic):
+        self.cenario = cenario
+        self._relogio = relogio
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, tuple] = {}
+        self.uploads = 0
+        self.consultas = 0
+
+    def post(self, path: str, data=None, **kwargs):
+        # Lê o corpo como o requests faria, bloco a bloco.
+        tamanho = sum(len(bloco) for bloco in data) if data is not None else 0
+        time.sleep(self.cenario.latencia_upload_parser)
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self.uploads += 1
+            self._jobs[job_id] = (self._relogio() + self.cenario.latencia_processamento_parser, tamanho)
+        return RespostaFalsa(200, {"id": job_id})
+
+    def get(self, path: str, **kwargs):
+        partes = path.strip("/").split("/")  # parsing/job/<id>[/result/<tipo>]
+        job = self._jobs.get(partes[2])
+        if job is None:
+            return RespostaFalsa(404)
+        time.sleep(self.cenario.latencia_consulta_parser)
+        if len(partes) == 3:
+            with self._lock:
+                self.consultas += 1
+            return RespostaFalsa(200, {"status": "SUCCESS" if self._relogio() >= job[0] else "PENDING"})
+        if partes[4] == "text":
+            return RespostaFalsa(200, {"text": texto_extrato(partes[2], self.cenario.transferencias_por_extrato)})
+        if partes[4] == "json":
+            return RespostaFalsa(200, {"pages": []})
+        return RespostaFalsa(404)
+
+    def close(self):
+        pass
+
+
+def texto_extrato(semente: str, transferencias: int) -> str:
+    """Texto no formato da LlamaParse: cabeçalho com banco e período, e uma linha por transação."""
+
+    rng = random.Random(semente)
+    mes = date(2024, rng.randint(1, 12), 1)
+    linhas = [f"EXTRATO DE CONTA CORRENTE - {rng.choice(_BANCOS).value}", f"Período: {mes:%m/%Y}", ""]
+    for _ in range(transferencias):
+        valor = rng.uniform(-900, 3000) if rng.random() < 0.1 else -rng.uniform(5, 400)
+        linhas.append(f"{rng.randint(1, 28):02d}/{mes:%m/%Y} | Pagamento {rng.randrange(10 ** 6):06d} | {valor:.2f}")
+    return "\n".join(linhas)
+
+
+def _transferencias_aleatorias(rng: random.Random, mes: date, quantidade: int) -> List[Transferencia]:
+    return [
+        Transferencia(
+            valor=round(rng.uniform(-900, 3000) if rng.random() < 0.1 else -rng.uniform(5, 400), 2),
+            data=date(mes.year, mes.month, rng.randint(1, 28)),
+            origem=rng.choice(list(OrigemTransacao)),
+            categoria=rng.choice(list(CategoriaGasto)),
+        )
+        for _ in range(quantidade)
+    ]
+
+
+def extrato_aleatorio(rng: random.Random, mes: date, transferencias: int) -> Extrato:
+    return Extrato(
+        banco=BancoCandidato(banco=rng.choice(_BANCOS), score=0.95),
+        extrato=_transferencias_aleatorias(rng, mes, transferencias),
+        data=mes,
+    )
+
+
+def _mes_do_texto(texto: str) -> date:
+    encontrado = re.search(r"Período: (\d{2})/(\d{4})", texto)
+    if encontrado is None:
+        return date(2024, 1, 1)
+    return date(int(encontrado.group(2)), int(encontrado.group(1)), 1)
+
+
+def cadeias_falsas(cenario: Cenario) -> Dict[str, object]:
+    """Fábricas para os _criar_cadeia_* de utils_extrato_functions: dormem `latencia_llm` e devolvem dados coerentes."""
+
+    def estruturar(entrada: dict) -> Extrato:
+        time.sleep(cenario.latencia_llm)
+        texto = entrada["extrato"]
+        linhas = sum(1 for linha in texto.split("\n") if linha.strip()) - 2
+        return extrato_aleatorio(random.Random(texto), _mes_do_texto(texto), max(linhas, 0))
+
+    def transferencias(entrada: dict) -> ListaTransferencias:
+        time.sleep(cenario.latencia_llm)
+        texto = entrada["extrato"]
+        linhas = sum(1 for linha in texto.split("\n") if linha.strip())
+        return ListaTransferencias(extrato=_transferencias_aleatorias(random.Random(texto), _mes_do_texto(texto), linhas))
+
+    def banco(_entrada) -> BancoCandidato:
+        time.sleep(cenario.latencia_llm)
+        return BancoCandidato(banco=Banco.NAO_IDENTIFICADO, score=0.0)
+
+    return {
+        "_criar_cadeia_extrato": lambda: RunnableLambda(estruturar),
+        "_criar_cadeia_transferencias": lambda: RunnableLambda(transferencias),
+        "_criar_cadeia_banco": lambda: RunnableLambda(banco),
+    }
+
+
+# --- Ambiente ---------------------------------------------------------------------------------------
+
+def _mongomock_compativel():
+    # O pymongo >= 4.11 passa "sort" para o bulk de UpdateOne, argumento que o mongomock 4.3 não conhece.
+    from mongomock.collection import BulkOperationBuilder
+
+    original = BulkOperationBuilder.add_update
+    if "sort" in inspect.signature(original).parameters:
+        return patch.object(BulkOperationBuilder, "add_update", original)
+
+    def add_update(self, *args, sort=None, **kwargs):
+        return original(self, *args, **kwargs)
+
+    return patch.object(BulkOperationBuilder, "add_update", add_update)
+
+
+@contextmanager
+def ambiente(cenario: Cenario, mongo_uri: Optional[str] = None):
+    """Conecta o _db a um banco descartável, troca LlamaCloud e OpenAI pelos dublês e devolve (app, db, parser)."""
+
+    nome_banco = f"benchmark_{ObjectId()}"
+    if mongo_uri:
+        from pymongo import MongoClient
+        cliente = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+        compatibilidade = patch.dict({})
+    else:
+        import mongomock
+        cliente = mongomock.MongoClient()
+        compatibilidade = _mongomock_compativel()
+
+    parser = LlamaCloudFalso(cenario)
+    db = cliente[nome_banco]
+    with compatibilidade, \
+         patch.dict(os.environ, {"COLLECTION_USERS": COLLECTION_USERS, "COLLECTION_FATURAS": COLLECTION_FATURAS}), \
+         patch.multiple(_db, _client=cliente, _collection=db[COLLECTION_USERS], DB_NAME=nome_banco), \
+         patch.multiple(routes, COLLECTION_USERS=COLLECTION_USERS, COLLECTION_FATURAS=COLLECTION_FATURAS), \
+         patch.multiple(utils_extrato_functions, **cadeias_falsas(cenario)), \
+         patch.object(utils_llama_cloud, "_cliente", parser), \
+         patch.object(utils_cache_extrato, "_cache", None), \
+         patch.object(utils_admissao, "_controle", None):
+        limpar_cadeias()
+        try:
+            garantir_indices(db, indices_necessarios())
+            yield create_app(), db, parser
+        finally:
+            limpar_cadeias()
+            if mongo_uri:
+                cliente.drop_database(nome_banco)
+                cliente.close()
+
+
+def semear(db, cenario: Cenario) -> List[dict]:
+    """Usuários com `meses` faturas de `extratos_por_mes` extratos, gravados como o upload grava."""
+
+    rng = random.Random(cenario.semente)
+    senha = generate_password_hash(SENHA)  # um hash só: o custo do scrypt fica no login medido, não no seed
+    usuarios_collection = db[COLLECTION_USERS]
+    faturas_collection = db[COLLECTION_FATURAS]
+    repositorio = obter_repositorio(db, faturas_collection)
+    hoje = date.today()
+
+    usuarios = []
+    for i in range(cenario.usuarios):
+        user_id = usuarios_collection.insert_one({
+            "name": f"Usuário {i}",
+            "email": f"usuario{i}@benchmark.local",
+            "cpf": f"{i:011d}",
+            "phone": f"1199{i:07d}",
+            "password": senha,
+            "faturas": [],
+            "created_at": datetime.now(timezone.utc),
+        }).inserted_id
+
+        extratos = []
+        for m in range(cenario.meses):
+            ano, mes = divmod(hoje.year * 12 + hoje.month - 1 - m, 12)
+            for _ in range(cenario.extratos_por_mes):
+                extratos.append(extrato_aleatorio(rng, date(ano, mes + 1, 1), cenario.transferencias_por_extrato).to_dict())
+        salvar_sem_duplicados(usuarios_collection, faturas_collection, user_id, extratos,
+                              [f"seed-{n}.pdf" for n in range(len(extratos))], repositorio)
+
+        faturas = [str(f["_id"]) for f in faturas_collection.find({"user_id": str(user_id)}, {"_id": 1})]
+        usuarios.append({"id": str(user_id), "email": f"usuario{i}@benchmark.local", "faturas": faturas})
+    return usuarios
+
+
+# --- Carga ------------------------------------------------------------------------------------------
+
+def _pdf_falso(rng: random.Random, tamanho: int) -> bytes:
+    return b"%PDF-1.4\n" + rng.randbytes(max(tamanho - 9, 0))
+
+
+def _requisicao(endpoint: str, cliente, usuario: dict, headers: dict, rng: random.Random, cenario: Cenario):
+    if endpoint == "login":
+        return cliente.post("/auth/login", json={"email": usuario["email"], "password": SENHA})
+    if endpoint == "listar_faturas":
+        return cliente.get(f"/faturas/usuario/{usuario['id']}?limit=20", headers=headers)
+    if endpoint == "obter_fatura":
+        return cliente.get(f"/faturas/{rng.choice(usuario['faturas'])}", headers=headers)
+    return cliente.post(f"/faturas/usuario/{usuario['id']}", headers=headers, content_type="multipart/form-data",
+                        data={"file": [(BytesIO(_pdf_falso(rng, cenario.tamanho_pdf)), "extrato.pdf")]})
+
+
+def executar(cenario: Cenario, mongo_uri: Optional[str] = None) -> dict:
+    """Semeia, roda a carga mista e devolve o resultado (cenário, ambiente e estatísticas por endpoint)."""
+
+    with ambiente(cenario, mongo_uri) as (app, db, parser):
+        usuarios = semear(db, cenario)
+        with app.app_context():
+            tokens = {u["id"]: {"Authorization": f"Bearer {create_access_token(identity=u['id'])}"} for u in usuarios}
+
+        rng = random.Random(cenario.semente)
+        pesos = [cenario.mix.get(endpoint, 0) for endpoint in ENDPOINTS]
+        plano = [(rng.choices(ENDPOINTS, pesos)[0], rng.choice(usuarios), rng.random()) for _ in range(cenario.requisicoes)]
+        clientes = threading.local()
+        medidas: Dict[str, List[tuple]] = {endpoint: [] for endpoint in ENDPOINTS}
+        medidas_lock = threading.Lock()
+
+        def disparar(passo):
+            endpoint, usuario, semente = passo
+            cliente = getattr(clientes, "cliente", None)
+            if cliente is None:
+                # Sem cookies: o access_token do login (cookie) teria precedência sobre o header de outro usuário.
+                cliente = clientes.cliente = app.test_client(use_cookies=False)
+            inicio = time.perf_counter()
+            resposta = _requisicao(endpoint, cliente, usuario, tokens[usuario["id"]], random.Random(semente), cenario)
+            resposta.get_data()  # rotas em streaming só terminam quando o corpo é lido
+            resposta.close()
+            duracao = time.perf_counter() - inicio
+            with medidas_lock:
+                medidas[endpoint].append((duracao, resposta.status_code))
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=cenario.concorrencia) as executor:
+            list(executor.map(disparar, plano))
+        total = time.perf_counter() - inicio
+
+    return {
+        "cenario": asdict(cenario),
+        "ambiente": {
+            "mongo": "mongod" if mongo_uri else "mongomock",
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "duracao_s": round(total, 3),
+        "vazao_total_rps": round(cenario.requisicoes / total, 2),
+        "parser": {"uploads": parser.uploads, "consultas_status": parser.consultas},
+        "endpoints": {endpoint: _estatisticas(valores, total) for endpoint, valores in medidas.items() if valores},
+    }
+
+
+def _estatisticas(medidas: List[tuple], total: float) -> dict:
+    duracoes = sorted(duracao for duracao, _ in medidas)
+    status: Dict[str, int] = {}
+    for _, codigo in medidas:
+        status[str(codigo)] = status.get(str(codigo), 0) + 1
+    return {
+        "n": len(duracoes),
+        "status": status,
+        "erros": sum(n for codigo, n in status.items() if int(codigo) >= 500),
+        "p50_ms": round(percentil(duracoes, 50) * 1000, 2),
+        "p95_ms": round(percentil(duracoes, 95) * 1000, 2),
+        "p99_ms": round(percentil(duracoes, 99) * 1000, 2),
+        "vazao_rps": round(len(duracoes) / total, 2),
+    }
+
+
+# --- Baselines --------------------------------------------------------------------------------------
+
+def salvar_baseline(resultado: dict, caminho: str) -> None:
+    os.makedirs(os.path.dirname(caminho) or ".", exist_ok=True)
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+
+
+def carregar_baseline(caminho: str) -> dict:
+    with open(caminho, encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def comparar(atual: dict, baseline: dict, tolerancia: float = 0.2, folga_ms: float = 2.0) -> List[str]:
+    """Regressões do resultado atual em relação ao baseline.
+
+    Uma latência regrediu se passou de baseline * (1 + tolerancia) e também da folga absoluta em ms (ruído de
+    endpoints de poucos milissegundos); a vazão, se caiu abaixo de baseline * (1 - tolerancia). Erros 5xx novos
+    contam sempre. Percentis altos de endpoints com poucas amostras (AMOSTRAS_MINIMAS) não são comparados.
+    """
+
+    regressoes = []
+    if atual["cenario"] != baseline["cenario"]:
+        regressoes.append("cenário diferente do baseline: os números não são comparáveis")
+    for endpoint, base in baseline["endpoints"].items():
+        medido = atual["endpoints"].get(endpoint)
+        if medido is None:
+            regressoes.append(f"{endpoint}: ausente na execução atual")
+            continue
+        for metrica in METRICAS_LATENCIA:
+            if min(medido["n"], base["n"]) < AMOSTRAS_MINIMAS[metrica]:
+                continue
+            limite = max(base[metrica] * (1 + tolerancia), base[metrica] + folga_ms)
+            if medido[metrica] > limite:
+                regressoes.append(f"{endpoint}: {metrica} {base[metrica]} -> {medido[metrica]}")
+        if medido["vazao_rps"] < base["vazao_rps"] * (1 - tolerancia):
+            regressoes.append(f"{endpoint}: vazao_rps {base['vazao_rps']} -> {medido['vazao_rps']}")
+        if medido["erros"] > base["erros"]:
+            regressoes.append(f"{endpoint}: erros {base['erros']} -> {medido['erros']}")
+    return regressoes
+
+
+def formatar_tabela(resultado: dict, baseline: Optional[dict] = None) -> str:
+    linhas = [f"{'endpoint':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}  status"]
+    for endpoint, estatisticas in resultado["endpoints"].items():
+        linha = (f"{endpoint:<16}{estatisticas['n']:>6}{estatisticas['p50_ms']:>10}{estatisticas['p95_ms']:>10}"
+                 f"{estatisticas['p99_ms']:>10}{estatisticas['vazao_rps']:>9}  {estatisticas['status']}")
+        base = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if base:
+            linha += f"  (baseline p95 {base['p95_ms']} ms, {base['vazao_rps']} req/s)"
+        linhas.append(linha)
+    linhas.append(f"total: {resultado['vazao_total_rps']} req/s em {resultado['duracao_s']} s")
+    return "\n".join(linhas)
@@ -0,0 +1,73 @@
+import copy
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.harness import ENDPOINTS, Cenario, carregar_baseline, comparar, executar, percentil, salvar_baseline
+
+pytest.importorskip("mongomock")
+
+
+def _cenario_rapido(**kwargs) -> Cenario:
+    # Latências zeradas: o primeiro polling já encontra o job pronto e a LLM responde na hora.
+    return Cenario(usuarios=3, meses=2, extratos_por_mes=1, transferencias_por_extrato=10, requisicoes=40,
+                   concorrencia=4, tamanho_pdf=2048, latencia_upload_parser=0, latencia_processamento_parser=0,
+                   latencia_consulta_parser=0, latencia_llm=0, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def resultado():
+    return executar(_cenario_rapido(mix={endpoint: 1 for endpoint in ENDPOINTS}))
+
+
+def test_percentil_posto_mais_proximo():
+    valores = list(range(1, 101))
+    assert (percentil(valores, 50), percentil(valores, 95), percentil(valores, 99)) == (50, 95, 99)
+    assert percentil([7], 99) == 7
+    assert percentil([], 50) == 0.0
+
+
+def test_carga_mista_passa_por_todos_os_endpoints(resultado):
+    assert set(resultado["endpoints"]) == set(ENDPOINTS)
+    assert sum(e["n"] for e in resultado["endpoints"].values()) == 40
+    for endpoint, estatisticas in resultado["endpoints"].items():
+        assert all(codigo in ("200", "201") for codigo in estatisticas["status"]), (endpoint, estatisticas["status"])
+        assert estatisticas["p50_ms"] <= estatisticas["p95_ms"] <= estatisticas["p99_ms"]
+    # Cada upload passou pelo parser simulado.
+    assert resultado["parser"]["uploads"] == resultado["endpoints"]["upload"]["n"]
+
+
+def test_baseline_ida_e_volta_e_comparacao(resultado, tmp_path):
+    caminho = tmp_path / "baselines" / "local.json"
+    salvar_baseline(resultado, str(caminho))
+    baseline = carregar_baseline(str(caminho))
+    assert comparar(resultado, baseline) == []
+
+    pior = copy.deepcopy(resultado)
+    pior["endpoints"]["listar_faturas"]["p50_ms"] = baseline["endpoints"]["listar_faturas"]["p50_ms"] * 2 + 10
+    pior["endpoints"]["upload"]["vazao_rps"] = 0
+    del pior["endpoints"]["login"]
+    regressoes = comparar(pior, baseline)
+    assert any(r.startswith("listar_faturas: p50_ms") for r in regressoes)
+    assert any(r.startswith("upload: vazao_rps") for r in regressoes)
+    assert "login: ausente na execução atual" in regressoes
+
+
+def test_percentis_altos_de_poucas_amostras_nao_sao_comparados(resultado):
+    pior = copy.deepcopy(resultado)
+    pior["endpoints"]["login"]["p99_ms"] = resultado["endpoints"]["login"]["p99_ms"] * 10 + 100
+    assert comparar(pior, resultado) == []
+
+
+def test_cli_sai_com_1_na_regressao(tmp_path, capsys):
+    caminho = str(tmp_path / "base.json")
+    argumentos = ["--usuarios", "2", "--meses", "1", "--requisicoes", "10", "--mix", "listar_faturas=1",
+                  "--latencia-parser", "0", "--latencia-llm", "0"]
+    assert main(argumentos + ["--salvar-baseline", caminho]) == 0
+
+    baseline = carregar_baseline(caminho)
+    baseline["endpoints"]["listar_faturas"]["vazao_rps"] *= 100
+    salvar_baseline(baseline, caminho)
+
+    assert main(argumentos + ["--comparar", caminho]) == 1
+    assert "REGRESSÃO listar_faturas: vazao_rps" in capsys.readouterr().out
@@ -0,0 +1,308 @@
+"""Microbenchmarks de etapas isoladas do pipeline: python -m benchmarks.micro [nome ...]
+
+Os testes unitários verificam o comportamento (concorrência, ordem, resultados) sem medir tempo; as
+medidas ficam aqui. Cada benchmark imprime uma linha com os tempos, sem limites nem baseline: para a
+carga da API com baseline e comparação, use python -m benchmarks.
+"""
+
+import argparse
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager, redirect_stdout
+from datetime import date
+from io import BytesIO
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional
+from unittest.mock import patch
+
+from bson import ObjectId
+from langchain_core.runnables import RunnableLambda
+import requests
+
+import app.controller.utils_extrato_functions as utils_extrato_functions
+from app.controller.utils_bancos import identificar_banco_por_texto
+from app.controller.utils_cache_extrato import CacheMemoria
+import app.controller.utils_analise as utils_analise
+import app.controller.utils_classificador as utils_classificador
+from app.controller.utils_cadeias_llm import limpar_cadeias, obter_cadeia
+from app.controller.utils_classificador import preclassificar
+from app.controller.utils_formatar_extrato import formatar_extratos
+from app.controller.utils_indices import garantir_indices, indices_necessarios
+from app.controller.utils_listagem_faturas import listar_faturas
+from app.controller.utils_llama_cloud import LlamaCloudClient
+from app.controller.utils_transferencias import RepositorioEmbutido
+from app.models import Banco, BancoCandidato, Extrato, ListaTransferencias
+from benchmarks.harness import COLLECTION_FATURAS, COLLECTION_USERS, Cenario, RespostaFalsa, _mongomock_compativel, semear
+
+
+BENCHMARKS: Dict[str, Callable[[], str]] = {}
+
+# mongod dos benchmarks que usam o banco (--mongo-uri); sem ele, o mongomock, que não usa índices e
+# executa as agregações em Python: só serve para comparar execuções na mesma máquina.
+_mongo_uri: Optional[str] = None
+
+
+def benchmark(func: Callable[[], str]) -> Callable[[], str]:
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def _cronometrar(func, *args, **kwargs) -> float:
+    inicio = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - inicio
+
+
+@contextmanager
+def _banco():
+    """Banco descartável no mongod de --mongo-uri ou no mongomock."""
+
+    nome = f"benchmark_{ObjectId()}"
+    if _mongo_uri is None:
+        import mongomock
+        with _mongomock_compativel():
+            db = mongomock.MongoClient()[nome]
+            garantir_indices(db, indices_necessarios())
+            yield db
+        return
+    from pymongo import MongoClient
+    cliente = MongoClient(_mongo_uri, serverSelectionTimeoutMS=5000)
+    try:
+        db = cliente[nome]
+        garantir_indices(db, indices_necessarios())
+        yield db
+    finally:
+        cliente.drop_database(nome)
+        cliente.close()
+
+
+@contextmanager
+def _backends_simulados(latencia_parser: float, latencia_llm: float, cache=None):
+    """Troca LlamaCloud e OpenAI por dublês com latência fixa em volta de formatar_extratos."""
+
+    def post_extrato_parser(arquivo, file_name="file_name"):
+        time.sleep(latencia_parser)
+        return RespostaFalsa(200, {"id": file_name})
+
+    def get_status_job_parser(id):
+        time.sleep(latencia_parser)
+        return RespostaFalsa(200, {"status": "SUCCESS"})
+
+    def get_extrato_estruturado(texto):
+        time.sleep(latencia_llm)
+        return Extrato(banco=BancoCandidato(banco=Banco.ITAU, score=0.95), extrato=[], data=date(2025, 10, 1))
+
+    with patch("app.controller.utils_formatar_extrato.obter_cache_extratos", lambda: cache), \
+         patch.multiple(utils_extrato_functions, post_extrato_parser=post_extrato_parser,
+                        get_status_job_parser=get_status_job_parser,
+                        get_extrato_parser=lambda id, type_result="text": RespostaFalsa(200, {"text": id}),
+                        get_extrato_estruturado=get_extrato_estruturado):
+        yield
+
+
+def _medir_formatar(n: int, max_concorrencia_llm: int = 8, conteudo: bytes = b"%PDF") -> float:
+    arquivos = [BytesIO(conteudo) for _ in range(n)]
+    return _cronometrar(asyncio.run, formatar_extratos(arquivos, max_concorrencia_llm=max_concorrencia_llm))
+
+
+@benchmark
+def pipeline_concorrente(latencia_parser: float = 0.05, latencia_llm: float = 0.2) -> str:
+    """formatar_extratos com parser e LLM simulados: 8 arquivos devem levar pouco mais que 1."""
+
+    with _backends_simulados(latencia_parser, latencia_llm):
+        tempo_1 = _medir_formatar(1)
+        tempo_8 = _medir_formatar(8)
+        tempo_8_limitado = _medir_formatar(8, max_concorrencia_llm=2)
+    return (f"1 arquivo: {tempo_1:.3f}s | 8 arquivos: {tempo_8:.3f}s "
+            f"| 8 arquivos (LLM limitado a 2): {tempo_8_limitado:.3f}s")
+
+
+@benchmark
+def cache_reenvio(latencia_parser: float = 0.05, latencia_llm: float = 0.2) -> str:
+    """Reenvio do mesmo PDF: o resultado sai do cache sem passar pelo parser nem pela LLM."""
+
+    with _backends_simulados(latencia_parser, latencia_llm, cache=CacheMemoria()):
+        primeiro = _medir_formatar(1, conteudo=b"%PDF mesmo")
+        reenvio = _medir_formatar(1, conteudo=b"%PDF mesmo")
+    return f"primeiro envio: {primeiro * 1000:.0f} ms | reenvio: {reenvio * 1000:.2f} ms"
+
+
+class _ServidorKeepAlive(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        corpo = b'{"status": "SUCCESS"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@benchmark
+def pool_llama_cloud(chamadas: int = 200) -> str:
+    """Latência por chamada a um servidor local: requests.get avulso (conexão nova) vs. LlamaCloudClient."""
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _ServidorKeepAlive)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}/api/v1"
+    try:
+        sem_pool = _cronometrar(lambda: [requests.get(f"{url}/parsing/job/{i}") for i in range(chamadas)])
+        cliente = LlamaCloudClient("chave", base_url=url)
+        com_pool = _cronometrar(lambda: [cliente.get(f"/parsing/job/{i}") for i in range(chamadas)])
+        cliente.close()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+    return f"sem pool: {sem_pool / chamadas * 1000:.2f} ms/chamada | com pool: {com_pool / chamadas * 1000:.2f} ms/chamada"
+
+
+@benchmark
+def montagem_cadeia(chamadas: int = 50) -> str:
+    """Montar ChatOpenAI + structured output + prompt a cada chamada vs. reusar a cadeia do registro."""
+
+    # A cadeia só é montada (nenhuma chamada à OpenAI): qualquer chave serve.
+    with patch.dict(os.environ, {"OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "sk-benchmark"}):
+        limpar_cadeias()
+        try:
+            sem_registro = _cronometrar(lambda: [utils_extrato_functions._criar_cadeia_extrato() for _ in range(chamadas)])
+            obter_cadeia("extrato", utils_extrato_functions._criar_cadeia_extrato)
+            com_registro = _cronometrar(lambda: [obter_cadeia("extrato", utils_extrato_functions._criar_cadeia_extrato)
+                                                 for _ in range(chamadas)])
+        finally:
+            limpar_cadeias()
+    return (f"montar cadeia: {sem_registro / chamadas * 1000:.3f} ms/chamada "
+            f"| registro: {com_registro / chamadas * 1000:.4f} ms/chamada")
+
+
+@benchmark
+def banco_por_texto(chamadas: int = 1000) -> str:
+    """identificar_banco_por_texto num extrato de 300 linhas (o fallback por imagens leva segundos)."""
+
+    texto = "Itaú Unibanco S.A. - Extrato Conta Corrente\nAgência 1234 Conta 56789-0\n" + "\n".join(
+        f"{d % 28 + 1:02d}/10/2025 COMPRA LOJA -{d},00" for d in range(300))
+    duracao = _cronometrar(lambda: [identificar_banco_por_texto(texto) for _ in range(chamadas)])
+    return f"{duracao / chamadas * 1e6:.1f} µs/chamada"
+
+
+@benchmark
+def map_reduce_trechos(paginas: int = 20, caracteres_por_segundo: float = 50_000) -> str:
+    """Extrato longo numa chamada à LLM vs. em trechos paralelos; a latência simulada cresce com o texto."""
+
+    def responder(resposta):
+        def chamar(entrada):
+            time.sleep(len(entrada["extrato"]) / caracteres_por_segundo)
+            return resposta()
+        return RunnableLambda(chamar)
+
+    def extrato():
+        return Extrato(banco=BancoCandidato(banco=Banco.ITAU, score=0.9), extrato=[], data=date(2025, 10, 1))
+
+    texto = utils_extrato_functions.SEPARADOR_PAGINA.join(
+        "\n".join(f"{i % 28 + 1:02d}/10/2025 COMPRA LOJA {p}-{i} -{i},50" for i in range(40)) for p in range(paginas))
+    limpar_cadeias()
+    try:
+        with patch.object(utils_classificador, "EXTRATO_PRECLASSIFICADOR", False), \
+             patch.multiple(utils_extrato_functions, _criar_cadeia_extrato=lambda: responder(extrato),
+                            _criar_cadeia_transferencias=lambda: responder(lambda: ListaTransferencias(extrato=[]))):
+            with patch.object(utils_extrato_functions, "EXTRATO_MAP_REDUCE", False):
+                inteiro = _cronometrar(utils_extrato_functions.get_extrato_estruturado, texto)
+            em_trechos = _cronometrar(utils_extrato_functions.get_extrato_estruturado, texto)
+    finally:
+        limpar_cadeias()
+    trechos = len(utils_extrato_functions.dividir_texto(texto, utils_extrato_functions.EXTRATO_CHUNK_CHARS))
+    return (f"{len(texto)} caracteres | uma chamada: {inteiro:.3f}s | {trechos} trechos "
+            f"(paralelismo {utils_extrato_functions.EXTRATO_CHUNK_PARALELISMO}): {em_trechos:.3f}s")
+
+
+# Descrições que o pré-classificador resolve sozinho e outras que ficam para a LLM.
+_DESCRICOES_INEQUIVOCAS = ["PIX ENVIADO UBER DO BRASIL", "COMPRA CARTAO DROGARIA SAO PAULO", "BOLETO ALUGUEL IMOBILIARIA", "PIX NETFLIX"]
+_DESCRICOES_AMBIGUAS = ["PIX RECEBIDO MARIA SILVA", "COMPRA LOJA 123", "SALDO DO DIA"]
+
+
+@benchmark
+def preclassificador(linhas: int = 5000) -> str:
+    """Extrato sintético classificado localmente: tempo e redução do texto enviado à LLM."""
+
+    rng = random.Random(42)
+    texto = "\n".join(["BANCO ITAU S.A. - EXTRATO DE CONTA CORRENTE"] + [
+        f"{rng.randint(1, 28):02d}/10/2025 {rng.choice(_DESCRICOES_INEQUIVOCAS * 3 + _DESCRICOES_AMBIGUAS)} "
+        f"-{rng.randint(1, 5000)},{rng.randint(0, 99):02d}"
+        for _ in range(linhas)
+    ])
+    inicio = time.perf_counter()
+    pre = preclassificar(texto)
+    duracao = time.perf_counter() - inicio
+    reducao = 1 - len(pre.texto_residual) / len(texto)
+    return (f"{pre.linhas_total} linhas em {duracao * 1000:.1f} ms | resolvidas localmente: {pre.linhas_resolvidas} "
+            f"| caracteres para a LLM: {len(texto)} -> {len(pre.texto_residual)} (-{reducao:.0%})")
+
+
+@benchmark
+def analise_agregada(meses: int = 24, transferencias_por_mes: int = 500) -> str:
+    """Totais por categoria e mês: paginar GET /faturas com os extratos vs. pipeline de agregação (e cache)."""
+
+    with _banco() as db, patch.object(utils_analise, "cache_analise", utils_analise.CacheAnalise()):
+        usuario = semear(db, Cenario(usuarios=1, meses=meses, extratos_por_mes=2,
+                                     transferencias_por_extrato=transferencias_por_mes // 2))[0]
+
+        inicio = time.perf_counter()
+        bytes_cliente, cursor = 0, None
+        while True:
+            args = {"limit": "20", "incluir_extratos": "true", **({"cursor": cursor} if cursor else {})}
+            pagina, cursor = listar_faturas(db[COLLECTION_FATURAS], usuario["id"], args)
+            bytes_cliente += len(json.dumps(pagina, default=str))
+            if cursor is None:
+                break
+        tempo_cliente = time.perf_counter() - inicio
+
+        repositorio = RepositorioEmbutido(db[COLLECTION_FATURAS])
+        parametros = utils_analise.parametros_analise({"agrupar_por": "categoria", "periodo": "mes"})
+
+        def analisar():
+            return utils_analise.analisar(db[COLLECTION_USERS], repositorio, ObjectId(usuario["id"]), parametros)
+
+        inicio = time.perf_counter()
+        resultado, _ = analisar()
+        tempo_pipeline = time.perf_counter() - inicio
+        tempo_cache = _cronometrar(analisar)
+    return (f"paginando as faturas: {tempo_cliente * 1000:.0f} ms, {bytes_cliente / 1024:.0f} KiB | "
+            f"agregação: {tempo_pipeline * 1000:.0f} ms, {len(json.dumps(resultado)) / 1024:.1f} KiB "
+            f"| cache: {tempo_cache * 1000:.2f} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro", description="Microbenchmarks das etapas do pipeline.")
+    parser.add_argument("nomes", nargs="*", metavar="nome", help=f"padrão: todos ({', '.join(BENCHMARKS)})")
+    parser.add_argument("--mongo-uri", help="mongod local para os benchmarks com banco; sem ele, usa o mongomock")
+    parser.add_argument("--verboso", action="store_true", help="mostra os logs da aplicação durante as medidas")
+    args = parser.parse_args(argv)
+
+    global _mongo_uri
+    _mongo_uri = args.mongo_uri
+    desconhecidos = [nome for nome in args.nomes if nome not in BENCHMARKS]
+    if desconhecidos:
+        parser.error(f"benchmark desconhecido: {', '.join(desconhecidos)} (use {', '.join(BENCHMARKS)})")
+
+    for nome in args.nomes or BENCHMARKS:
+        if args.verboso:
+            linha = BENCHMARKS[nome]()
+        else:
+            with redirect_stdout(io.StringIO()):
+                linha = BENCHMARKS[nome]()
+        print(f"{nome}: {linha}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
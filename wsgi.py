@@ -1,4 +1,4 @@
-from flask import Flask
+from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 import os
@@ -6,8 +6,11 @@ from dotenv import load_dotenv
 
 load_dotenv() 
 
-from app.routes import register_routes_user, register_routes_invoices
+from app.routes import register_routes_user, register_routes_invoices, register_routes_metrics
 from app.auth_routes import register_routes_auth 
+from app.cli import INDICES_NA_INICIALIZACAO, inicializar_indices, register_cli_commands
+from app.controller.utils_perfil import PERFIL_HABILITADO, instalar_perfil
+from app.controller.utils_upload import UPLOAD_MAX_BYTES_REQUISICAO
 from _db import get_db
 
 app = Flask(__name__)
@@ -31,10 +34,32 @@ app.config["JWT_ACCESS_COOKIE_NAME"] = "access_token"
 app.config["JWT_REFRESH_COOKIE_NAME"] = "refresh_token"
 jwt = JWTManager(app)
 
+# LIMITE DO UPLOAD: acima dele o corpo nem é lido e a resposta é 413
+app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES_REQUISICAO
+
+
+@app.errorhandler(413)
+def requisicao_grande_demais(e):
+    return jsonify({
+        "success": False,
+        "message": f"Requisição maior que o limite de {UPLOAD_MAX_BYTES_REQUISICAO} bytes"
+    }), 413
+
+
+# PERFIL DAS REQUISIÇÕES (antes da primeira conexão com o MongoDB)
+if PERFIL_HABILITADO:
+    instalar_perfil(app)
+
 # REGISTRO DAS ROTAS
 register_routes_auth(app)     
 register_routes_user(app)      
 register_routes_invoices(app) 
+register_routes_metrics(app)
+register_cli_commands(app)
+
+# ÍNDICES DO MONGODB (uma vez por processo, nunca por requisição)
+if INDICES_NA_INICIALIZACAO:
+    inicializar_indices()
 
 if __name__ == "__main__":
     print("Iniciando Flask app...")